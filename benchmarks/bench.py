@@ -8,28 +8,31 @@ class BGENSuite:
     timeout = 10 * 60.0
 
     def __init__(self):
-        self._filepath = cbgen.example.get("merged_487400x220000.bgen")
+        self._filepath = Path("synthetic.bgen")
         self._mfilepath = Path("metafile")
+
+    def setup_cache(self):
+        cbgen.synthetic.make_bgen(self._filepath, 5000, 20000)
         with cbgen.bgen_file(self._filepath) as bgen:
             bgen.create_metafile(self._mfilepath, verbose=False)
 
-    def setup(self):
+    def setup(self, *_):
         pass
 
-    def time_bgen_file(self):
+    def time_bgen_file(self, _):
         with cbgen.bgen_file(self._filepath):
             pass
 
-    def time_create_metafile(self):
+    def time_create_metafile(self, _):
         with tempfile.TemporaryDirectory() as tmpdir:
             with cbgen.bgen_file(self._filepath) as bgen:
                 bgen.create_metafile(Path(tmpdir) / "metafile", verbose=False)
 
-    def time_bgen_metafile(self):
+    def time_bgen_metafile(self, _):
         with cbgen.bgen_metafile(self._mfilepath):
             pass
 
-    def time_read_partitions(self):
+    def time_read_partitions(self, _):
         with cbgen.bgen_metafile(self._mfilepath) as mf:
             for i in range(mf.npartitions):
                 mf.read_partition(i)
@@ -0,0 +1,177 @@
+from itertools import product
+from typing import Optional
+
+from numpy.random import default_rng
+
+import cbgen
+
+NVARIANTS = 500
+NSAMPLES = 1000
+COMPRESSIONS = [None, "zlib", "zstd"]
+INFLATERS = ["zlib", "libdeflate"]
+PHASED = [False, True]
+PLOIDIES = [1, 2, 4]
+PRECISIONS = [32, 64]
+
+
+def _filename(
+    compression: Optional[str], phased: bool, ploidy: int, layout: int = 2
+) -> str:
+    phasing = "phased" if phased else "unphased"
+    name = f"{compression or 'none'}_{phasing}_{ploidy}.bgen"
+    return name if layout == 2 else f"layout1_{name}"
+
+
+def _setup_cache():
+    for compression, phased, ploidy in product(COMPRESSIONS, PHASED, PLOIDIES):
+        cbgen.synthetic.make_bgen(
+            _filename(compression, phased, ploidy),
+            NSAMPLES,
+            NVARIANTS,
+            compression=compression,
+            ploidy=ploidy,
+            phased=phased,
+            missing=0.01,
+        )
+    for compression in [None, "zlib"]:
+        cbgen.synthetic.make_bgen(
+            _filename(compression, False, 2, 1),
+            NSAMPLES,
+            NVARIANTS,
+            layout=1,
+            compression=compression,
+            missing=0.01,
+        )
+
+
+def _read_offsets(filepath: str):
+    with cbgen.bgen_metafile(f"{filepath}.metafile") as mf:
+        return mf.read_offsets()
+
+
+class GenotypeSuite:
+    """
+    Decoding of every variant of synthetic files, in file order.
+    """
+
+    params = (COMPRESSIONS, PHASED, PLOIDIES, PRECISIONS)
+    param_names = ["compression", "phased", "ploidy", "precision"]
+    timeout = 10 * 60.0
+
+    def setup_cache(self):
+        _setup_cache()
+
+    def setup(self, _, compression, phased, ploidy, precision):
+        filepath = _filename(compression, phased, ploidy)
+        self._offsets = _read_offsets(filepath).tolist()
+        self._precision = precision
+        self._bgen = cbgen.bgen_file(filepath)
+
+    def teardown(self, *_):
+        self._bgen.close()
+
+    def time_read_genotype(self, *_):
+        for offset in self._offsets:
+            self._bgen.read_genotype(offset, self._precision)
+
+    def time_read_probability(self, *_):
+        for offset in self._offsets:
+            self._bgen.read_probability(offset, self._precision)
+
+
+class LayoutSuite:
+    """
+    Decoding of unphased diploid variants stored in layout 1 or layout 2.
+    """
+
+    params = ([1, 2], [None, "zlib"], PRECISIONS)
+    param_names = ["layout", "compression", "precision"]
+    timeout = 10 * 60.0
+
+    def setup_cache(self):
+        _setup_cache()
+
+    def setup(self, _, layout, compression, precision):
+        filepath = _filename(compression, False, 2, layout)
+        self._offsets = _read_offsets(filepath)
+        self._precision = precision
+        self._bgen = cbgen.bgen_file(filepath)
+
+    def teardown(self, *_):
+        self._bgen.close()
+
+    def time_read_genotype(self, *_):
+        for offset in self._offsets.tolist():
+            self._bgen.read_genotype(offset, self._precision)
+
+    def time_read_dosage(self, *_):
+        self._bgen.read_dosage(self._offsets, precision=self._precision)
+
+
+class AccessSuite:
+    """
+    Decoding of diploid unphased variants in file order or in random order.
+    """
+
+    params = (["sequential", "random"], PRECISIONS)
+    param_names = ["access", "precision"]
+    timeout = 10 * 60.0
+
+    def setup_cache(self):
+        _setup_cache()
+
+    def setup(self, _, access, precision):
+        filepath = _filename("zstd", False, 2)
+        offsets = _read_offsets(filepath)
+        if access == "random":
+            offsets = default_rng(0).permutation(offsets)
+        self._offsets = offsets
+        self._samples = default_rng(0).choice(NSAMPLES, NSAMPLES // 10, replace=False)
+        self._precision = precision
+        self._bgen = cbgen.bgen_file(filepath)
+
+    def teardown(self, *_):
+        self._bgen.close()
+
+    def time_read_genotype(self, *_):
+        for offset in self._offsets.tolist():
+            self._bgen.read_genotype(offset, self._precision)
+
+    def time_read_dosage(self, *_):
+        self._bgen.read_dosage(self._offsets, precision=self._precision)
+
+    def time_read_dosage_samples(self, *_):
+        self._bgen.read_dosage(self._offsets, self._samples, self._precision)
+
+
+class InflateSuite:
+    """
+    Decoding of zlib-compressed variants by each inflater cbgen was built with.
+    """
+
+    params = (INFLATERS, PLOIDIES)
+    param_names = ["inflater", "ploidy"]
+    timeout = 10 * 60.0
+
+    def setup_cache(self):
+        _setup_cache()
+
+    def setup(self, _, inflater, ploidy):
+        filepath = _filename("zlib", False, ploidy)
+        self._offsets = _read_offsets(filepath)
+        self._bgen = cbgen.bgen_file(filepath)
+        try:
+            self._bgen.set_inflater(inflater)
+        except ValueError:
+            self._bgen.close()
+            raise NotImplementedError()
+
+    def teardown(self, *_):
+        self._bgen.close()
+
+    def time_read_probability(self, *_):
+        for offset in self._offsets.tolist():
+            self._bgen.read_probability(offset)
+
+    def time_read_dosage(self, *_):
+        self._bgen.read_dosage(self._offsets)
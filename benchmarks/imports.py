@@ -0,0 +1,13 @@
+class ImportSuite:
+    """
+    Package import time, each in a fresh interpreter.
+    """
+
+    def timeraw_import_cbgen(self):
+        return "import cbgen"
+
+    def timeraw_import_bgen_file(self):
+        return "from cbgen import bgen_file, bgen_metafile"
+
+    def timeraw_import_example(self):
+        return "from cbgen import example"
@@ -79,6 +79,40 @@ def build_deps(pwd: Path, user: str, project: str, version: str):
     return list(extra_libs)
 
 
+def use_libdeflate(pwd: Path) -> bool:
+    """
+    Whether to inflate zlib blocks with libdeflate.
+
+    The ``BGEN_LIBDEFLATE`` environment variable set to ``1`` or ``0`` forces it
+    on or off. Otherwise, it is used if both its header and a library to link
+    against are found under the same prefix.
+    """
+    if "BGEN_LIBDEFLATE" in os.environ:
+        return os.environ["BGEN_LIBDEFLATE"] == "1"
+
+    import sysconfig
+
+    prefixes = [
+        pwd / ".ext_deps",
+        Path(sysconfig.get_config_var("prefix")),
+        Path("/usr"),
+        Path("/usr/local"),
+        Path("/opt/homebrew"),
+    ]
+    libdirs = ["lib", "lib64"]
+    if sysconfig.get_config_var("MULTIARCH"):
+        libdirs += [f"lib/{sysconfig.get_config_var('MULTIARCH')}"]
+    names = ["libdeflate.so", "libdeflate.dylib", "libdeflate.a", "deflate.lib"]
+
+    for prefix in prefixes:
+        if not (prefix / "include" / "libdeflate.h").exists():
+            continue
+        for libdir in libdirs:
+            if any((prefix / libdir / name).exists() for name in names):
+                return True
+    return False
+
+
 def compile_extension():
     from cffi import FFI
 
@@ -99,6 +133,18 @@ def compile_extension():
     with open(pwd / "cbgen" / "interface.h", "r") as f:
         ffibuilder.cdef(f.read())
 
+    with open(pwd / "cbgen" / "stats.h", "r") as f:
+        ffibuilder.cdef(f.read())
+
+    with open(pwd / "cbgen" / "stats.c", "r") as f:
+        stats_c = f.read()
+
+    with open(pwd / "cbgen" / "decoder.h", "r") as f:
+        ffibuilder.cdef(f.read())
+
+    with open(pwd / "cbgen" / "decoder.c", "r") as f:
+        decoder_c = f.read()
+
     with open(pwd / "cbgen" / "genotype.h", "r") as f:
         ffibuilder.cdef(f.read())
 
@@ -117,6 +163,17 @@ def compile_extension():
     with open(pwd / "cbgen" / "samples.c", "r") as f:
         samples_c = f.read()
 
+    with open(pwd / "cbgen" / "writer.h", "r") as f:
+        ffibuilder.cdef(f.read())
+
+    with open(pwd / "cbgen" / "writer.c", "r") as f:
+        writer_c = f.read()
+
+    define_macros = []
+    if use_libdeflate(pwd):
+        libs += ["deflate"]
+        define_macros += [("CBGEN_LIBDEFLATE", "1")]
+
     extra_link_args: List[str] = []
     if "BGEN_EXTRA_LINK_ARGS" in os.environ:
         extra_link_args += os.environ["BGEN_EXTRA_LINK_ARGS"].split(os.pathsep)
@@ -125,11 +182,16 @@ def compile_extension():
         "cbgen._ffi",
         rf"""
         #include "bgen/bgen.h"
+        #include <zstd.h>
+        {stats_c}
+        {decoder_c}
         {genotype_c}
         {partition_c}
         {samples_c}
+        {writer_c}
         """,
         libraries=libs,
+        define_macros=define_macros,
         extra_link_args=extra_link_args,
         language="c",
         library_dirs=[str(pwd / ".ext_deps" / "lib"), str(pwd / ".ext_deps" / "lib64")],
@@ -1,10 +1,9 @@
 from importlib import import_module as _import_module
 
-from . import example
+from . import typing
 from ._bgen_file import bgen_file
 from ._bgen_metafile import bgen_metafile
 from ._env import BGEN_CACHE_HOME
-from ._testit import test
 
 try:
     from ._ffi import ffi
@@ -26,9 +25,51 @@ except ModuleNotFoundError:
 __all__ = [
     "BGEN_CACHE_HOME",
     "__version__",
+    "bgen_dataset",
     "bgen_file",
     "bgen_metafile",
+    "bgen_writer",
+    "block_cache",
     "example",
+    "extract",
+    "grm",
+    "http_reader",
+    "ld_matrix",
+    "merge_metafiles",
+    "synthetic",
     "test",
     "typing",
 ]
+
+# Names loaded on first access, so that importing the package does not load
+# pooch, the writer, or the analysis helpers.
+_lazy = {
+    "bgen_dataset": "._bgen_dataset",
+    "bgen_writer": "._bgen_writer",
+    "block_cache": "._remote",
+    "example": None,
+    "extract": "._extract",
+    "grm": "._grm",
+    "http_reader": "._remote",
+    "ld_matrix": "._ld",
+    "merge_metafiles": "._merge",
+    "synthetic": None,
+    "test": "._testit",
+}
+
+
+def __getattr__(name: str):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    module = _lazy[name]
+    if module is None:
+        return _import_module(f".{name}", __name__)
+
+    value = getattr(_import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
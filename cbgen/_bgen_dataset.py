@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from numpy import (
+    argsort,
+    array_equal,
+    asarray,
+    concatenate,
+    cumsum,
+    empty,
+    flatnonzero,
+    float32,
+    float64,
+    int64,
+    searchsorted,
+    uint32,
+    unique,
+)
+
+from cbgen.typing import CategoricalArray, DtypeLike, Genotype
+
+from ._bgen_file import bgen_file
+from ._bgen_metafile import bgen_metafile
+
+__all__ = ["bgen_dataset"]
+
+
+class bgen_dataset:
+    """
+    Single view over BGEN files that share the same samples.
+
+    Variants of every file are numbered by a global index, in the order the
+    files are given, so that per-chromosome files can be read as one. Batched
+    reads are split by file and the files are read in parallel.
+
+    >>> import cbgen
+    >>>
+    >>> filepath = cbgen.example.get("haplotypes.bgen")
+    >>> with cbgen.bgen_dataset([filepath, filepath]) as ds:
+    ...     print(ds.nvariants)
+    ...     print(ds.locate([1, 5]))
+    ...     print(ds.region("1", 2, 4))
+    ...     print(ds.read_dosage([0, 4], [3]))
+    8
+    (array([0, 1]), array([165, 165], dtype=uint64))
+    [1 5 2 6]
+    [[2.]
+     [2.]]
+
+    Parameters
+    ----------
+    filepaths
+        BGEN file paths.
+    metafiles
+        Metafile file paths, one per BGEN file. Defaults to the metafiles given
+        by :meth:`cbgen.bgen_file.open_metafile`.
+    nthreads
+        Number of threads reading files in parallel. Defaults to the number of
+        files or of CPUs, whichever is smaller.
+
+    Raises
+    ------
+    ValueError
+        If no file is given, if the number of metafiles does not match, or if
+        the files do not have the same samples.
+    RuntimeError
+        If a file stream reading error occurs.
+    """
+
+    def __init__(
+        self,
+        filepaths: Sequence[Union[str, Path]],
+        metafiles: Optional[Sequence[Union[str, Path]]] = None,
+        nthreads: Optional[int] = None,
+    ):
+        self._files: List[bgen_file] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._regions: Optional[Dict[bytes, Tuple[DtypeLike, DtypeLike]]] = None
+
+        if len(filepaths) == 0:
+            raise ValueError("There should be at least one BGEN file.")
+        if metafiles is not None and len(metafiles) != len(filepaths):
+            raise ValueError("There should be one metafile per BGEN file.")
+
+        try:
+            self._open(filepaths, metafiles)
+        except Exception:
+            self.close()
+            raise
+
+        if nthreads is None:
+            nthreads = min(len(self._files), os.cpu_count() or 1)
+        self._nthreads = max(nthreads, 1)
+
+    def _open(
+        self,
+        filepaths: Sequence[Union[str, Path]],
+        metafiles: Optional[Sequence[Union[str, Path]]],
+    ):
+        self._metafiles: List[Path] = []
+        self._offsets: List[DtypeLike] = []
+        samples = None
+        for i, filepath in enumerate(filepaths):
+            bgen = bgen_file(filepath)
+            self._files.append(bgen)
+
+            if self._files[0].nsamples != bgen.nsamples:
+                raise ValueError(f"{filepath} does not have the same samples.")
+            if bgen.contain_samples:
+                names = bgen.read_samples(compact=True)
+                if samples is None:
+                    samples = names
+                elif not (
+                    array_equal(samples.offsets, names.offsets)
+                    and array_equal(samples.data, names.data)
+                ):
+                    raise ValueError(f"{filepath} does not have the same samples.")
+
+            if metafiles is None:
+                mf = bgen.open_metafile()
+            else:
+                mf = bgen_metafile(metafiles[i])
+            with mf:
+                self._metafiles.append(mf.filepath)
+                self._offsets.append(mf.read_offsets())
+
+        sizes = [len(o) for o in self._offsets]
+        self._starts = concatenate([[0], cumsum(sizes, dtype=int64)]).astype(int64)
+
+    @property
+    def filepaths(self) -> List[Path]:
+        """
+        BGEN file paths.
+        """
+        return [bgen.filepath for bgen in self._files]
+
+    @property
+    def files(self) -> List[bgen_file]:
+        """
+        BGEN files.
+        """
+        return list(self._files)
+
+    @property
+    def nfiles(self) -> int:
+        """
+        Number of BGEN files.
+        """
+        return len(self._files)
+
+    @property
+    def nsamples(self) -> int:
+        """
+        Number of samples.
+        """
+        return self._files[0].nsamples if self._files else 0
+
+    @property
+    def nvariants(self) -> int:
+        """
+        Number of variants of every file.
+        """
+        return int(self._starts[-1])
+
+    def locate(self, indices: Sequence[int]) -> Tuple[DtypeLike, DtypeLike]:
+        """
+        File and genotype offset of variants.
+
+        Parameters
+        ----------
+        indices
+            Global variant indices.
+
+        Returns
+        -------
+        File index and genotype offset of each variant.
+
+        Raises
+        ------
+        ValueError
+            If a variant index is out of range.
+        """
+        indices = self._check_indices(indices)
+        files = searchsorted(self._starts, indices, side="right") - 1
+        offsets = empty(indices.size, dtype=self._offsets[0].dtype)
+        for f in unique(files):
+            rows = flatnonzero(files == f)
+            offsets[rows] = self._offsets[f][indices[rows] - self._starts[f]]
+        return files, offsets
+
+    def region(
+        self, chromosome: Union[str, bytes], start: int = 0, stop: Optional[int] = None
+    ) -> DtypeLike:
+        """
+        Variants of a genomic region.
+
+        The chromosome and position of every variant are read from the
+        metafiles the first time a region is looked up.
+
+        Parameters
+        ----------
+        chromosome
+            Chromosome.
+        start
+            First position of the region. Defaults to ``0``.
+        stop
+            Position past the end of the region. Defaults to the end of the
+            chromosome.
+
+        Returns
+        -------
+        Global variant indices, in position order.
+        """
+        if isinstance(chromosome, str):
+            chromosome = chromosome.encode()
+
+        if self._regions is None:
+            self._regions = self._read_regions()
+
+        if chromosome not in self._regions:
+            return empty(0, dtype=int64)
+
+        position, indices = self._regions[chromosome]
+        first = searchsorted(position, start, side="left")
+        last = len(position) if stop is None else searchsorted(position, stop, "left")
+        return indices[first:last]
+
+    def read_genotype(self, index: int, precision: int = 64) -> Genotype:
+        """
+        Read genotype.
+
+        Parameters
+        ----------
+        index
+            Global variant index.
+        precision
+            Probability precision in bits: 64 (default) or 32.
+
+        Returns
+        -------
+        Genotype.
+
+        Raises
+        ------
+        ValueError
+            If the variant index is out of range.
+        RuntimeError
+            If a file stream reading error occurs.
+        """
+        files, offsets = self.locate([index])
+        return self._files[files[0]].read_genotype(int(offsets[0]), precision)
+
+    def read_dosage(
+        self,
+        indices: Sequence[int],
+        samples: Optional[Sequence[int]] = None,
+        precision: int = 64,
+    ) -> DtypeLike:
+        """
+        Read the dosage of the second allele of biallelic variants.
+
+        Variants are read in parallel across files, as
+        :meth:`cbgen.bgen_file.read_dosage` does for each file.
+
+        Parameters
+        ----------
+        indices
+            Global variant indices.
+        samples
+            Sample indices. Defaults to every sample.
+        precision
+            Dosage precision in bits: 64 (default) or 32.
+
+        Returns
+        -------
+        Variant-by-sample dosage matrix.
+
+        Raises
+        ------
+        ValueError
+            If a variant is not biallelic, or a variant or sample index is out
+            of range.
+        RuntimeError
+            If a file stream reading error occurs.
+        """
+        if precision not in [64, 32]:
+            raise ValueError("Precision should be either 64 or 32.")
+
+        files, offsets = self.locate(indices)
+        nsamples = self.nsamples if samples is None else len(samples)
+        if samples is not None:
+            samples = asarray(samples, dtype=uint32)
+
+        dtype = float64 if precision == 64 else float32
+        dosage = empty((offsets.size, nsamples), dtype=dtype)
+
+        def read(f: int):
+            rows = flatnonzero(files == f)
+            bgen = self._files[f]
+            dosage[rows] = bgen.read_dosage(offsets[rows], samples, precision)
+
+        groups = unique(files).tolist()
+        if len(groups) <= 1 or self._nthreads == 1:
+            for f in groups:
+                read(f)
+        else:
+            for future in [self._pool().submit(read, f) for f in groups]:
+                future.result()
+
+        return dosage
+
+    def close(self):
+        """
+        Close every file stream.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for bgen in self._files:
+            bgen.close()
+        self._files = []
+
+    def _check_indices(self, indices: Sequence[int]) -> DtypeLike:
+        indices = asarray(indices, dtype=int64).ravel()
+        if indices.size > 0 and (indices.min() < 0 or indices.max() >= self.nvariants):
+            raise ValueError("Variant index out of range.")
+        return indices
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self._nthreads)
+        return self._executor
+
+    def _read_regions(self) -> Dict[bytes, Tuple[DtypeLike, DtypeLike]]:
+        chromosomes = []
+        positions = []
+        for metafile in self._metafiles:
+            with bgen_metafile(metafile) as mf:
+                for i in range(mf.npartitions):
+                    variants = mf.read_partition(i, compact=True).variants
+                    chrom = variants.chromosome
+                    if isinstance(chrom, CategoricalArray):
+                        chromosomes.append(chrom.categories[chrom.codes])
+                    else:
+                        chromosomes.append(asarray(chrom))
+                    positions.append(variants.position)
+
+        if not chromosomes:
+            return {}
+
+        chromosome = concatenate(chromosomes)
+        position = concatenate(positions)
+        regions = {}
+        for c in unique(chromosome):
+            indices = flatnonzero(chromosome == c)
+            order = argsort(position[indices], kind="stable")
+            regions[bytes(c)] = (position[indices[order]], indices[order])
+        return regions
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self) -> bgen_dataset:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -1,17 +1,69 @@
 from __future__ import annotations
 
+import os
 from math import floor, sqrt
 from pathlib import Path
-from typing import Union
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union
+from zipfile import BadZipFile
 
-from numpy import empty, float32, float64, uint8, zeros
+from numpy import (
+    array,
+    ascontiguousarray,
+    broadcast_to,
+    empty,
+    float32,
+    float64,
+    int8,
+    int64,
+    isnan,
+    resize,
+    uint8,
+    uint16,
+    uint32,
+    uint64,
+    zeros,
+)
 
-from cbgen.typing import CData, DtypeLike, Genotype
+from cbgen.typing import (
+    CData,
+    DtypeLike,
+    Genotype,
+    RangeReader,
+    ReadStats,
+    SparseDosage,
+    StringArray,
+    Variants,
+)
 
+from ._bgen_metafile import bgen_metafile
+from ._cache import cache_filepath, file_lock, keyed_filepath, local_path
+from ._dosage_array import dosage_array
+from ._dosage_cache import DOSAGE_TILE, dosage_cache
 from ._ffi import ffi, lib
+from ._format import (
+    COMPRESSION_NONE,
+    VariantRecord,
+    read_header,
+    read_variant,
+    skip_genotype,
+)
+from ._metafile_writer import (
+    iter_records,
+    metafile_writer,
+    read_metafile_header,
+    record_offset,
+)
+from ._sample_index import sample_index
+from ._variant_index import variant_index
+
+if TYPE_CHECKING:
+    from ._remote import block_cache
 
 __all__ = ["bgen_file"]
 
+_INFLATERS = {"zlib": lib.INFLATER_ZLIB, "libdeflate": lib.INFLATER_LIBDEFLATE}
+
 
 class bgen_file:
     """
@@ -45,23 +97,54 @@ class bgen_file:
     ...     print(bgen.nvariants)
     4
 
+    Remote files, given by an HTTP or HTTPS URL or by a
+    :class:`cbgen.typing.RangeReader`, are read through a local
+    :class:`cbgen.block_cache`. Only the blocks holding the header and the
+    genotypes being read are fetched. Methods that scan every variant, such as
+    :meth:`read_variants` and :meth:`create_metafile`, fetch the whole file;
+    open the metafile of a remote file by its URL instead.
+
     Parameters
     ----------
     filepath
-        BGEN file path.
+        BGEN file path, URL, range reader, or block cache.
     """
 
-    def __init__(self, filepath: Union[str, Path]):
-        self._filepath = Path(filepath)
+    def __init__(self, filepath: Union[str, Path, RangeReader, block_cache]):
+        self._source = filepath
+        self._remote: Optional[block_cache] = None
         self._bgen_file: CData = ffi.NULL
+        self._decoder: CData = ffi.NULL
+        self._index: Optional[variant_index] = None
+        self._sample_index: Optional[sample_index] = None
+        self._dosage_cache: Optional[dosage_cache] = None
+        self._stats: CData = ffi.NULL
+        self._genotype_nbytes = 0
+        path = local_path(filepath)
+        if path is None:
+            from ._remote import open_remote
+
+            self._remote = open_remote(filepath)
+            self._filepath = self._remote.filepath
+            self._fetch_header()
+        else:
+            self._filepath = path
         self._bgen_file = lib.bgen_file_open(bytes(self._filepath))
         if self._bgen_file == ffi.NULL:
             raise RuntimeError(f"Failed to open {filepath}.")
 
+        with open(self._filepath, "rb") as stream:
+            header = read_header(stream)
+        self._decoder = lib.decoder_open(
+            bytes(self._filepath), header.nsamples, header.layout, header.compression
+        )
+        if self._decoder == ffi.NULL:
+            raise RuntimeError(f"Failed to open {filepath}.")
+
     @property
     def filepath(self) -> Path:
         """
-        File path.
+        File path, or file path of the local copy of a remote file.
 
         Returns
         -------
@@ -69,6 +152,17 @@ class bgen_file:
         """
         return self._filepath
 
+    @property
+    def source(self) -> Union[str, Path, RangeReader, block_cache]:
+        """
+        File path, URL, range reader, or block cache the file was opened from.
+
+        Returns
+        -------
+        Source given at construction.
+        """
+        return self._source
+
     @property
     def nvariants(self) -> int:
         """
@@ -102,10 +196,16 @@ class bgen_file:
         """
         return lib.bgen_file_contain_samples(self._bgen_file)
 
-    def read_samples(self) -> DtypeLike:
+    def read_samples(self, compact: bool = False) -> Union[DtypeLike, StringArray]:
         """
         Read samples.
 
+        Parameters
+        ----------
+        compact
+            ``True`` to return a :class:`cbgen.typing.StringArray`; ``False``
+            to return a fixed-width array (default).
+
         Returns
         -------
         Samples.
@@ -121,6 +221,15 @@ class bgen_file:
             raise RuntimeError("Could not fetch samples from the bgen file.")
 
         try:
+            if compact:
+                offsets = empty(nsamples + 1, dtype=uint64)
+                ptr = ffi.cast("uint64_t *", ffi.from_buffer(offsets))
+                lib.read_samples_offsets(bgen_samples, nsamples, ptr)
+                data = empty(int(offsets[-1]), dtype=uint8)
+                ptr = ffi.from_buffer("char[]", data)
+                lib.read_samples_strings(bgen_samples, nsamples, ptr)
+                return StringArray(offsets, data)
+
             samples_max_len = ffi.new("uint32_t[]", 1)
             lib.read_samples_part1(bgen_samples, nsamples, samples_max_len)
             samples = zeros(nsamples, dtype=f"S{samples_max_len[0]}")
@@ -135,19 +244,137 @@ class bgen_file:
 
         return samples
 
-    def create_metafile(self, filepath: Union[str, Path], verbose=False):
+    def sample_indices(self, names: Sequence[Union[str, bytes]]) -> DtypeLike:
+        """
+        Map sample names to sample indices.
+
+        The name-to-index map is built on first use and cached under
+        :data:`cbgen.BGEN_CACHE_HOME` next to the cached metafiles, so that
+        other processes load it instead of reading and sorting the samples
+        again.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     print(bgen.sample_indices(["sample_3", "sample_1"]))
+        [3 1]
+
+        Parameters
+        ----------
+        names
+            Sample names, as ``str`` or ``bytes``.
+
+        Returns
+        -------
+        Sample indices.
+
+        Raises
+        ------
+        ValueError
+            If a sample name is not found.
+        RuntimeError
+            If samples are not stored or a file stream reading error occurs.
+        """
+        if self._sample_index is None:
+            filepath = self._cache_filepath("samples")
+            try:
+                self._sample_index = sample_index.load(filepath)
+                self._count_cache(True)
+            except (OSError, EOFError, KeyError, ValueError, BadZipFile):
+                self._sample_index = sample_index(self.read_samples(compact=True))
+                self._sample_index.save(filepath, overwrite=filepath.exists())
+                self._count_cache(False)
+
+        return self._sample_index.indices(names)
+
+    def read_variants(self, start: int = 0, stop: Optional[int] = None) -> Variants:
+        """
+        Read variants without a metafile.
+
+        Variants are found by scanning the BGEN file. A sparse index of variant
+        positions is built along the way, so that subsequent reads resume from
+        the nearest checkpoint instead of from the start of the file.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     variants = bgen.read_variants(1, 3)
+        ...     print(variants.rsid)
+        [b'RS2' b'RS3']
+
+        Parameters
+        ----------
+        start
+            Index of the first variant. Defaults to ``0``.
+        stop
+            One past the index of the last variant. Defaults to the number of
+            variants.
+
+        Returns
+        -------
+        Variants.
+
+        Raises
+        ------
+        ValueError
+            If the variant range is invalid.
+        """
+        if stop is None:
+            stop = self.nvariants
+        return _variants(self._variant_index().read(start, stop))
+
+    def create_metafile(
+        self,
+        filepath: Union[str, Path],
+        verbose=False,
+        lazy=False,
+        columnar=False,
+    ):
         """
         Create metafile file.
 
+        A lazy metafile is not created up front. It is instead built as a
+        by-product of the first pass of :meth:`read_variants` through the file,
+        with progress persisted every few variants so that a later handle to
+        the same BGEN file can resume it.
+
+        A columnar metafile stores each partition as compressed columns, with
+        delta-encoded genotype offsets and positions and dictionary-encoded
+        chromosomes, and is several times smaller. It is read transparently by
+        :class:`cbgen.bgen_metafile`, but cannot be extended or merged.
+
         Parameters
         ----------
         filepath
             File path.
         verbose
             ``True`` to show progress; ``False`` otherwise (default).
+        lazy
+            ``True`` to build the metafile on the fly; ``False`` otherwise
+            (default).
+        columnar
+            ``True`` to write a columnar metafile; ``False`` otherwise
+            (default).
+
+        Raises
+        ------
+        ValueError
+            If both ``lazy`` and ``columnar`` are ``True``.
         """
+        if lazy and columnar:
+            raise ValueError("A columnar metafile cannot be built lazily.")
+
         n = estimate_best_npartitions(self.nvariants)
         filepath = Path(filepath)
+        self._fetch_all()
+
+        if lazy:
+            self._variant_index().attach_metafile(filepath, n)
+            return
+
+        target = filepath
+        if columnar:
+            filepath = filepath.with_name(f"{filepath.name}.{os.getpid()}.rows")
 
         mf = lib.bgen_metafile_create(self._bgen_file, bytes(filepath), n, verbose)
         if mf == ffi.NULL:
@@ -155,6 +382,133 @@ class bgen_file:
 
         lib.bgen_metafile_close(mf)
 
+        if columnar:
+            from ._columnar import write_columnar
+
+            try:
+                with bgen_metafile(filepath) as rows:
+                    write_columnar(target, rows)
+            finally:
+                filepath.unlink(missing_ok=True)
+
+    def open_metafile(
+        self,
+        filepath: Optional[Union[str, Path]] = None,
+        auto: bool = True,
+        verbose: bool = False,
+    ) -> bgen_metafile:
+        """
+        Open the metafile of this BGEN file.
+
+        By default, the metafile is cached under :data:`cbgen.BGEN_CACHE_HOME`
+        with a key derived from the BGEN file path, size, and modification
+        time. A missing metafile is created while holding a file lock, so that
+        concurrent processes wait for a single creator instead of racing to
+        write the same file. Readers never see a partially written metafile.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     with bgen.open_metafile() as mf:
+        ...         print(mf.nvariants)
+        4
+
+        Parameters
+        ----------
+        filepath
+            Metafile file path. Defaults to the cached metafile.
+        auto
+            ``True`` to create the metafile if it does not exist (default);
+            ``False`` otherwise.
+        verbose
+            ``True`` to show progress of metafile creation; ``False``
+            otherwise (default).
+
+        Returns
+        -------
+        Metafile.
+
+        Raises
+        ------
+        RuntimeError
+            If the metafile does not exist and ``auto`` is ``False``, or if a
+            file stream reading error occurs.
+        """
+        cached = filepath is None
+        if filepath is None:
+            filepath = self._cache_filepath("metafile")
+        filepath = Path(filepath)
+
+        if cached:
+            self._count_cache(filepath.exists())
+
+        if not filepath.exists():
+            if not auto:
+                raise RuntimeError(f"Metafile {filepath} does not exist.")
+
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(filepath.with_name(filepath.name + ".lock")):
+                if not filepath.exists():
+                    tmp = filepath.with_name(f"{filepath.name}.{os.getpid()}.tmp")
+                    try:
+                        self.create_metafile(tmp, verbose)
+                        os.replace(tmp, filepath)
+                    finally:
+                        tmp.unlink(missing_ok=True)
+
+        return bgen_metafile(filepath)
+
+    def extend_metafile(self, filepath: Union[str, Path]):
+        """
+        Extend a metafile with variants appended to the BGEN file.
+
+        The metafile must have been created for a BGEN file whose variants are
+        the leading variants of this one, as happens when a BGEN file is
+        regenerated with extra variants appended. Only the variants after the
+        last one found in the metafile are scanned.
+
+        Parameters
+        ----------
+        filepath
+            Metafile file path.
+
+        Raises
+        ------
+        ValueError
+            If the metafile has more variants than the BGEN file.
+        RuntimeError
+            If a file stream reading error occurs.
+        """
+        filepath = Path(filepath)
+        self._fetch_all()
+        writer = metafile_writer(filepath)
+
+        try:
+            last = None
+            with open(filepath, "rb") as f:
+                nvariants, _ = read_metafile_header(f)
+                for rec in iter_records(f, nvariants):
+                    writer.write_raw(rec)
+                    last = rec
+
+            if nvariants > self.nvariants:
+                msg = f"Metafile {filepath} has more variants than {self._filepath}."
+                raise ValueError(msg)
+
+            with open(self._filepath, "rb") as stream:
+                header = read_header(stream)
+                if last is not None:
+                    stream.seek(record_offset(last))
+                    skip_genotype(stream, header)
+                for _ in range(nvariants, header.nvariants):
+                    writer.write(read_variant(stream, header))
+                    skip_genotype(stream, header)
+        except Exception:
+            writer.abort()
+            raise
+
+        writer.close(estimate_best_npartitions(self.nvariants))
+
     def read_genotype(self, offset: int, precision: int = 64) -> Genotype:
         """
         Read genotype.
@@ -168,45 +522,61 @@ class bgen_file:
 
         Returns
         -------
-        Genotype.
+        Genotype. Its ploidy is a read-only broadcast array if every sample has
+        the same ploidy, and so is its missingness if no genotype is missing.
 
         Raises
         ------
         RuntimeError
             If invalid offset of or a file stream reading error occurs.
         """
-        gt: CData = lib.bgen_file_open_genotype(self._bgen_file, offset)
-        if gt == ffi.NULL:
+        self._fetch_genotypes([offset])
+        decoder = self._decoder
+        if not lib.decoder_read_block(decoder, offset, self._stats):
             raise RuntimeError(f"Could not open genotype (offset {offset}).")
 
         if precision not in [64, 32]:
             raise ValueError("Precision should be either 64 or 32.")
 
         nsamples = self.nsamples
-        ncombs = lib.bgen_genotype_ncombs(gt)
+        ncombs = lib.decoder_ncombs(decoder)
         err: int = 0
         if precision == 64:
             probs = empty((nsamples, ncombs), dtype=float64)
-            err = lib.bgen_genotype_read64(gt, ffi.cast("double *", probs.ctypes.data))
+            ptr = ffi.cast("double *", probs.ctypes.data)
+            err = lib.decoder_read64(decoder, ptr, self._stats)
         else:
             probs = empty((nsamples, ncombs), dtype=float32)
-            err = lib.bgen_genotype_read32(gt, ffi.cast("float *", probs.ctypes.data))
+            ptr = ffi.cast("float *", probs.ctypes.data)
+            err = lib.decoder_read32(decoder, ptr, self._stats)
 
         if err != 0:
             msg = f"Could not read genotype probabilities (offset {offset})."
             raise RuntimeError(msg)
 
-        phased = lib.bgen_genotype_phased(gt)
+        start = perf_counter_ns()
+        phased = lib.decoder_phased(decoder)
 
-        ploidy = empty(nsamples, dtype=uint8)
-        lib.read_ploidy(gt, ffi.cast("uint8_t *", ploidy.ctypes.data), nsamples)
+        min_ploidy = lib.decoder_min_ploidy(decoder)
+        if min_ploidy == lib.decoder_max_ploidy(decoder):
+            ploidy = broadcast_to(uint8(min_ploidy), (nsamples,))
+        else:
+            ploidy = empty(nsamples, dtype=uint8)
+            lib.decoder_read_ploidy(decoder, ffi.cast("uint8_t *", ploidy.ctypes.data))
 
-        missing = empty(nsamples, dtype=bool)
-        lib.read_missing(gt, ffi.cast("bool *", missing.ctypes.data), nsamples)
+        # The probabilities of missing genotypes are NaN.
+        missing = isnan(probs[:, 0])
+        has_missing = bool(missing.any())
+        if not has_missing:
+            missing = broadcast_to(False, (nsamples,))
 
-        lib.bgen_genotype_close(gt)
+        if self._stats != ffi.NULL:
+            self._stats.convert_ns += perf_counter_ns() - start
+            self._stats.alloc_bytes += sum(
+                a.nbytes for a in (probs, ploidy, missing) if a.flags.owndata
+            )
 
-        return Genotype(probs, phased, ploidy, missing)
+        return Genotype(probs, phased, ploidy, missing, has_missing)
 
     def read_probability(self, offset: int, precision: int = 64) -> DtypeLike:
         """
@@ -228,38 +598,851 @@ class bgen_file:
         RuntimeError
             If invalid offset of or a file stream reading error occurs.
         """
-        gt: CData = lib.bgen_file_open_genotype(self._bgen_file, offset)
-        if gt == ffi.NULL:
+        self._fetch_genotypes([offset])
+        decoder = self._decoder
+        if not lib.decoder_read_block(decoder, offset, self._stats):
             raise RuntimeError(f"Could not open genotype (offset {offset}).")
 
         if precision not in [64, 32]:
             raise ValueError("Precision should be either 64 or 32.")
 
         nsamples = self.nsamples
-        ncombs = lib.bgen_genotype_ncombs(gt)
+        ncombs = lib.decoder_ncombs(decoder)
         err: int = 0
         if precision == 64:
             probs = empty((nsamples, ncombs), dtype=float64)
-            err = lib.bgen_genotype_read64(gt, ffi.cast("double *", probs.ctypes.data))
+            ptr = ffi.cast("double *", probs.ctypes.data)
+            err = lib.decoder_read64(decoder, ptr, self._stats)
         else:
             probs = empty((nsamples, ncombs), dtype=float32)
-            err = lib.bgen_genotype_read32(gt, ffi.cast("float *", probs.ctypes.data))
+            ptr = ffi.cast("float *", probs.ctypes.data)
+            err = lib.decoder_read32(decoder, ptr, self._stats)
 
         if err != 0:
             msg = f"Could not read genotype probabilities (offset {offset})."
             raise RuntimeError(msg)
 
-        lib.bgen_genotype_close(gt)
+        if self._stats != ffi.NULL:
+            self._stats.alloc_bytes += probs.nbytes
 
         return probs
 
+    def read_dosage(
+        self,
+        offsets: Sequence[int],
+        samples: Optional[Sequence[int]] = None,
+        precision: int = 64,
+        standardize: bool = False,
+        layout: str = "variant",
+    ) -> DtypeLike:
+        """
+        Read the dosage of the second allele of biallelic variants.
+
+        The dosage of a sample is the expected number of copies of the second
+        allele, computed from its genotype probabilities. Missing genotypes
+        have a dosage of NaN.
+
+        Standardised dosages have their missing genotypes imputed by the mean
+        dosage of the variant over the selected samples, and are then centred
+        and scaled to unit norm, so that the dot product of two standardised
+        variants is their correlation. Variants without variance have NaN
+        standardised dosages.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     with bgen.open_metafile() as mf:
+        ...         offsets = mf.read_partition(0).variants.offset
+        ...     print(bgen.read_dosage(offsets[:2], [0, 3]))
+        [[0. 2.]
+         [1. 0.]]
+
+        Parameters
+        ----------
+        offsets
+            Variant offsets.
+        samples
+            Sample indices. Defaults to every sample.
+        precision
+            Dosage precision in bits: 64 (default) or 32.
+        standardize
+            ``True`` to standardise the dosages of each variant. Defaults to
+            ``False``.
+        layout
+            Memory layout of the matrix: ``"variant"`` (default) to store it
+            variant by variant (C order), or ``"sample"`` to store it sample by
+            sample (Fortran order), so that its transpose is C-contiguous.
+
+        Returns
+        -------
+        Variant-by-sample dosage matrix.
+
+        Raises
+        ------
+        ValueError
+            If a variant is not biallelic or a sample index is out of range.
+        RuntimeError
+            If invalid offset of or a file stream reading error occurs.
+        """
+        if precision not in [64, 32]:
+            raise ValueError("Precision should be either 64 or 32.")
+
+        if layout not in ["variant", "sample"]:
+            raise ValueError("Layout should be either variant or sample.")
+
+        offsets = ascontiguousarray(offsets, dtype=uint64)
+        self._fetch_genotypes(offsets)
+        nsamples = self.nsamples
+        samples_ptr = ffi.NULL
+        if samples is not None:
+            samples = ascontiguousarray(samples, dtype=uint32)
+            if samples.size > 0 and samples.max() >= nsamples:
+                raise ValueError("Sample index out of range.")
+            nsamples = samples.size
+            samples_ptr = ffi.cast("uint32_t *", ffi.from_buffer(samples))
+
+        noffsets = offsets.size
+        offsets_ptr = ffi.cast("uint64_t *", ffi.from_buffer(offsets))
+        err = ffi.new("int *")
+        order = "C" if layout == "variant" else "F"
+        if precision == 64:
+            dosage = empty((noffsets, nsamples), dtype=float64, order=order)
+            ptr = ffi.cast("double *", dosage.ctypes.data)
+            read = lib.read_dosage64
+        else:
+            dosage = empty((noffsets, nsamples), dtype=float32, order=order)
+            ptr = ffi.cast("float *", dosage.ctypes.data)
+            read = lib.read_dosage32
+
+        i = read(
+            self._decoder,
+            offsets_ptr,
+            noffsets,
+            samples_ptr,
+            nsamples,
+            ptr,
+            *_element_strides(dosage),
+            standardize,
+            self._stats,
+            err,
+        )
+        if i < noffsets:
+            _raise_dosage_error(int(offsets[i]), err[0])
+
+        if self._stats != ffi.NULL:
+            self._stats.alloc_bytes += dosage.nbytes
+
+        return dosage
+
+    def read_probabilities(
+        self, offsets: Sequence[int], precision: int = 64, layout: str = "variant"
+    ) -> DtypeLike:
+        """
+        Read the genotype probabilities of variants.
+
+        Every variant must have the same number of genotype combinations, as
+        biallelic variants of the same ploidy and phasing do. Probabilities are
+        written by the decoder straight into the requested memory layout, so
+        that no transpose or copy is needed afterwards.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     with bgen.open_metafile() as mf:
+        ...         offsets = mf.read_offsets()
+        ...     probs = bgen.read_probabilities(offsets[:2], layout="planes")
+        >>> print(probs.shape)
+        (2, 4, 4)
+        >>> print(probs[..., 1])
+        [[0. 1. 0. 1.]
+         [1. 0. 1. 0.]]
+        >>> print(probs[..., 1].flags.c_contiguous)
+        True
+
+        Parameters
+        ----------
+        offsets
+            Variant offsets.
+        precision
+            Probability precision in bits: 64 (default) or 32.
+        layout
+            Memory layout of the probabilities: ``"variant"`` (default) to
+            store them variant by variant (C order), ``"sample"`` to store them
+            sample by sample, so that ``probs.transpose(1, 0, 2)`` is
+            C-contiguous, or ``"planes"`` to store one variant-by-sample plane
+            per combination, so that ``probs[..., k]`` is C-contiguous.
+
+        Returns
+        -------
+        Variant-by-sample-by-combination probabilities.
+
+        Raises
+        ------
+        ValueError
+            If the variants do not have the same number of combinations.
+        RuntimeError
+            If invalid offset of or a file stream reading error occurs.
+        """
+        if precision not in [64, 32]:
+            raise ValueError("Precision should be either 64 or 32.")
+
+        if layout not in ["variant", "sample", "planes"]:
+            raise ValueError("Layout should be either variant, sample, or planes.")
+
+        offsets = ascontiguousarray(offsets, dtype=uint64)
+        self._fetch_genotypes(offsets)
+        noffsets = offsets.size
+        nsamples = self.nsamples
+        ncombs = 0
+        if noffsets > 0:
+            if not lib.decoder_read_block(self._decoder, offsets[0], self._stats):
+                raise RuntimeError(f"Could not open genotype (offset {offsets[0]}).")
+            ncombs = lib.decoder_ncombs(self._decoder)
+
+        dtype = float64 if precision == 64 else float32
+        if layout == "variant":
+            probs = empty((noffsets, nsamples, ncombs), dtype=dtype)
+        elif layout == "sample":
+            probs = empty((nsamples, noffsets, ncombs), dtype=dtype)
+            probs = probs.transpose(1, 0, 2)
+        else:
+            probs = empty((ncombs, noffsets, nsamples), dtype=dtype)
+            probs = probs.transpose(1, 2, 0)
+
+        if precision == 64:
+            ptr = ffi.cast("double *", probs.ctypes.data)
+            read = lib.read_probability64
+        else:
+            ptr = ffi.cast("float *", probs.ctypes.data)
+            read = lib.read_probability32
+
+        offsets_ptr = ffi.cast("uint64_t *", ffi.from_buffer(offsets))
+        err = ffi.new("int *")
+        i = read(
+            self._decoder,
+            offsets_ptr,
+            noffsets,
+            ncombs,
+            ptr,
+            *_element_strides(probs),
+            self._stats,
+            err,
+        )
+        if i < noffsets:
+            offset = int(offsets[i])
+            if err[0] == 3:
+                msg = (
+                    f"Variant has a different number of combinations (offset {offset})."
+                )
+                raise ValueError(msg)
+            _raise_dosage_error(offset, err[0])
+
+        if self._stats != ffi.NULL:
+            self._stats.alloc_bytes += probs.nbytes
+
+        return probs
+
+    def read_haplotypes(
+        self, offsets: Sequence[int], ploidy: int = 2, threshold: float = 0.9
+    ) -> DtypeLike:
+        """
+        Read the alleles of each haplotype of phased biallelic variants.
+
+        The allele of a haplotype is ``0`` or ``1`` if the probability of the
+        first or second allele is at least the threshold, and ``-1`` if neither
+        is, if the genotype is missing, or if the sample has less than
+        ``ploidy`` haplotypes. Alleles are called while decoding, so that a
+        single byte is returned per haplotype instead of a probability per
+        allele.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     with bgen.open_metafile() as mf:
+        ...         offsets = mf.read_offsets()
+        ...     print(bgen.read_haplotypes(offsets[:2]))
+        [[0 0 1 0 0 1 1 1]
+         [1 0 0 1 1 1 0 0]]
+
+        Parameters
+        ----------
+        offsets
+            Variant offsets.
+        ploidy
+            Number of haplotypes per sample. Defaults to ``2``.
+        threshold
+            Minimum probability of a called allele, above ``0.5``. Defaults to
+            ``0.9``.
+
+        Returns
+        -------
+        Alleles, with shape (variants, samples × ploidy), the haplotypes of a
+        sample being consecutive.
+
+        Raises
+        ------
+        ValueError
+            If a variant is not phased, is not biallelic, or has a sample with
+            more than ``ploidy`` haplotypes.
+        RuntimeError
+            If invalid offset of or a file stream reading error occurs.
+        """
+        if not (1 <= ploidy <= 63):
+            raise ValueError("Ploidy should be between 1 and 63.")
+
+        if not (0.5 < threshold <= 1):
+            raise ValueError("Threshold should be above 0.5 and at most 1.")
+
+        offsets = ascontiguousarray(offsets, dtype=uint64)
+        self._fetch_genotypes(offsets)
+        noffsets = offsets.size
+        alleles = empty((noffsets, self.nsamples * ploidy), dtype=int8)
+        err = ffi.new("int *")
+        i = lib.read_haplotypes(
+            self._decoder,
+            ffi.cast("uint64_t *", ffi.from_buffer(offsets)),
+            noffsets,
+            ploidy,
+            threshold,
+            ffi.cast("int8_t *", ffi.from_buffer(alleles)),
+            self._stats,
+            err,
+        )
+        if i < noffsets:
+            offset = int(offsets[i])
+            if err[0] == 5:
+                raise ValueError(f"Variant is not phased (offset {offset}).")
+            if err[0] == 6:
+                msg = f"Variant has more than {ploidy} haplotypes (offset {offset})."
+                raise ValueError(msg)
+            _raise_dosage_error(offset, err[0])
+
+        if self._stats != ffi.NULL:
+            self._stats.alloc_bytes += alleles.nbytes
+
+        return alleles
+
+    def read_sparse_dosage(
+        self, offsets: Sequence[int], threshold: float = 0.0
+    ) -> SparseDosage:
+        """
+        Read the dosage of the second allele of biallelic variants, sparsely.
+
+        Only dosages above the threshold are stored, together with missing
+        ones as NaN. For rare variants, where nearly every sample is
+        homozygous for the first allele, this avoids building the dense
+        variant-by-sample matrix.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     with bgen.open_metafile() as mf:
+        ...         offsets = mf.read_offsets()
+        ...     dosage = bgen.read_sparse_dosage(offsets, threshold=1.5)
+        >>> print(dosage.indptr)
+        [0 1 2 3 4]
+        >>> print(dosage.indices)
+        [3 2 1 0]
+
+        Parameters
+        ----------
+        offsets
+            Variant offsets.
+        threshold
+            Dosages at or below it are not stored. Defaults to ``0``.
+
+        Returns
+        -------
+        Sparse variant-by-sample dosage matrix.
+
+        Raises
+        ------
+        ValueError
+            If a variant is not biallelic.
+        RuntimeError
+            If invalid offset of or a file stream reading error occurs.
+        """
+        offsets = ascontiguousarray(offsets, dtype=uint64)
+        self._fetch_genotypes(offsets)
+        noffsets = offsets.size
+        nsamples = self.nsamples
+
+        indptr = zeros(noffsets + 1, dtype=int64)
+        capacity = nsamples + 16 * noffsets
+        indices = empty(capacity, dtype=uint32)
+        data = empty(capacity, dtype=float64)
+
+        err = ffi.new("int *")
+        i = 0
+        while i < noffsets:
+            i += lib.read_sparse_dosage(
+                self._decoder,
+                ffi.cast("uint64_t *", ffi.from_buffer(offsets[i:])),
+                noffsets - i,
+                threshold,
+                ffi.cast("int64_t *", ffi.from_buffer(indptr[i:])),
+                ffi.cast("uint32_t *", ffi.from_buffer(indices)),
+                ffi.cast("double *", ffi.from_buffer(data)),
+                capacity,
+                self._stats,
+                err,
+            )
+            if err[0] == 4:
+                capacity = max(2 * capacity, int(indptr[i]) + nsamples)
+                indices = resize(indices, capacity)
+                data = resize(data, capacity)
+            elif i < noffsets:
+                _raise_dosage_error(int(offsets[i]), err[0])
+
+        nnz = int(indptr[-1])
+        indices = indices[:nnz].copy()
+        data = data[:nnz].copy()
+        if self._stats != ffi.NULL:
+            self._stats.alloc_bytes += indptr.nbytes + indices.nbytes + data.nbytes
+
+        return SparseDosage(indptr, indices, data, (noffsets, nsamples))
+
+    def dot(self, offsets: Sequence[int], weights: DtypeLike) -> DtypeLike:
+        """
+        Weighted sum of dosages over variants, for each sample.
+
+        It computes ``sum_i weights[i] * dosage[i, j]`` for each sample ``j``,
+        as in a polygenic score, by streaming through the variants without
+        materialising the dosage matrix. Missing genotypes are imputed by the
+        mean dosage of their variant.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     with bgen.open_metafile() as mf:
+        ...         offsets = mf.read_offsets()
+        ...     print(bgen.dot(offsets, [1.0, 0.0, 0.0, -1.0]))
+        [-2.  1.  0.  1.]
+
+        Parameters
+        ----------
+        offsets
+            Variant offsets.
+        weights
+            Weights with shape (variants,) or (variants, columns).
+
+        Returns
+        -------
+        Sums with shape (samples,) or (samples, columns).
+
+        Raises
+        ------
+        ValueError
+            If a variant is not biallelic or the weights do not match the
+            variants.
+        RuntimeError
+            If invalid offset of or a file stream reading error occurs.
+        """
+        offsets = ascontiguousarray(offsets, dtype=uint64)
+        self._fetch_genotypes(offsets)
+        weights = ascontiguousarray(weights, dtype=float64)
+        if weights.ndim not in [1, 2] or weights.shape[0] != offsets.size:
+            raise ValueError("Weights should have one row per variant.")
+
+        ncols = 1 if weights.ndim == 1 else weights.shape[1]
+        out = zeros((self.nsamples,) + weights.shape[1:], dtype=float64)
+        err = ffi.new("int *")
+        i = lib.dot_dosage(
+            self._decoder,
+            ffi.cast("uint64_t *", ffi.from_buffer(offsets)),
+            offsets.size,
+            ffi.cast("double *", ffi.from_buffer(weights)),
+            ncols,
+            ffi.cast("double *", ffi.from_buffer(out)),
+            self._stats,
+            err,
+        )
+        if i < offsets.size:
+            _raise_dosage_error(int(offsets[i]), err[0])
+
+        if self._stats != ffi.NULL:
+            self._stats.alloc_bytes += out.nbytes
+
+        return out
+
+    def rdot(
+        self, sample_vector: DtypeLike, offsets: Optional[Sequence[int]] = None
+    ) -> DtypeLike:
+        """
+        Weighted sum of dosages over samples, for each variant.
+
+        It computes ``sum_j sample_vector[j] * dosage[i, j]`` for each variant
+        ``i`` by streaming through the variants without materialising the
+        dosage matrix. Missing genotypes are imputed by the mean dosage of
+        their variant.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     print(bgen.rdot([1.0, 1.0, 1.0, 1.0]))
+        [4. 4. 4. 4.]
+
+        Parameters
+        ----------
+        sample_vector
+            Sample weights with shape (samples,) or (samples, columns).
+        offsets
+            Variant offsets. Defaults to every variant, in file order.
+
+        Returns
+        -------
+        Sums with shape (variants,) or (variants, columns).
+
+        Raises
+        ------
+        ValueError
+            If a variant is not biallelic or the sample weights do not match
+            the samples.
+        RuntimeError
+            If invalid offset of or a file stream reading error occurs.
+        """
+        if offsets is None:
+            with self.open_metafile() as mf:
+                offsets = mf.read_offsets()
+
+        offsets = ascontiguousarray(offsets, dtype=uint64)
+        self._fetch_genotypes(offsets)
+        vector = ascontiguousarray(sample_vector, dtype=float64)
+        if vector.ndim not in [1, 2] or vector.shape[0] != self.nsamples:
+            raise ValueError("Sample vector should have one row per sample.")
+
+        ncols = 1 if vector.ndim == 1 else vector.shape[1]
+        out = empty((offsets.size,) + vector.shape[1:], dtype=float64)
+        err = ffi.new("int *")
+        i = lib.rdot_dosage(
+            self._decoder,
+            ffi.cast("uint64_t *", ffi.from_buffer(offsets)),
+            offsets.size,
+            ffi.cast("double *", ffi.from_buffer(vector)),
+            ncols,
+            ffi.cast("double *", ffi.from_buffer(out)),
+            self._stats,
+            err,
+        )
+        if i < offsets.size:
+            _raise_dosage_error(int(offsets[i]), err[0])
+
+        if self._stats != ffi.NULL:
+            self._stats.alloc_bytes += out.nbytes
+
+        return out
+
+    def as_array(
+        self,
+        metafile: Optional[Union[str, Path, bgen_metafile]] = None,
+        chunks: Optional[Tuple[int, int]] = None,
+        precision: int = 64,
+    ) -> dosage_array:
+        """
+        Lazy variant-by-sample dosage array.
+
+        Nothing is decoded until the array is indexed, and then only the
+        selected variants and samples are. The array carries its chunk sizes,
+        so it can be wrapped by dask without decoding anything up front::
+
+            import dask.array as da
+
+            x = bgen.as_array(chunks=(1024, 4096))
+            x = da.from_array(x, chunks=x.chunks)
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     x = bgen.as_array(chunks=(2, 4))
+        >>> print(x.shape, x.chunks)
+        (4, 4) ((2, 2), (4,))
+        >>> print(x[1:3, 0])
+        [1. 1.]
+
+        Parameters
+        ----------
+        metafile
+            Metafile, or its file path, providing the variant offsets. Defaults
+            to the metafile given by :meth:`open_metafile`.
+        chunks
+            Number of variants and number of samples per chunk. Defaults to the
+            metafile partition size and the number of samples.
+        precision
+            Dosage precision in bits: 64 (default) or 32.
+
+        Returns
+        -------
+        Dosage array.
+        """
+        if isinstance(metafile, bgen_metafile):
+            mf = metafile
+        else:
+            mf = self.open_metafile(metafile, auto=metafile is None)
+
+        try:
+            offsets = mf.read_offsets()
+            if chunks is None:
+                chunks = (mf.partition_size, self.nsamples)
+        finally:
+            if mf is not metafile:
+                mf.close()
+
+        return dosage_array(self._source, offsets, self.nsamples, chunks, precision)
+
+    def create_dosage_cache(
+        self, filepath: Union[str, Path], tile: Tuple[int, int] = DOSAGE_TILE
+    ):
+        """
+        Create a sample-major cache of quantised dosages.
+
+        The dosage matrix is transposed into tiles of ``tile[0]`` variants by
+        ``tile[1]`` samples, stored grouped by sample block, so that reading
+        every variant of a few samples does not require decoding the BGEN
+        file. Dosages are quantised to one byte, with a resolution of
+        ``1/127``, and clipped to the range from ``0`` to ``2``.
+
+        Parameters
+        ----------
+        filepath
+            Cache file path.
+        tile
+            Number of variants and number of samples per tile. Defaults to
+            ``(4096, 64)``.
+
+        Raises
+        ------
+        ValueError
+            If a variant is not biallelic.
+        RuntimeError
+            If a file stream reading error occurs.
+        """
+        with self.open_metafile() as mf:
+            offsets = mf.read_offsets()
+
+        def read_dosage(offsets):
+            return self.read_dosage(offsets, precision=32)
+
+        dosage_cache.create(filepath, self.nsamples, offsets, read_dosage, tile)
+
+    def read_samples_genotypes(
+        self,
+        sample_idx: Sequence[int],
+        filepath: Optional[Union[str, Path]] = None,
+    ) -> DtypeLike:
+        """
+        Read the dosage of every variant for the given samples.
+
+        Dosages are read from the sample-major cache created by
+        :meth:`create_dosage_cache`, which only reads the tiles of the given
+        samples. By default, the cache is kept under
+        :data:`cbgen.BGEN_CACHE_HOME` and created on first use.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     print(bgen.read_samples_genotypes([3, 0]))
+        [[2. 0.]
+         [0. 1.]
+         [1. 1.]
+         [1. 2.]]
+
+        Parameters
+        ----------
+        sample_idx
+            Sample indices.
+        filepath
+            Cache file path. Defaults to the cached dosage cache.
+
+        Returns
+        -------
+        Variant-by-sample dosage matrix.
+
+        Raises
+        ------
+        ValueError
+            If a sample index is out of range.
+        """
+        if filepath is not None:
+            with dosage_cache(filepath) as cache:
+                return cache.read(sample_idx)
+
+        if self._dosage_cache is None:
+            filepath = self._cache_filepath("dosage")
+            self._count_cache(filepath.exists())
+            if not filepath.exists():
+                filepath.parent.mkdir(parents=True, exist_ok=True)
+                with file_lock(filepath.with_name(filepath.name + ".lock")):
+                    if not filepath.exists():
+                        tmp = filepath.with_name(f"{filepath.name}.{os.getpid()}.tmp")
+                        try:
+                            self.create_dosage_cache(tmp)
+                            os.replace(tmp, filepath)
+                        finally:
+                            tmp.unlink(missing_ok=True)
+            self._dosage_cache = dosage_cache(filepath)
+
+        return self._dosage_cache.read(sample_idx)
+
+    def enable_stats(self, enable: bool = True):
+        """
+        Start or stop collecting reading statistics.
+
+        Counters of genotype reading, split by phase, are collected by this
+        file handle from the moment they are enabled. Enabling them again
+        resets them. Collecting them costs two clock readings per phase and
+        genotype block.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     with bgen.open_metafile() as mf:
+        ...         offsets = mf.read_offsets()
+        ...     bgen.enable_stats()
+        ...     dosage = bgen.read_dosage(offsets)
+        ...     print(bgen.stats.nblocks, bgen.stats.nbytes)
+        4 131
+
+        Parameters
+        ----------
+        enable
+            ``True`` to start collecting (default); ``False`` to stop.
+        """
+        if enable:
+            self._stats = ffi.new("struct read_stats *")
+        else:
+            self._stats = ffi.NULL
+
+    @property
+    def stats(self) -> Optional[ReadStats]:
+        """
+        Reading statistics collected since they were enabled, or ``None`` if
+        they are not enabled.
+        """
+        stats = self._stats
+        if stats == ffi.NULL:
+            return None
+        return ReadStats(
+            stats.nblocks,
+            stats.nbytes,
+            stats.read_ns / 1e9,
+            stats.decompress_ns / 1e9,
+            stats.decode_ns / 1e9,
+            stats.convert_ns / 1e9,
+            stats.alloc_bytes,
+            stats.cache_hits,
+            stats.cache_misses,
+        )
+
+    @property
+    def inflater(self) -> str:
+        """
+        Inflater of zlib-compressed genotype blocks.
+
+        Returns
+        -------
+        ``"libdeflate"`` or ``"zlib"``.
+        """
+        code = lib.decoder_inflater(self._decoder)
+        return next(k for k, v in _INFLATERS.items() if v == code)
+
+    def set_inflater(self, inflater: str):
+        """
+        Set the inflater of zlib-compressed genotype blocks.
+
+        Genotype blocks are read and decompressed in one shot into buffers
+        reused across blocks. Blocks compressed with zlib are inflated by
+        libdeflate, a faster whole-buffer inflater, if cbgen was built with it,
+        and by zlib otherwise. The released wheels are built without
+        libdeflate; building cbgen from source picks it up when it is
+        installed, or when ``BGEN_LIBDEFLATE=1`` is set.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+        ...     bgen.set_inflater("zlib")
+        ...     print(bgen.inflater)
+        zlib
+
+        Parameters
+        ----------
+        inflater
+            ``"libdeflate"`` or ``"zlib"``.
+
+        Raises
+        ------
+        ValueError
+            If the inflater is not available.
+        """
+        code = _INFLATERS.get(inflater)
+        if code is None or not lib.decoder_set_inflater(self._decoder, code):
+            raise ValueError(f"Inflater {inflater} is not available.")
+
     def close(self):
         """
         Close file stream.
         """
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        if self._dosage_cache is not None:
+            self._dosage_cache.close()
+            self._dosage_cache = None
+        self._stats = ffi.NULL
+        if self._decoder != ffi.NULL:
+            lib.decoder_close(self._decoder)
+            self._decoder = ffi.NULL
         if self._bgen_file != ffi.NULL:
             lib.bgen_file_close(self._bgen_file)
             self._bgen_file = ffi.NULL
+        if self._remote is not None:
+            if self._remote is not self._source:
+                self._remote.close()
+            self._remote = None
+
+    def _count_cache(self, hit: bool):
+        if self._stats != ffi.NULL:
+            if hit:
+                self._stats.cache_hits += 1
+            else:
+                self._stats.cache_misses += 1
+
+    def _variant_index(self) -> variant_index:
+        if self._index is None:
+            self._fetch_all()
+            self._index = variant_index(self._filepath)
+        return self._index
+
+    def _cache_filepath(self, suffix: str) -> Path:
+        if self._remote is not None:
+            return keyed_filepath("remote", self._remote.key, suffix)
+        return cache_filepath(self._filepath, suffix)
+
+    def _fetch_header(self):
+        variants_start = 4 + int.from_bytes(self._remote.read(0, 4), "little")
+        self._remote.fetch(0, variants_start)
+        with open(self._filepath, "rb") as stream:
+            header = read_header(stream)
+        if header.layout == 1 and header.compression == COMPRESSION_NONE:
+            self._genotype_nbytes = 6 * header.nsamples
+
+    def _fetch_genotypes(self, offsets: Sequence[int]):
+        if self._remote is None:
+            return
+
+        offsets = [int(o) for o in offsets]
+        if self._genotype_nbytes > 0:
+            nbytes = self._genotype_nbytes
+            self._remote.fetch_ranges([(o, o + nbytes) for o in offsets])
+            return
+
+        # Genotype blocks start with their size.
+        self._remote.fetch_ranges([(o, o + 4) for o in offsets])
+        sizes = [int.from_bytes(self._remote.read(o, o + 4), "little") for o in offsets]
+        self._remote.fetch_ranges([(o, o + 4 + n) for o, n in zip(offsets, sizes)])
+
+    def _fetch_all(self):
+        if self._remote is not None:
+            self._remote.fetch(0, self._remote.size)
 
     def __del__(self):
         self.close()
@@ -271,7 +1454,33 @@ class bgen_file:
         self.close()
 
 
+def _raise_dosage_error(offset: int, err: int):
+    if err == 1:
+        raise RuntimeError(f"Could not open genotype (offset {offset}).")
+    if err == 3:
+        raise ValueError(f"Variant is not biallelic (offset {offset}).")
+    raise RuntimeError(f"Could not read genotype probabilities (offset {offset}).")
+
+
+def _element_strides(arr: DtypeLike) -> Tuple[int, ...]:
+    return tuple(s // arr.itemsize for s in arr.strides)
+
+
 def estimate_best_npartitions(nvariants: int) -> int:
+    if nvariants == 0:
+        return 1
     min_variants = 128
     m = max(min(min_variants, nvariants), floor(sqrt(nvariants)))
     return nvariants // m
+
+
+def _variants(records: List[VariantRecord]) -> Variants:
+    return Variants(
+        array([r.id for r in records], dtype=bytes),
+        array([r.rsid for r in records], dtype=bytes),
+        array([r.chromosome for r in records], dtype=bytes),
+        array([r.position for r in records], dtype=uint32),
+        array([len(r.allele_ids) for r in records], dtype=uint16),
+        array([b",".join(r.allele_ids) for r in records], dtype=bytes),
+        array([r.offset for r in records], dtype=uint64),
+    )
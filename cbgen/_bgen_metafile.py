@@ -1,13 +1,32 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Union
+from typing import TYPE_CHECKING, List, Optional, Union
 
-from numpy import empty, uint16, uint32, uint64, zeros
+from numpy import empty, uint8, uint16, uint32, uint64, zeros
 
-from cbgen.typing import CData, Partition, Variants
+from cbgen.typing import (
+    CategoricalArray,
+    CData,
+    DtypeLike,
+    Partition,
+    RangeReader,
+    StringArray,
+    Variants,
+)
 
+from ._cache import local_path
 from ._ffi import ffi, lib
+from ._metafile_writer import (
+    COLUMNAR_SIGNATURE,
+    metafile_header_size,
+    read_metafile_header,
+    read_partition_bounds,
+)
+
+if TYPE_CHECKING:
+    from ._columnar import columnar_reader
+    from ._remote import block_cache
 
 __all__ = ["bgen_metafile"]
 
@@ -42,10 +61,17 @@ class bgen_metafile:
     ...     print(mf.npartitions)
     1
 
+    Columnar metafiles, written by :meth:`cbgen.bgen_file.create_metafile`
+    with ``columnar=True``, are read the same way.
+
+    A remote metafile, given by an HTTP or HTTPS URL or by a
+    :class:`cbgen.typing.RangeReader`, is read through a local
+    :class:`cbgen.block_cache`, fetching its partitions as they are read.
+
     Parameters
     ----------
     filepath
-        BGEN metafile file path.
+        BGEN metafile file path, URL, range reader, or block cache.
 
     Raises
     ------
@@ -53,9 +79,28 @@ class bgen_metafile:
         If a file stream reading error occurs.
     """
 
-    def __init__(self, filepath: Union[str, Path]):
-        self._filepath = Path(filepath)
+    def __init__(self, filepath: Union[str, Path, RangeReader, block_cache]):
+        self._source = filepath
         self._bgen_metafile: CData = ffi.NULL
+        self._bounds: Optional[List[int]] = None
+        self._columnar: Optional[columnar_reader] = None
+        self._remote: Optional[block_cache] = None
+        path = local_path(filepath)
+        if path is None:
+            from ._remote import open_remote
+
+            self._remote = open_remote(filepath)
+            self._filepath = self._remote.filepath
+            self._fetch_header()
+        else:
+            self._filepath = path
+        if _is_columnar(self._filepath):
+            from . import _columnar
+
+            self._columnar = _columnar.columnar_reader(self._filepath)
+            if self._remote is not None:
+                self._bounds = self._columnar.bounds()
+            return
         self._bgen_metafile = lib.bgen_metafile_open(bytes(self._filepath))
         if self._bgen_metafile == ffi.NULL:
             raise RuntimeError(f"Failed to open {filepath}.")
@@ -63,7 +108,7 @@ class bgen_metafile:
     @property
     def filepath(self) -> Path:
         """
-        File path.
+        File path, or file path of the local copy of a remote metafile.
 
         Returns
         -------
@@ -80,6 +125,8 @@ class bgen_metafile:
         -------
         Number of partitions.
         """
+        if self._columnar is not None:
+            return self._columnar.npartitions
         return lib.bgen_metafile_npartitions(self._bgen_metafile)
 
     @property
@@ -91,6 +138,8 @@ class bgen_metafile:
         -------
         Number of variants.
         """
+        if self._columnar is not None:
+            return self._columnar.nvariants
         return lib.bgen_metafile_nvariants(self._bgen_metafile)
 
     @property
@@ -108,7 +157,7 @@ class bgen_metafile:
         """
         return ceildiv(self.nvariants, self.npartitions)
 
-    def read_partition(self, index: int) -> Partition:
+    def read_partition(self, index: int, compact: bool = False) -> Partition:
         """
         Read partition.
 
@@ -116,6 +165,11 @@ class bgen_metafile:
         ----------
         index
             Partition index.
+        compact
+            ``True`` to store chromosomes as
+            :class:`cbgen.typing.CategoricalArray` and other strings as
+            :class:`cbgen.typing.StringArray`; ``False`` to store them as
+            fixed-width arrays (default).
 
         Returns
         -------
@@ -126,6 +180,11 @@ class bgen_metafile:
         RuntimeError
             If index is invalid or a file stream reading error occurs.
         """
+        self._fetch_partitions(index, index + 1)
+        if self._columnar is not None:
+            v = self._columnar.read_variants(index, compact)
+            return Partition(self.partition_size * index, v)
+
         partition = lib.bgen_metafile_read_partition(self._bgen_metafile, index)
         if partition == ffi.NULL:
             raise RuntimeError(f"Could not read partition {partition}.")
@@ -154,6 +213,13 @@ class bgen_metafile:
             allele_ids_max_len,
         )
 
+        if compact:
+            v = _read_compact_variants(
+                partition, position, nalleles, var_offset, chrom_max_len[0]
+            )
+            lib.bgen_partition_destroy(partition)
+            return Partition(self.partition_size * index, v)
+
         vid = zeros(nvariants, dtype=f"S{vid_max_len[0]}")
         rsid = zeros(nvariants, dtype=f"S{rsid_max_len[0]}")
         chrom = zeros(nvariants, dtype=f"S{chrom_max_len[0]}")
@@ -176,6 +242,61 @@ class bgen_metafile:
         v = Variants(vid, rsid, chrom, position, nalleles, allele_ids, var_offset)
         return Partition(part_offset, v)
 
+    def read_offsets(self) -> DtypeLike:
+        """
+        Read the genotype offsets of every variant.
+
+        Every partition is still parsed, but no string arrays are built for
+        the variant identifying strings, which makes it faster than reading
+        every partition.
+
+        >>> import cbgen
+        >>>
+        >>> with cbgen.bgen_metafile(cbgen.example.get("haplotypes.bgen.metafile")) as mf:
+        ...     offsets = mf.read_offsets()
+        >>> print(len(offsets))
+        4
+
+        Returns
+        -------
+        Genotype offsets.
+
+        Raises
+        ------
+        RuntimeError
+            If a file stream reading error occurs.
+        """
+        self._fetch_partitions(0, self.npartitions)
+        if self._columnar is not None:
+            return self._columnar.read_offsets()
+
+        offsets = empty(self.nvariants, dtype=uint64)
+        size = self.partition_size
+        lens = ffi.new("uint32_t[]", 4)
+
+        for index in range(self.npartitions):
+            partition = lib.bgen_metafile_read_partition(self._bgen_metafile, index)
+            if partition == ffi.NULL:
+                raise RuntimeError(f"Could not read partition {index}.")
+
+            nvariants = lib.bgen_partition_nvariants(partition)
+            position = empty(nvariants, dtype=uint32)
+            nalleles = empty(nvariants, dtype=uint16)
+            start = index * size
+            lib.read_partition_part1(
+                partition,
+                ffi.cast("uint32_t *", ffi.from_buffer(position)),
+                ffi.cast("uint16_t *", ffi.from_buffer(nalleles)),
+                ffi.cast("uint64_t *", ffi.from_buffer(offsets[start:])),
+                lens,
+                lens + 1,
+                lens + 2,
+                lens + 3,
+            )
+            lib.bgen_partition_destroy(partition)
+
+        return offsets
+
     def close(self):
         """
         Close file stream.
@@ -183,6 +304,31 @@ class bgen_metafile:
         if self._bgen_metafile != ffi.NULL:
             lib.bgen_metafile_close(self._bgen_metafile)
             self._bgen_metafile = ffi.NULL
+        if self._columnar is not None:
+            self._columnar.close()
+            self._columnar = None
+        if self._remote is not None:
+            if self._remote is not self._source:
+                self._remote.close()
+            self._remote = None
+
+    def _fetch_header(self):
+        self._remote.fetch(0, metafile_header_size(0))
+        if _is_columnar(self._filepath):
+            from ._columnar import footer_position
+
+            with open(self._filepath, "rb") as stream:
+                self._remote.fetch(footer_position(stream), self._remote.size)
+            return
+        with open(self._filepath, "rb") as stream:
+            _, npartitions = read_metafile_header(stream)
+        self._remote.fetch(0, metafile_header_size(npartitions))
+        with open(self._filepath, "rb") as stream:
+            self._bounds = read_partition_bounds(stream)
+
+    def _fetch_partitions(self, first: int, last: int):
+        if self._remote is not None and 0 <= first < last < len(self._bounds):
+            self._remote.fetch(self._bounds[first], self._bounds[last])
 
     def __del__(self):
         self.close()
@@ -194,5 +340,48 @@ class bgen_metafile:
         self.close()
 
 
+def _read_compact_variants(
+    partition: CData, position, nalleles, var_offset, chrom_max_len: int
+) -> Variants:
+    nvariants = position.shape[0]
+    offsets = [empty(nvariants + 1, dtype=uint64) for _ in range(4)]
+    lib.read_partition_offsets(
+        partition, *[ffi.cast("uint64_t *", ffi.from_buffer(o)) for o in offsets]
+    )
+
+    data = [empty(int(o[-1]), dtype=uint8) for o in offsets]
+    lib.read_partition_strings(partition, *[ffi.from_buffer("char[]", d) for d in data])
+
+    vid, rsid, chrom, allele_ids = [StringArray(o, d) for o, d in zip(offsets, data)]
+
+    codes = empty(nvariants, dtype=uint16)
+    first = empty(nvariants, dtype=uint32)
+    ncategories = lib.read_partition_chrom_codes(
+        partition,
+        ffi.cast("uint16_t *", ffi.from_buffer(codes)),
+        ffi.cast("uint32_t *", ffi.from_buffer(first)),
+    )
+    # Chromosomes are kept as strings if there are too many distinct ones.
+    if ncategories <= nvariants:
+        categories = zeros(ncategories, dtype=f"S{chrom_max_len}")
+        lib.read_partition_chrom_categories(
+            partition,
+            ffi.cast("uint32_t *", ffi.from_buffer(first)),
+            ncategories,
+            ffi.from_buffer("char[]", categories),
+            chrom_max_len,
+        )
+        chrom = CategoricalArray(codes, categories)
+    return Variants(vid, rsid, chrom, position, nalleles, allele_ids, var_offset)
+
+
+def _is_columnar(filepath: Path) -> bool:
+    try:
+        with open(filepath, "rb") as stream:
+            return stream.read(len(COLUMNAR_SIGNATURE)) == COLUMNAR_SIGNATURE
+    except OSError:
+        return False
+
+
 def ceildiv(a: int, b: int) -> int:
     return -(-a // b)
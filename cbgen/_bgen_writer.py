@@ -0,0 +1,432 @@
+from __future__ import annotations
+
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from math import comb
+from pathlib import Path
+from struct import Struct
+from typing import Any, List, Optional, Sequence, Union
+
+from numpy import (
+    asarray,
+    ascontiguousarray,
+    broadcast_to,
+    float64,
+    isnan,
+    rint,
+    uint8,
+    where,
+)
+
+from cbgen.typing import DtypeLike
+
+from ._ffi import ffi, lib
+from ._format import COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_ZSTD, VariantRecord
+from ._metafile_writer import metafile_writer
+
+__all__ = ["bgen_writer"]
+
+_u16 = Struct("<H")
+_u32 = Struct("<I")
+_u32x2 = Struct("<II")
+_u32u16 = Struct("<IH")
+_header = Struct("<IIIII")
+
+_COMPRESSIONS = {
+    None: COMPRESSION_NONE,
+    "zlib": COMPRESSION_ZLIB,
+    "zstd": COMPRESSION_ZSTD,
+}
+_DEFAULT_LEVEL = {COMPRESSION_NONE: 0, COMPRESSION_ZLIB: 6, COMPRESSION_ZSTD: 3}
+
+
+class bgen_writer:
+    """
+    BGEN file writer.
+
+    Variants are written in batches of genotype probabilities, in the same
+    format returned by :meth:`cbgen.bgen_file.read_genotype`. The metafile of
+    the BGEN file is written alongside it, so that it does not have to be
+    created by scanning the file afterwards. Genotype blocks of a batch are
+    encoded and compressed by a pool of ``nthreads`` threads.
+
+    >>> import cbgen
+    >>> from pathlib import Path
+    >>> from tempfile import TemporaryDirectory
+    >>> from numpy import asarray
+    >>>
+    >>> tmp = TemporaryDirectory()
+    >>> filepath = Path(tmp.name) / "out.bgen"
+    >>> probs = asarray([[[1.0, 0.0, 0.0], [0.0, 0.5, 0.5]]])
+    >>> with cbgen.bgen_writer(filepath, ["s0", "s1"]) as writer:
+    ...     writer.write(probs, ["rs1"], ["1"], [100], [["A", "G"]])
+    >>> with cbgen.bgen_file(filepath) as bgen:
+    ...     with cbgen.bgen_metafile(f"{filepath}.metafile") as mf:
+    ...         offset = mf.read_partition(0).variants.offset[0]
+    ...     print(bgen.read_probability(offset).round(2))
+    [[1.  0.  0. ]
+     [0.  0.5 0.5]]
+    >>> tmp.cleanup()
+
+    Parameters
+    ----------
+    filepath
+        BGEN file path.
+    samples
+        Sample identifiers, or the number of samples for a file without sample
+        identifiers.
+    layout
+        Genotype block layout: ``2`` (default) or ``1``. Layout 1 only stores
+        unphased diploid biallelic genotypes, at 16 bits per probability.
+    compression
+        Genotype block compression: ``"zstd"`` (default), ``"zlib"``, or
+        ``None``. Layout 1 blocks cannot be compressed with zstd.
+    bits
+        Number of bits per stored probability of layout 2, from 1 to 32.
+        Defaults to ``8``.
+    level
+        Compression level. Defaults to ``6`` for zlib and ``3`` for zstd.
+    nthreads
+        Number of threads encoding and compressing genotype blocks. Defaults
+        to ``1``.
+    metafile
+        Metafile file path. Defaults to the BGEN file path with the suffix
+        ``.metafile`` appended.
+
+    Raises
+    ------
+    ValueError
+        If an option is invalid.
+    """
+
+    def __init__(
+        self,
+        filepath: Union[str, Path],
+        samples: Union[int, Sequence[Union[str, bytes]]],
+        layout: int = 2,
+        compression: str = "zstd",
+        bits: int = 8,
+        level: Optional[int] = None,
+        nthreads: int = 1,
+        metafile: Optional[Union[str, Path]] = None,
+    ):
+        if layout not in (1, 2):
+            raise ValueError("Layout should be either 1 or 2.")
+
+        if compression not in _COMPRESSIONS:
+            raise ValueError("Compression should be 'zstd', 'zlib', or None.")
+
+        if layout == 1 and compression == "zstd":
+            raise ValueError("Layout 1 does not support zstd compression.")
+
+        if not (1 <= bits <= 32):
+            raise ValueError("Bits should be between 1 and 32.")
+
+        self._filepath = Path(filepath)
+        self._layout = layout
+        self._compression = _COMPRESSIONS[compression]
+        self._bits = bits
+        self._level = _DEFAULT_LEVEL[self._compression] if level is None else level
+        self._nvariants = 0
+        self._executor = ThreadPoolExecutor(nthreads) if nthreads > 1 else None
+
+        if isinstance(samples, int):
+            self._nsamples = samples
+            ids: Optional[List[bytes]] = None
+        else:
+            ids = [_as_bytes(s) for s in samples]
+            self._nsamples = len(ids)
+
+        if metafile is None:
+            metafile = self._filepath.with_name(self._filepath.name + ".metafile")
+        self._metafile = Path(metafile)
+
+        self._stream = open(self._filepath, "wb")
+        self._writer: Optional[metafile_writer] = None
+        try:
+            self._write_header(ids)
+            self._writer = metafile_writer(self._metafile)
+        except Exception:
+            self._stream.close()
+            raise
+
+    @property
+    def filepath(self) -> Path:
+        """
+        File path.
+        """
+        return self._filepath
+
+    @property
+    def nsamples(self) -> int:
+        """
+        Number of samples.
+        """
+        return self._nsamples
+
+    @property
+    def nvariants(self) -> int:
+        """
+        Number of variants written so far.
+        """
+        return self._nvariants
+
+    def write(
+        self,
+        probability: DtypeLike,
+        rsid: Sequence[Union[str, bytes]],
+        chromosome: Sequence[Union[str, bytes]],
+        position: Sequence[int],
+        allele_ids: Sequence[Sequence[Union[str, bytes]]],
+        id: Optional[Sequence[Union[str, bytes]]] = None,
+        ploidy: Union[int, DtypeLike] = 2,
+        phased: bool = False,
+        missing: Optional[DtypeLike] = None,
+    ):
+        """
+        Write a batch of variants.
+
+        Every variant of a batch must have the same number of alleles.
+
+        Parameters
+        ----------
+        probability
+            Probabilities with shape (variants, samples, combinations), as
+            returned by :meth:`cbgen.bgen_file.read_genotype` for each variant.
+        rsid
+            Reference SNP cluster IDs.
+        chromosome
+            Chromosomes.
+        position
+            Positions.
+        allele_ids
+            Allele identifications of each variant.
+        id
+            Identifications. Defaults to empty identifications.
+        ploidy
+            Ploidy of each sample, or of every sample. Defaults to ``2``.
+        phased
+            ``True`` if the probabilities are phased; ``False`` otherwise
+            (default).
+        missing
+            Missingness with shape (variants, samples). Defaults to the
+            samples whose probabilities are NaN.
+
+        Raises
+        ------
+        ValueError
+            If the batch is inconsistent.
+        """
+        probability = asarray(probability, dtype=float64)
+        if probability.ndim != 3 or probability.shape[1] != self._nsamples:
+            raise ValueError(
+                "Probability should have shape (variants, samples, ncombs)."
+            )
+
+        nvariants = probability.shape[0]
+        nalleles = {len(a) for a in allele_ids}
+        if len(nalleles) > 1:
+            raise ValueError(
+                "Variants of a batch should have the same number of alleles."
+            )
+        if len(allele_ids) != nvariants:
+            raise ValueError("Number of allele identifications does not match.")
+        if id is None:
+            id = [b""] * nvariants
+        for name, values in (("rsid", rsid), ("chromosome", chromosome), ("id", id)):
+            if len(values) != nvariants:
+                raise ValueError(f"Number of {name} values does not match.")
+        if len(position) != nvariants:
+            raise ValueError("Number of position values does not match.")
+        if nvariants == 0:
+            return
+
+        ploidy = broadcast_to(asarray(ploidy, dtype=uint8), (self._nsamples,))
+        if missing is None:
+            missing = isnan(probability[..., 0])
+        missing = broadcast_to(asarray(missing, dtype=bool), probability.shape[:2])
+
+        if self._layout == 1:
+            encoder = _layout1_encoder(nalleles.pop(), ploidy, phased)
+        else:
+            encoder = _genotype_encoder(nalleles.pop(), ploidy, phased, self._bits)
+        if encoder.ncombs != probability.shape[2]:
+            msg = f"Expected {encoder.ncombs} probability combinations per sample."
+            raise ValueError(msg)
+
+        def encode(i: int) -> bytes:
+            return self._compress(encoder.encode(probability[i], missing[i]))
+
+        if self._executor is None:
+            blocks = map(encode, range(nvariants))
+        else:
+            blocks = self._executor.map(encode, range(nvariants))
+
+        assert self._writer is not None
+        for i, block in enumerate(blocks):
+            rec = VariantRecord(
+                0,
+                _as_bytes(id[i]),
+                _as_bytes(rsid[i]),
+                _as_bytes(chromosome[i]),
+                int(position[i]),
+                [_as_bytes(a) for a in allele_ids[i]],
+            )
+            if self._layout == 1:
+                self._stream.write(_u32.pack(self._nsamples))
+            self._stream.write(self._encode_variant(rec))
+            rec.offset = self._stream.tell()
+            self._stream.write(block)
+            self._writer.write(rec)
+            self._nvariants += 1
+
+    def close(self):
+        """
+        Finish writing the BGEN file and its metafile.
+        """
+        if self._stream.closed:
+            return
+
+        if self._executor is not None:
+            self._executor.shutdown()
+
+        self._stream.seek(8)
+        self._stream.write(_u32.pack(self._nvariants))
+        self._stream.close()
+
+        from ._bgen_file import estimate_best_npartitions
+
+        assert self._writer is not None
+        self._writer.close(estimate_best_npartitions(self._nvariants))
+
+    def _write_header(self, samples: Optional[List[bytes]]):
+        flags = self._compression | (self._layout << 2)
+        block = b""
+        if samples is not None:
+            flags |= 1 << 31
+            ids = b"".join(_u16.pack(len(s)) + s for s in samples)
+            block = _u32x2.pack(8 + len(ids), len(samples)) + ids
+
+        header_length = _header.size
+        offset = header_length + len(block)
+        self._stream.write(_u32.pack(offset))
+        self._stream.write(
+            _header.pack(header_length, 0, self._nsamples, 0x6E656762, flags)
+        )
+        self._stream.write(block)
+
+    def _encode_variant(self, rec: VariantRecord) -> bytes:
+        parts = []
+        for s in (rec.id, rec.rsid, rec.chromosome):
+            parts += [_u16.pack(len(s)), s]
+        if self._layout == 1:
+            parts.append(_u32.pack(rec.position))
+        else:
+            parts.append(_u32u16.pack(rec.position, len(rec.allele_ids)))
+        for s in rec.allele_ids:
+            parts += [_u32.pack(len(s)), s]
+        return b"".join(parts)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self._compression == COMPRESSION_NONE:
+            return data if self._layout == 1 else _u32.pack(len(data)) + data
+        if self._compression == COMPRESSION_ZLIB:
+            compressed = zlib.compress(data, self._level)
+        else:
+            compressed = _zstd_compress(data, self._level)
+        if self._layout == 1:
+            return _u32.pack(len(compressed)) + compressed
+        return _u32x2.pack(len(compressed) + 4, len(data)) + compressed
+
+    def __del__(self):
+        if hasattr(self, "_stream") and not self._stream.closed:
+            self._stream.close()
+            if self._writer is not None:
+                self._writer.abort()
+
+    def __enter__(self) -> bgen_writer:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class _genotype_encoder:
+    """
+    Layout 2 genotype block encoder for variants sharing alleles and ploidy.
+    """
+
+    def __init__(self, nalleles: int, ploidy: DtypeLike, phased: bool, bits: int):
+        ploidy = ascontiguousarray(ploidy, dtype=uint8)
+        max_ploidy = int(ploidy.max()) if len(ploidy) > 0 else 0
+
+        if phased:
+            self.ncombs = max_ploidy * nalleles
+            nvalues = int(ploidy.sum(dtype=int)) * (nalleles - 1)
+        else:
+            self.ncombs = comb(max_ploidy + nalleles - 1, nalleles - 1)
+            nvalues = sum(comb(int(z) + nalleles - 1, nalleles - 1) - 1 for z in ploidy)
+
+        self._size = 10 + len(ploidy) + -(-nvalues * bits // 8)
+        self._nalleles = nalleles
+        self._ploidy = ploidy
+        self._phased = phased
+        self._bits = bits
+
+    def encode(self, probability: DtypeLike, missing: DtypeLike) -> bytes:
+        probability = ascontiguousarray(probability, dtype=float64)
+        missing = ascontiguousarray(missing, dtype=bool)
+        out = bytearray(self._size)
+        size = lib.encode_genotype(
+            ffi.cast("double *", ffi.from_buffer(probability)),
+            probability.shape[0],
+            self.ncombs,
+            self._nalleles,
+            ffi.cast("uint8_t *", ffi.from_buffer(self._ploidy)),
+            ffi.cast("bool *", ffi.from_buffer(missing)),
+            self._phased,
+            self._bits,
+            ffi.from_buffer("uint8_t[]", out),
+        )
+        if size == 0:
+            raise MemoryError("Could not encode genotype block.")
+        assert size == self._size
+        return bytes(out)
+
+
+class _layout1_encoder:
+    """
+    Layout 1 genotype block encoder.
+
+    Probabilities are stored as 16-bit integers scaled by 32768, and missing
+    genotypes as three zeros.
+    """
+
+    ncombs = 3
+
+    def __init__(self, nalleles: int, ploidy: DtypeLike, phased: bool):
+        if nalleles != 2 or phased or (ploidy != 2).any():
+            raise ValueError(
+                "Layout 1 only stores unphased diploid biallelic genotypes."
+            )
+
+    def encode(self, probability: DtypeLike, missing: DtypeLike) -> bytes:
+        values = rint(asarray(probability, dtype=float64) * 32768).clip(0, 65535)
+        values = where(missing[:, None], 0, values)
+        return values.astype("<u2").tobytes()
+
+
+def _zstd_compress(data: bytes, level: int) -> bytes:
+    bound = lib.ZSTD_compressBound(len(data))
+    dst = ffi.new("char[]", bound)
+    size = lib.ZSTD_compress(dst, bound, ffi.from_buffer(data), len(data), level)
+    if lib.ZSTD_isError(size):
+        msg = ffi.string(lib.ZSTD_getErrorName(size)).decode()
+        raise RuntimeError(f"Could not compress genotype block: {msg}.")
+    return ffi.buffer(dst, size)[:]
+
+
+def _as_bytes(value: Any) -> bytes:
+    if isinstance(value, str):
+        return value.encode()
+    return bytes(value)
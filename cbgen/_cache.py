@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Optional, Union
+from urllib.parse import urlsplit
+
+from ._env import BGEN_CACHE_HOME
+
+__all__ = ["cache_filepath", "file_lock", "keyed_filepath", "local_path"]
+
+
+def cache_filepath(filepath: Union[str, Path], suffix: str) -> Path:
+    """
+    Cache file path for a BGEN file.
+
+    The cache key is derived from the absolute BGEN file path, its size, and
+    its modification time, so that a modified BGEN file gets a new cache
+    entry.
+
+    Parameters
+    ----------
+    filepath
+        BGEN file path.
+    suffix
+        Cache file suffix, also used as the cache folder name.
+
+    Returns
+    -------
+    Cache file path.
+    """
+    filepath = Path(filepath).resolve()
+    st = filepath.stat()
+    return keyed_filepath(
+        filepath.name, f"{filepath}\0{st.st_size}\0{st.st_mtime_ns}", suffix
+    )
+
+
+def keyed_filepath(name: str, key: str, suffix: str) -> Path:
+    """
+    Cache file path for a file identified by a key.
+
+    Parameters
+    ----------
+    name
+        File name, kept as a prefix of the cache file name.
+    key
+        Key identifying the file content.
+    suffix
+        Cache file suffix, also used as the cache folder name.
+
+    Returns
+    -------
+    Cache file path.
+    """
+    name = f"{name}.{sha256(key.encode()).hexdigest()[:32]}.{suffix}"
+    return BGEN_CACHE_HOME / suffix / name
+
+
+def local_path(source: Any) -> Optional[Path]:
+    """
+    Path of a local file, or ``None`` for a URL or a range reader.
+
+    Parameters
+    ----------
+    source
+        File path, URL, range reader, or block cache.
+
+    Returns
+    -------
+    Local file path.
+    """
+    if isinstance(source, Path):
+        return source
+    if isinstance(source, str) and urlsplit(source).scheme not in ("http", "https"):
+        return Path(source)
+    return None
+
+
+class file_lock:
+    """
+    Exclusive inter-process lock backed by a file.
+
+    The lock file is never removed, so that every process locks the same
+    file.
+
+    Parameters
+    ----------
+    filepath
+        Lock file path.
+    """
+
+    def __init__(self, filepath: Union[str, Path]):
+        self._filepath = Path(filepath)
+        self._fd = -1
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquire the lock.
+
+        Parameters
+        ----------
+        blocking
+            ``True`` to wait for the lock (default); ``False`` to give up if
+            it is held elsewhere.
+
+        Returns
+        -------
+        ``True`` if the lock was acquired; ``False`` otherwise.
+        """
+        self._fd = os.open(self._filepath, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            locked = _lock(self._fd, blocking)
+        except BaseException:
+            os.close(self._fd)
+            self._fd = -1
+            raise
+        if not locked:
+            os.close(self._fd)
+            self._fd = -1
+        return locked
+
+    def release(self):
+        """
+        Release the lock.
+        """
+        if self._fd >= 0:
+            _unlock(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self) -> file_lock:
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock(fd: int, blocking: bool) -> bool:
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.1)
+
+    def _unlock(fd: int):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(fd: int, blocking: bool) -> bool:
+        try:
+            fcntl.flock(
+                fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            )
+        except BlockingIOError:
+            return False
+        return True
+
+    def _unlock(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from struct import Struct
+from typing import BinaryIO, Dict, List, Tuple, Union
+
+from numpy import (
+    asarray,
+    concatenate,
+    cumsum,
+    diff,
+    dtype,
+    empty,
+    frombuffer,
+    iinfo,
+    int64,
+    searchsorted,
+    uint8,
+    uint16,
+    uint32,
+    uint64,
+    unique,
+)
+
+from cbgen.typing import CategoricalArray, DtypeLike, StringArray, Variants
+
+from ._ffi import ffi, lib
+from ._metafile_writer import COLUMNAR_SIGNATURE
+
+__all__ = ["SIGNATURE", "columnar_reader", "footer_position", "write_columnar"]
+
+SIGNATURE = COLUMNAR_SIGNATURE
+LEVEL = 3
+
+_header = Struct("<IIQ")
+_u16 = Struct("<H")
+_u32 = Struct("<I")
+_entry = Struct("<QQIIIIII")
+
+# Integer columns are stored with the narrowest of these types that holds them.
+_DTYPES = [dtype(t) for t in ["<u1", "<u2", "<u4", "<u8", "<i1", "<i2", "<i4", "<i8"]]
+
+
+@dataclass
+class _entry_t:
+    offset: int
+    first_offset: int
+    first_position: int
+    nvariants: int
+    numbers_size: int
+    numbers_nbytes: int
+    strings_size: int
+    strings_nbytes: int
+
+
+class columnar_reader:
+    """
+    Reader of columnar metafiles.
+
+    A columnar metafile starts with its signature and a header holding the
+    number of variants, the number of partitions, and the footer position. Each
+    partition is stored as two zstd frames: one of integer columns and one of
+    strings. Genotype offsets and positions are delta-encoded, chromosomes are
+    codes into a dictionary shared by every partition, and every integer
+    column is narrowed to the smallest integer type holding it. The footer
+    holds the chromosome dictionary followed by the position and sizes of
+    every partition.
+
+    Parameters
+    ----------
+    filepath
+        Metafile file path.
+    """
+
+    def __init__(self, filepath: Union[str, Path]):
+        self._stream: BinaryIO = open(filepath, "rb")
+        try:
+            self._nvariants, self._entries, self._chromosomes = _read_footer(
+                self._stream
+            )
+        except Exception:
+            self._stream.close()
+            raise
+
+    @property
+    def nvariants(self) -> int:
+        return self._nvariants
+
+    @property
+    def npartitions(self) -> int:
+        return len(self._entries)
+
+    def bounds(self) -> List[int]:
+        """
+        File position of every partition, followed by the end of the last one.
+        """
+        entries = self._entries
+        if not entries:
+            return [0]
+        last = entries[-1]
+        return [e.offset for e in entries] + [
+            last.offset + last.numbers_size + last.strings_size
+        ]
+
+    def read_offsets(self) -> DtypeLike:
+        offsets = [self._read_numbers(i)[0] for i in range(self.npartitions)]
+        if not offsets:
+            return empty(0, dtype=uint64)
+        return concatenate(offsets)
+
+    def read_variants(self, index: int, compact: bool) -> Variants:
+        if not 0 <= index < self.npartitions:
+            raise RuntimeError(f"Could not read partition {index}.")
+
+        entry = self._entries[index]
+        offset, position, nalleles, codes, lengths = self._read_numbers(index)
+
+        self._stream.seek(entry.offset + entry.numbers_size)
+        data = frombuffer(
+            _decompress(self._stream.read(entry.strings_size), entry.strings_nbytes),
+            dtype=uint8,
+        )
+
+        starts = concatenate([[0], cumsum(lengths, dtype=uint64)]).astype(uint64)
+        n = entry.nvariants
+        vid, rsid, allele_ids = [
+            StringArray(starts[i * n : (i + 1) * n + 1], data) for i in range(3)
+        ]
+
+        used = unique(codes)
+        categories = self._chromosomes[used]
+        codes = searchsorted(used, codes).astype(
+            uint16 if used.size <= 1 << 16 else uint32
+        )
+        chrom = CategoricalArray(codes, categories)
+
+        if compact:
+            return Variants(vid, rsid, chrom, position, nalleles, allele_ids, offset)
+
+        return Variants(
+            asarray(vid),
+            asarray(rsid),
+            asarray(chrom),
+            position,
+            nalleles,
+            asarray(allele_ids),
+            offset,
+        )
+
+    def close(self):
+        self._stream.close()
+
+    def _read_numbers(self, index: int) -> Tuple[DtypeLike, ...]:
+        entry = self._entries[index]
+        self._stream.seek(entry.offset)
+        buf = _decompress(self._stream.read(entry.numbers_size), entry.numbers_nbytes)
+
+        n = entry.nvariants
+        columns = []
+        pos = 0
+        for size in [n - 1, n - 1, n, n, 3 * n]:
+            column, pos = _unpack(buf, pos, size)
+            columns.append(column)
+        offset_delta, position_delta, nalleles, codes, lengths = columns
+
+        offset = empty(n, dtype=uint64)
+        position = empty(n, dtype=uint32)
+        if n > 0:
+            offset[0] = entry.first_offset
+            offset[1:] = entry.first_offset + cumsum(offset_delta, dtype=uint64)
+            position[0] = entry.first_position
+            deltas = cumsum(position_delta, dtype=int64)
+            position[1:] = entry.first_position + deltas
+
+        return offset, position, nalleles.astype(uint16), codes, lengths
+
+
+def write_columnar(filepath: Union[str, Path], metafile):
+    """
+    Write a columnar metafile with the variants of a metafile.
+
+    Partitions are kept as they are in the given metafile.
+
+    Parameters
+    ----------
+    filepath
+        Columnar metafile file path.
+    metafile
+        Metafile.
+    """
+    filepath = Path(filepath)
+    tmp = filepath.with_name(f"{filepath.name}.{os.getpid()}.tmp")
+    chromosomes: Dict[bytes, int] = {}
+    entries: List[bytes] = []
+
+    try:
+        with open(tmp, "wb") as f:
+            f.write(SIGNATURE)
+            f.write(_header.pack(0, 0, 0))
+            for index in range(metafile.npartitions):
+                v = metafile.read_partition(index, compact=True).variants
+                entries.append(_write_partition(f, v, chromosomes))
+
+            footer = f.tell()
+            f.write(_u32.pack(len(chromosomes)))
+            for chrom in chromosomes:
+                f.write(_u16.pack(len(chrom)) + chrom)
+            for entry in entries:
+                f.write(entry)
+
+            f.seek(len(SIGNATURE))
+            f.write(_header.pack(metafile.nvariants, metafile.npartitions, footer))
+        os.replace(tmp, filepath)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _write_partition(f: BinaryIO, v: Variants, chromosomes: Dict[bytes, int]) -> bytes:
+    n = len(v.offset)
+    offset = asarray(v.offset, dtype=uint64)
+    position = asarray(v.position, dtype=int64)
+
+    chrom = v.chromosome
+    if isinstance(chrom, CategoricalArray):
+        categories, codes = chrom.categories, asarray(chrom.codes, dtype=int64)
+    else:
+        categories, codes = unique(asarray(chrom), return_inverse=True)
+    mapping = [chromosomes.setdefault(bytes(c), len(chromosomes)) for c in categories]
+    codes = asarray(mapping, dtype=int64)[codes.ravel()]
+
+    strings = [v.id, v.rsid, v.allele_ids]
+    lengths = concatenate([diff(s.offsets).astype(int64) for s in strings])
+    data = b"".join(s.data[s.offsets[0] : s.offsets[-1]].tobytes() for s in strings)
+
+    numbers = b"".join(
+        [
+            _pack(diff(offset.astype(int64))),
+            _pack(diff(position)),
+            _pack(asarray(v.nalleles, dtype=int64)),
+            _pack(codes),
+            _pack(lengths),
+        ]
+    )
+
+    start = f.tell()
+    numbers_frame = _compress(numbers)
+    strings_frame = _compress(data)
+    f.write(numbers_frame)
+    f.write(strings_frame)
+
+    first_offset = int(offset[0]) if n > 0 else 0
+    first_position = int(position[0]) if n > 0 else 0
+    return _entry.pack(
+        start,
+        first_offset,
+        first_position,
+        n,
+        len(numbers_frame),
+        len(numbers),
+        len(strings_frame),
+        len(data),
+    )
+
+
+def _read_footer(stream: BinaryIO) -> Tuple[int, List[_entry_t], DtypeLike]:
+    stream.seek(0)
+    if stream.read(len(SIGNATURE)) != SIGNATURE:
+        raise RuntimeError("Unrecognized metafile signature.")
+    data = stream.read(_header.size)
+    if len(data) != _header.size:
+        raise RuntimeError("Unexpected end of metafile.")
+    nvariants, npartitions, footer = _header.unpack(data)
+
+    stream.seek(footer)
+    (nchromosomes,) = _u32.unpack(stream.read(_u32.size))
+    names = []
+    for _ in range(nchromosomes):
+        (length,) = _u16.unpack(stream.read(_u16.size))
+        names.append(stream.read(length))
+    width = max([len(c) for c in names] + [1])
+    chromosomes = asarray(names, dtype=f"S{width}")
+
+    data = stream.read(_entry.size * npartitions)
+    if len(data) != _entry.size * npartitions:
+        raise RuntimeError("Unexpected end of metafile.")
+    entries = [_entry_t(*e) for e in _entry.iter_unpack(data)]
+    return nvariants, entries, chromosomes
+
+
+def footer_position(stream: BinaryIO) -> int:
+    """
+    Footer position of a columnar metafile.
+    """
+    stream.seek(len(SIGNATURE))
+    return _header.unpack(stream.read(_header.size))[2]
+
+
+def _pack(values: DtypeLike) -> bytes:
+    lo = int(values.min()) if values.size > 0 else 0
+    hi = int(values.max()) if values.size > 0 else 0
+    candidates = _DTYPES[:4] if lo >= 0 else _DTYPES[4:]
+    for code, t in enumerate(candidates, 0 if lo >= 0 else 4):
+        if iinfo(t).min <= lo and hi <= iinfo(t).max:
+            return bytes([code]) + values.astype(t).tobytes()
+    raise ValueError("Integer column out of range.")
+
+
+def _unpack(buf: bytes, pos: int, size: int) -> Tuple[DtypeLike, int]:
+    size = max(size, 0)
+    t = _DTYPES[buf[pos]]
+    column = frombuffer(buf, dtype=t, count=size, offset=pos + 1)
+    return column, pos + 1 + size * t.itemsize
+
+
+def _compress(data: bytes) -> bytes:
+    bound = lib.ZSTD_compressBound(len(data))
+    dst = ffi.new("char[]", bound)
+    size = lib.ZSTD_compress(dst, bound, ffi.from_buffer(data), len(data), LEVEL)
+    if lib.ZSTD_isError(size):
+        msg = ffi.string(lib.ZSTD_getErrorName(size)).decode()
+        raise RuntimeError(f"Could not compress metafile partition: {msg}.")
+    return ffi.buffer(dst, size)[:]
+
+
+def _decompress(data: bytes, nbytes: int) -> bytes:
+    dst = bytearray(nbytes)
+    size = lib.ZSTD_decompress(
+        ffi.from_buffer(dst), nbytes, ffi.from_buffer(data), len(data)
+    )
+    if lib.ZSTD_isError(size) or size != nbytes:
+        raise RuntimeError("Could not decompress metafile partition.")
+    return bytes(dst)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional, Tuple, Union
+
+from numpy import arange, asarray, float32, float64, ndarray, uint32, uint64
+
+from cbgen.typing import DtypeLike, RangeReader
+
+if TYPE_CHECKING:
+    from ._remote import block_cache
+
+__all__ = ["dosage_array"]
+
+
+class dosage_array:
+    """
+    Lazy variant-by-sample dosage array.
+
+    Dosages are only decoded for the variants and samples selected through
+    indexing. The object exposes ``shape``, ``dtype``, ``ndim``, and ``chunks``,
+    so that it can be wrapped by :func:`dask.array.from_array` (and therefore
+    by xarray) with ``chunks=arr.chunks``. Each thread decodes through its own
+    file handle, and the array can be pickled to be sent to other processes.
+
+    Parameters
+    ----------
+    filepath
+        BGEN file path, or URL, range reader, or block cache of a remote BGEN
+        file.
+    offsets
+        Genotype offsets of the variants.
+    nsamples
+        Number of samples.
+    chunks
+        Number of variants and number of samples per chunk.
+    precision
+        Dosage precision in bits: 64 (default) or 32.
+    """
+
+    def __init__(
+        self,
+        filepath: Union[str, Path, RangeReader, block_cache],
+        offsets: DtypeLike,
+        nsamples: int,
+        chunks: Tuple[int, int],
+        precision: int = 64,
+    ):
+        if precision not in [64, 32]:
+            raise ValueError("Precision should be either 64 or 32.")
+
+        self._filepath = filepath
+        self._offsets = asarray(offsets, dtype=uint64)
+        self._nsamples = nsamples
+        self._chunksize = (max(int(chunks[0]), 1), max(int(chunks[1]), 1))
+        self._precision = precision
+        self._local = threading.local()
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """
+        Number of variants and number of samples.
+        """
+        return (len(self._offsets), self._nsamples)
+
+    @property
+    def dtype(self):
+        """
+        Data type.
+        """
+        return float64 if self._precision == 64 else float32
+
+    @property
+    def ndim(self) -> int:
+        """
+        Number of dimensions.
+        """
+        return 2
+
+    @property
+    def chunks(self) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """
+        Chunk sizes along each dimension, in the format used by dask.
+        """
+        return tuple(
+            _chunk_sizes(n, c) for n, c in zip(self.shape, self._chunksize)
+        )  # type: ignore[return-value]
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return (
+            f"dosage_array(shape={self.shape}, dtype={self.dtype.__name__}, "
+            f"chunksize={self._chunksize})"
+        )
+
+    def __getitem__(self, key: Any) -> ndarray:
+        if not isinstance(key, tuple):
+            key = (key,)
+        if key.count(Ellipsis) > 1:
+            raise IndexError("An index can only have a single ellipsis.")
+        if Ellipsis in key:
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (3 - len(key)) + key[i + 1 :]
+        if len(key) > 2:
+            raise IndexError("Too many indices for a 2-dimensional array.")
+        key = key + (slice(None),) * (2 - len(key))
+
+        offsets = asarray(self._offsets[key[0]])
+        if isinstance(key[1], slice) and key[1] == slice(None):
+            samples: Optional[ndarray] = None
+            sample_shape: Tuple[int, ...] = (self._nsamples,)
+        else:
+            samples = asarray(arange(self._nsamples, dtype=uint32)[key[1]])
+            sample_shape = samples.shape
+            samples = samples.ravel()
+
+        bgen = self._bgen_file()
+        dosage = bgen.read_dosage(offsets.ravel(), samples, self._precision)
+        return dosage.reshape(offsets.shape + sample_shape)
+
+    def __array__(self, dtype=None, copy=None) -> ndarray:
+        arr = self[:, :]
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _bgen_file(self):
+        from ._bgen_file import bgen_file
+
+        bgen = getattr(self._local, "bgen", None)
+        if bgen is None:
+            bgen = bgen_file(self._filepath)
+            self._local.bgen = bgen
+        return bgen
+
+
+def _chunk_sizes(size: int, chunk: int) -> Tuple[int, ...]:
+    sizes = [chunk] * (size // chunk)
+    if size % chunk:
+        sizes.append(size % chunk)
+    return tuple(sizes) if sizes else (0,)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from math import prod
+from pathlib import Path
+from struct import Struct
+from typing import Callable, Sequence, Tuple, Union
+
+from numpy import (
+    asarray,
+    clip,
+    empty,
+    float64,
+    intp,
+    isnan,
+    memmap,
+    nan,
+    nan_to_num,
+    rint,
+    uint8,
+    unique,
+    zeros,
+)
+
+from cbgen.typing import DtypeLike
+
+__all__ = ["dosage_cache", "DOSAGE_TILE"]
+
+DOSAGE_TILE = (4096, 64)
+
+_MAGIC = b"cbgen dosage 01"
+_header = Struct("<QQQQ")
+_DATA_OFFSET = 4096
+_SCALE = 127
+_MISSING = 255
+
+
+class dosage_cache:
+    """
+    Sample-major cache of quantised dosages.
+
+    The variant-by-sample dosage matrix is split into tiles of
+    ``tile[0]`` variants by ``tile[1]`` samples. Tiles are stored on disk
+    grouped by sample block, and each tile holds one row of variants per
+    sample, so that reading every variant of a few samples only touches the
+    rows of those samples in the tiles of their sample blocks.
+
+    Dosages are stored in one byte with a resolution of ``1/127``, which
+    covers dosages from ``0`` to ``2``. Larger dosages are clipped.
+
+    Parameters
+    ----------
+    filepath
+        Cache file path.
+
+    Raises
+    ------
+    RuntimeError
+        If the file is not a dosage cache.
+    """
+
+    def __init__(self, filepath: Union[str, Path]):
+        self._filepath = Path(filepath)
+        with open(self._filepath, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise RuntimeError(f"{filepath} is not a dosage cache.")
+            data = f.read(_header.size)
+        if len(data) != _header.size:
+            raise RuntimeError(f"{filepath} is not a dosage cache.")
+
+        nvariants, nsamples, tile_variants, tile_samples = _header.unpack(data)
+        self._nvariants = nvariants
+        self._nsamples = nsamples
+        self._tile = (tile_variants, tile_samples)
+        self._tiles = _tiles(
+            self._filepath, "r", _shape(nvariants, nsamples, self._tile)
+        )
+
+    @property
+    def nvariants(self) -> int:
+        """
+        Number of variants.
+        """
+        return self._nvariants
+
+    @property
+    def nsamples(self) -> int:
+        """
+        Number of samples.
+        """
+        return self._nsamples
+
+    @property
+    def tile(self) -> Tuple[int, int]:
+        """
+        Number of variants and number of samples per tile.
+        """
+        return self._tile
+
+    def read(self, samples: Sequence[int]) -> DtypeLike:
+        """
+        Read the dosages of every variant for the given samples.
+
+        Parameters
+        ----------
+        samples
+            Sample indices.
+
+        Returns
+        -------
+        Variant-by-sample dosage matrix, with NaN for missing genotypes.
+
+        Raises
+        ------
+        ValueError
+            If a sample index is out of range.
+        """
+        samples = asarray(samples, dtype=intp).ravel()
+        if samples.size > 0 and (samples.min() < 0 or samples.max() >= self.nsamples):
+            raise ValueError("Sample index out of range.")
+
+        tile_samples = self._tile[1]
+        dosage = empty((self.nvariants, samples.size), dtype=float64)
+        for s in unique(samples):
+            q = self._tiles[s // tile_samples, :, s % tile_samples, :].ravel()
+            column = q[: self.nvariants] / _SCALE
+            column[q[: self.nvariants] == _MISSING] = nan
+            dosage[:, samples == s] = column[:, None]
+        return dosage
+
+    def close(self):
+        """
+        Release the memory map.
+        """
+        self._tiles = None
+
+    def __enter__(self) -> dosage_cache:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @staticmethod
+    def create(
+        filepath: Union[str, Path],
+        nsamples: int,
+        offsets: DtypeLike,
+        read_dosage: Callable[[DtypeLike], DtypeLike],
+        tile: Tuple[int, int] = DOSAGE_TILE,
+    ):
+        """
+        Create a dosage cache.
+
+        Parameters
+        ----------
+        filepath
+            Cache file path.
+        nsamples
+            Number of samples.
+        offsets
+            Genotype offsets of the variants.
+        read_dosage
+            Function that reads the variant-by-sample dosage matrix of the
+            given genotype offsets.
+        tile
+            Number of variants and number of samples per tile.
+        """
+        nvariants = len(offsets)
+        tile = (max(int(tile[0]), 1), max(int(tile[1]), 1))
+        shape = _shape(nvariants, nsamples, tile)
+
+        with open(filepath, "wb") as f:
+            f.write(_MAGIC)
+            f.write(_header.pack(nvariants, nsamples, tile[0], tile[1]))
+
+        tiles = _tiles(filepath, "r+", shape)
+
+        # Decode a bounded number of dosages at a time, whatever the number of
+        # samples is.
+        step = max(1, min(tile[0], (1 << 24) // max(nsamples, 1)))
+        padded = zeros((step, shape[0] * tile[1]), dtype=uint8)
+        for block in range(shape[1]):
+            first = block * tile[0]
+            last = min(first + tile[0], nvariants)
+            for start in range(first, last, step):
+                stop = min(start + step, last)
+                dosage = read_dosage(offsets[start:stop])
+                q = padded[: stop - start]
+                q[:, :nsamples] = rint(clip(nan_to_num(dosage), 0, 2) * _SCALE)
+                q[:, :nsamples][isnan(dosage)] = _MISSING
+
+                q = q.reshape(stop - start, shape[0], tile[1]).transpose(1, 2, 0)
+                tiles[:, block, :, start - first : stop - first] = q
+
+        if isinstance(tiles, memmap):
+            tiles.flush()
+
+
+def _shape(
+    nvariants: int, nsamples: int, tile: Tuple[int, int]
+) -> Tuple[int, int, int, int]:
+    return (
+        -(-nsamples // tile[1]),
+        -(-nvariants // tile[0]),
+        tile[1],
+        tile[0],
+    )
+
+
+def _tiles(filepath: Union[str, Path], mode: str, shape: Tuple[int, ...]) -> DtypeLike:
+    if prod(shape) == 0:
+        return zeros(shape, dtype=uint8)
+    return memmap(filepath, dtype=uint8, mode=mode, offset=_DATA_OFFSET, shape=shape)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+from pathlib import Path
+from struct import Struct
+from typing import BinaryIO, List, Optional, Sequence, Tuple, Union
+
+from numpy import asarray, searchsorted, uint64
+
+from ._bgen_file import bgen_file, estimate_best_npartitions
+from ._bgen_metafile import bgen_metafile
+from ._format import genotype_size, read_header, read_variant
+from ._metafile_writer import metafile_writer
+
+__all__ = ["extract"]
+
+_u32 = Struct("<I")
+
+
+def extract(
+    src: Union[str, Path],
+    dst: Union[str, Path],
+    variant_offsets: Sequence[int],
+    metafile: Optional[Union[str, Path]] = None,
+):
+    """
+    Extract variants into a new BGEN file without decoding them.
+
+    Variants are copied byte for byte, so genotype blocks are neither
+    decompressed nor compressed again, and runs of consecutive variants are
+    copied in bulk. The header and sample blocks of the source file are kept,
+    with the number of variants updated. The metafile of the new BGEN file is
+    written alongside it, with the suffix ``.metafile`` appended to its path.
+
+    >>> import cbgen
+    >>> from pathlib import Path
+    >>> from tempfile import TemporaryDirectory
+    >>>
+    >>> src = cbgen.example.get("haplotypes.bgen")
+    >>> with cbgen.bgen_metafile(cbgen.example.get("haplotypes.bgen.metafile")) as mf:
+    ...     offsets = mf.read_offsets()
+    >>> tmp = TemporaryDirectory()
+    >>> dst = Path(tmp.name) / "subset.bgen"
+    >>> cbgen.extract(src, dst, offsets[[3, 1]])
+    >>> with cbgen.bgen_file(dst) as bgen:
+    ...     print(bgen.read_variants().rsid)
+    [b'RS4' b'RS2']
+    >>> tmp.cleanup()
+
+    Parameters
+    ----------
+    src
+        Source BGEN file path.
+    dst
+        Destination BGEN file path.
+    variant_offsets
+        Genotype offsets of the variants to extract, in the order they are to
+        be written.
+    metafile
+        Metafile of the source BGEN file. Defaults to the metafile given by
+        :meth:`cbgen.bgen_file.open_metafile`.
+
+    Raises
+    ------
+    ValueError
+        If an offset is not the genotype offset of a variant.
+    RuntimeError
+        If a file stream reading error occurs.
+    """
+    if metafile is None:
+        with bgen_file(src) as bgen:
+            mf = bgen.open_metafile()
+    else:
+        mf = bgen_metafile(metafile)
+
+    with mf:
+        offsets = mf.read_offsets()
+
+    selected = asarray(variant_offsets, dtype=uint64).ravel()
+    index = searchsorted(offsets, selected)
+    valid = index < len(offsets)
+    valid[valid] = offsets[index[valid]] == selected[valid]
+    if not valid.all():
+        offset = int(selected[~valid][0])
+        raise ValueError(f"Invalid variant offset {offset}.")
+
+    dst = Path(dst)
+    writer = metafile_writer(dst.with_name(dst.name + ".metafile"))
+    try:
+        with open(src, "rb") as stream, open(dst, "wb") as out:
+            header = read_header(stream)
+            stream.seek(0)
+            _copy(stream, out, header.variants_start)
+            out.seek(8)
+            out.write(_u32.pack(len(selected)))
+            out.seek(header.variants_start)
+
+            runs: List[Tuple[int, int]] = []
+            position = header.variants_start
+            previous = -1
+            end = header.variants_start
+            for i in index.tolist():
+                if i != previous + 1:
+                    end = header.variants_start
+                    if i > 0:
+                        stream.seek(int(offsets[i - 1]))
+                        end = int(offsets[i - 1]) + genotype_size(stream, header)
+                start = end
+
+                stream.seek(start)
+                rec = read_variant(stream, header)
+                end = rec.offset + genotype_size(stream, header)
+                rec.offset += position - start
+                writer.write(rec)
+                position += end - start
+                previous = i
+
+                if runs and runs[-1][1] == start:
+                    runs[-1] = (runs[-1][0], end)
+                else:
+                    runs.append((start, end))
+
+            for start, end in runs:
+                stream.seek(start)
+                _copy(stream, out, end - start)
+    except Exception:
+        writer.abort()
+        raise
+
+    writer.close(estimate_best_npartitions(writer.nvariants))
+
+
+def _copy(src: BinaryIO, dst: BinaryIO, size: int):
+    while size > 0:
+        chunk = src.read(min(size, 1 << 20))
+        if not chunk:
+            raise RuntimeError("Unexpected end of BGEN file.")
+        dst.write(chunk)
+        size -= len(chunk)
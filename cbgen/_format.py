@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from struct import Struct
+from typing import BinaryIO, List
+
+__all__ = [
+    "Header",
+    "VariantRecord",
+    "genotype_size",
+    "read_header",
+    "read_variant",
+    "skip_genotype",
+    "skip_variant",
+]
+
+_u16 = Struct("<H")
+_u32 = Struct("<I")
+_u32x2 = Struct("<II")
+_u32u16 = Struct("<IH")
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+
+@dataclass
+class Header:
+    """
+    BGEN header block.
+
+    Attributes
+    ----------
+    nvariants
+        Number of variants.
+    nsamples
+        Number of samples.
+    compression
+        Genotype block compression: 0 (none), 1 (zlib), or 2 (zstd).
+    layout
+        Genotype block layout: 1 or 2.
+    contain_samples
+        Whether sample identifiers are stored.
+    variants_start
+        File position of the first variant.
+    """
+
+    nvariants: int
+    nsamples: int
+    compression: int
+    layout: int
+    contain_samples: bool
+    variants_start: int
+
+
+@dataclass
+class VariantRecord:
+    """
+    Variant identifying data as stored in a BGEN file.
+
+    Attributes
+    ----------
+    offset
+        Genotype block offset.
+    id
+        Identification.
+    rsid
+        Reference SNP cluster ID.
+    chromosome
+        Chromosome.
+    position
+        Position.
+    allele_ids
+        Allele identifications.
+    """
+
+    offset: int
+    id: bytes
+    rsid: bytes
+    chromosome: bytes
+    position: int
+    allele_ids: List[bytes]
+
+
+def read_header(stream: BinaryIO) -> Header:
+    """
+    Read the header block of a BGEN file.
+
+    The stream is left positioned at the first variant.
+    """
+    stream.seek(0)
+    offset, header_length = _u32x2.unpack(_read(stream, 8))
+    nvariants, nsamples = _u32x2.unpack(_read(stream, 8))
+    if _read(stream, 4) not in (b"bgen", b"\0\0\0\0"):
+        raise RuntimeError("Invalid BGEN magic number.")
+
+    stream.seek(header_length)
+    (flags,) = _u32.unpack(_read(stream, 4))
+
+    variants_start = offset + 4
+    stream.seek(variants_start)
+
+    return Header(
+        nvariants=nvariants,
+        nsamples=nsamples,
+        compression=flags & 3,
+        layout=(flags >> 2) & 15,
+        contain_samples=bool(flags >> 31),
+        variants_start=variants_start,
+    )
+
+
+def read_variant(stream: BinaryIO, header: Header) -> VariantRecord:
+    """
+    Read the identifying data of the variant at the stream position.
+
+    The stream is left positioned at the variant genotype block.
+    """
+    if header.layout == 1:
+        stream.seek(4, 1)
+
+    vid = _read_str16(stream)
+    rsid = _read_str16(stream)
+    chrom = _read_str16(stream)
+
+    if header.layout == 1:
+        (position,) = _u32.unpack(_read(stream, 4))
+        nalleles = 2
+    else:
+        position, nalleles = _u32u16.unpack(_read(stream, 6))
+
+    allele_ids = [_read_str32(stream) for _ in range(nalleles)]
+    return VariantRecord(stream.tell(), vid, rsid, chrom, position, allele_ids)
+
+
+def genotype_size(stream: BinaryIO, header: Header) -> int:
+    """
+    Size in bytes of the genotype block at the stream position.
+
+    The stream position is not changed.
+    """
+    if header.layout == 1 and header.compression == COMPRESSION_NONE:
+        return 6 * header.nsamples
+
+    (size,) = _u32.unpack(_read(stream, 4))
+    stream.seek(-4, 1)
+    return 4 + size
+
+
+def skip_genotype(stream: BinaryIO, header: Header):
+    """
+    Move the stream past the genotype block at the stream position.
+    """
+    stream.seek(genotype_size(stream, header), 1)
+
+
+def skip_variant(stream: BinaryIO, header: Header):
+    """
+    Move the stream past the variant at the stream position.
+    """
+    read_variant(stream, header)
+    skip_genotype(stream, header)
+
+
+def _read(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise RuntimeError("Unexpected end of BGEN file.")
+    return data
+
+
+def _read_str16(stream: BinaryIO) -> bytes:
+    (length,) = _u16.unpack(_read(stream, 2))
+    return _read(stream, length)
+
+
+def _read_str32(stream: BinaryIO) -> bytes:
+    (length,) = _u32.unpack(_read(stream, 4))
+    return _read(stream, length)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from queue import SimpleQueue
+from typing import Optional, Sequence, Union
+
+from numpy import add, empty, float32, float64, isnan, matmul, nan, zeros
+
+from cbgen.typing import DtypeLike
+
+from ._bgen_file import bgen_file
+from ._bgen_metafile import bgen_metafile
+
+__all__ = ["grm"]
+
+
+def grm(
+    bgen: Union[bgen_file, str, Path],
+    metafile: Optional[Union[str, Path, bgen_metafile]] = None,
+    samples: Optional[Sequence[int]] = None,
+    block_variants: int = 1024,
+    nthreads: int = 1,
+    dtype: DtypeLike = float64,
+) -> DtypeLike:
+    """
+    Genomic relationship matrix.
+
+    It computes ``X Xᵀ / M`` for the sample-by-variant matrix ``X`` of
+    standardised dosages of the ``M`` biallelic variants that vary across
+    the samples. Each variant is standardised to zero mean and unit variance
+    after its missing genotypes are imputed by its mean dosage. Dosages are
+    decoded in blocks of ``block_variants`` variants, by ``nthreads`` threads
+    with a file handle each, and each block is accumulated into the result by
+    a matrix product. Besides the result, only a few blocks are held in
+    memory at once.
+
+    >>> import cbgen
+    >>>
+    >>> filepath = cbgen.example.get("haplotypes.bgen")
+    >>> print(cbgen.grm(filepath))
+    [[ 1.  -0.5  0.  -0.5]
+     [-0.5  1.  -0.5  0. ]
+     [ 0.  -0.5  1.  -0.5]
+     [-0.5  0.  -0.5  1. ]]
+
+    Parameters
+    ----------
+    bgen
+        BGEN file, or its file path.
+    metafile
+        Metafile, or its file path. Defaults to the metafile given by
+        :meth:`cbgen.bgen_file.open_metafile`.
+    samples
+        Sample indices. Defaults to every sample.
+    block_variants
+        Number of variants per block. Defaults to ``1024``.
+    nthreads
+        Number of threads decoding blocks. Defaults to ``1``.
+    dtype
+        Data type of the computation and of the result: ``float64`` (default)
+        or ``float32``.
+
+    Returns
+    -------
+    Sample-by-sample relationship matrix, filled with NaN if no variant
+    varies across the samples.
+
+    Raises
+    ------
+    ValueError
+        If a variant is not biallelic, a sample index is out of range, or an
+        option is invalid.
+    RuntimeError
+        If a file stream reading error occurs.
+    """
+    if isinstance(bgen, (str, Path)):
+        with bgen_file(bgen) as bgen:
+            return grm(bgen, metafile, samples, block_variants, nthreads, dtype)
+
+    if dtype == float64:
+        precision = 64
+    elif dtype == float32:
+        precision = 32
+    else:
+        raise ValueError("Data type should be either float64 or float32.")
+
+    if block_variants < 1:
+        raise ValueError("Number of variants per block should be positive.")
+
+    if nthreads < 1:
+        raise ValueError("Number of threads should be positive.")
+
+    if metafile is None:
+        mf = bgen.open_metafile()
+    elif isinstance(metafile, bgen_metafile):
+        mf = metafile
+    else:
+        mf = bgen_metafile(metafile)
+    try:
+        offsets = mf.read_offsets()
+    finally:
+        if mf is not metafile:
+            mf.close()
+
+    n = bgen.nsamples if samples is None else len(samples)
+    starts = range(0, len(offsets), block_variants)
+    result = zeros((n, n), dtype=dtype)
+    product = empty((n, n), dtype=dtype)
+    nvariants = 0
+
+    def accumulate(block: DtypeLike):
+        nonlocal nvariants
+        # Variants without variance have NaN standardised dosages.
+        if n > 0:
+            block = block[~isnan(block[:, 0])]
+        nvariants += block.shape[0]
+        matmul(block.T, block, out=product)
+        add(result, product, out=result)
+
+    if nthreads == 1:
+        for start in starts:
+            stop = start + block_variants
+            accumulate(bgen.read_dosage(offsets[start:stop], samples, precision, True))
+    else:
+        handles: SimpleQueue = SimpleQueue()
+        opened = [bgen_file(bgen.source) for _ in range(nthreads)]
+        for handle in opened:
+            handles.put(handle)
+
+        def read(start: int) -> DtypeLike:
+            handle = handles.get()
+            try:
+                stop = start + block_variants
+                return handle.read_dosage(offsets[start:stop], samples, precision, True)
+            finally:
+                handles.put(handle)
+
+        try:
+            with ThreadPoolExecutor(nthreads) as executor:
+                pending: deque = deque()
+                for start in starts:
+                    pending.append(executor.submit(read, start))
+                    if len(pending) > nthreads:
+                        accumulate(pending.popleft().result())
+                while pending:
+                    accumulate(pending.popleft().result())
+        finally:
+            for handle in opened:
+                handle.close()
+
+    if nvariants == 0:
+        result[:] = nan
+    else:
+        # Rows of unit norm are scaled to unit variance.
+        result *= n / nvariants
+    return result
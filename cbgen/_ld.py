@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+from numpy import asarray, clip, empty, float32, float64, uint64
+
+from cbgen.typing import DtypeLike
+
+from ._bgen_file import bgen_file
+
+__all__ = ["ld_matrix"]
+
+
+def ld_matrix(
+    bgen: Union[bgen_file, str, Path],
+    offsets: Sequence[int],
+    samples: Optional[Sequence[int]] = None,
+    dtype: DtypeLike = float32,
+    tile: Optional[int] = None,
+) -> DtypeLike:
+    """
+    Pairwise linkage disequilibrium between variants, as squared correlations.
+
+    The correlation of two variants is the Pearson correlation of their
+    dosages, with missing genotypes imputed by the mean dosage of their
+    variant. Dosages are decoded and standardised in tiles of ``tile``
+    variants, and each tile of the LD matrix is the product of two tiles of
+    standardised dosages. Only two tiles of dosages are held in memory at
+    once, which bounds the memory used, besides the LD matrix itself, to
+    ``2 * tile * len(samples)`` values. Smaller tiles use less memory at the
+    cost of decoding variants more than once.
+
+    Variants without variance have NaN squared correlations.
+
+    >>> import cbgen
+    >>>
+    >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+    ...     with bgen.open_metafile() as mf:
+    ...         offsets = mf.read_offsets()
+    ...     print(cbgen.ld_matrix(bgen, offsets[:3]).round(4))
+    [[1.   0.25 0.  ]
+     [0.25 1.   0.25]
+     [0.   0.25 1.  ]]
+
+    Parameters
+    ----------
+    bgen
+        BGEN file, or its file path.
+    offsets
+        Genotype offsets of the biallelic variants.
+    samples
+        Sample indices. Defaults to every sample.
+    dtype
+        Data type of the computation and of the result: ``float32`` (default)
+        or ``float64``.
+    tile
+        Number of variants per tile. Defaults to every variant in one tile.
+
+    Returns
+    -------
+    Variant-by-variant matrix of squared correlations.
+
+    Raises
+    ------
+    ValueError
+        If a variant is not biallelic, a sample index is out of range, or the
+        data type is not supported.
+    RuntimeError
+        If invalid offset of or a file stream reading error occurs.
+    """
+    if isinstance(bgen, (str, Path)):
+        with bgen_file(bgen) as bgen:
+            return ld_matrix(bgen, offsets, samples, dtype, tile)
+
+    if dtype == float32:
+        precision = 32
+    elif dtype == float64:
+        precision = 64
+    else:
+        raise ValueError("Data type should be either float32 or float64.")
+
+    offsets = asarray(offsets, dtype=uint64).ravel()
+    n = offsets.size
+    tile = n if tile is None else int(tile)
+    if tile < 1:
+        raise ValueError("Tile size should be positive.")
+
+    def read(start: int) -> DtypeLike:
+        stop = min(start + tile, n)
+        return bgen.read_dosage(offsets[start:stop], samples, precision, True)
+
+    r2 = empty((n, n), dtype=dtype)
+    for i in range(0, n, tile):
+        left = read(i)
+        for j in range(i, n, tile):
+            right = left if j == i else read(j)
+            block = r2[i : i + tile, j : j + tile]
+            block[:] = left @ right.T
+            block **= 2
+            r2[j : j + tile, i : i + tile] = block.T
+
+    return clip(r2, 0, 1, out=r2)
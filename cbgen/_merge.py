@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Sequence, Union
+
+from ._bgen_file import estimate_best_npartitions
+from ._format import read_header
+from ._metafile_writer import (
+    iter_records,
+    metafile_writer,
+    read_metafile_header,
+    shift_record,
+)
+
+__all__ = ["merge_metafiles"]
+
+
+def merge_metafiles(
+    filepath: Union[str, Path],
+    metafiles: Sequence[Union[str, Path]],
+    bgen_filepaths: Sequence[Union[str, Path]],
+):
+    """
+    Merge the metafiles of concatenated BGEN files.
+
+    The concatenated BGEN file is assumed to consist of the header and sample
+    blocks of the first BGEN file (with the number of variants updated)
+    followed by the variants of every BGEN file in the given order. Genotype
+    offsets are shifted accordingly, so no BGEN file has to be scanned.
+
+    Parameters
+    ----------
+    filepath
+        Merged metafile file path.
+    metafiles
+        Metafile file paths, one per BGEN file.
+    bgen_filepaths
+        File paths of the BGEN files before concatenation.
+
+    Raises
+    ------
+    ValueError
+        If the BGEN files cannot be concatenated.
+    RuntimeError
+        If a file stream reading error occurs.
+    """
+    if len(metafiles) != len(bgen_filepaths):
+        raise ValueError("There must be one metafile per BGEN file.")
+
+    writer = metafile_writer(filepath)
+
+    try:
+        first = None
+        start = 0
+        for mfilepath, bfilepath in zip(metafiles, bgen_filepaths):
+            with open(bfilepath, "rb") as stream:
+                header = read_header(stream)
+
+            if first is None:
+                first = header
+                start = header.variants_start
+            elif (header.nsamples, header.layout, header.compression) != (
+                first.nsamples,
+                first.layout,
+                first.compression,
+            ):
+                raise ValueError(f"BGEN file {bfilepath} cannot be concatenated.")
+
+            shift = start - header.variants_start
+            with open(mfilepath, "rb") as f:
+                nvariants, _ = read_metafile_header(f)
+                for rec in iter_records(f, nvariants):
+                    writer.write_raw(shift_record(rec, shift))
+
+            start += os.path.getsize(bfilepath) - header.variants_start
+    except Exception:
+        writer.abort()
+        raise
+
+    writer.close(estimate_best_npartitions(writer.nvariants))
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import os
+from array import array
+from pathlib import Path
+from struct import Struct
+from typing import BinaryIO, Iterator, List, Tuple, Union
+
+from ._format import VariantRecord
+
+__all__ = [
+    "metafile_writer",
+    "encode_record",
+    "iter_records",
+    "metafile_header_size",
+    "read_metafile_header",
+    "read_partition_bounds",
+    "record_offset",
+    "shift_record",
+]
+
+SIGNATURE = b"bgen index 04"
+COLUMNAR_SIGNATURE = b"bgen index 05"
+
+_u16 = Struct("<H")
+_u32 = Struct("<I")
+_u64 = Struct("<Q")
+_header = Struct("<IIQ")
+_fixed = Struct("<IH")
+
+
+def encode_record(rec: VariantRecord) -> bytes:
+    """
+    Encode variant identifying data as a metafile record.
+    """
+    parts = [_u64.pack(rec.offset)]
+    for s in (rec.id, rec.rsid, rec.chromosome):
+        parts += [_u16.pack(len(s)), s]
+    parts.append(_fixed.pack(rec.position, len(rec.allele_ids)))
+    for s in rec.allele_ids:
+        parts += [_u32.pack(len(s)), s]
+    return b"".join(parts)
+
+
+def read_metafile_header(stream: BinaryIO) -> Tuple[int, int]:
+    """
+    Read the header of a metafile.
+
+    The stream is left positioned at the first record.
+
+    Returns
+    -------
+    Number of variants and number of partitions.
+    """
+    stream.seek(0)
+    if stream.read(len(SIGNATURE)) != SIGNATURE:
+        raise RuntimeError("Unrecognized metafile signature.")
+    data = stream.read(_header.size)
+    if len(data) != _header.size:
+        raise RuntimeError("Unexpected end of metafile.")
+    nvariants, npartitions, _ = _header.unpack(data)
+    stream.seek(8 * npartitions, 1)
+    return nvariants, npartitions
+
+
+def metafile_header_size(npartitions: int) -> int:
+    """
+    Size in bytes of the header of a metafile, partition table included.
+    """
+    return len(SIGNATURE) + _header.size + 8 * npartitions
+
+
+def read_partition_bounds(stream: BinaryIO) -> List[int]:
+    """
+    Read the file position of every partition of a metafile.
+
+    Returns
+    -------
+    Start of every partition, followed by the end of the last one.
+    """
+    stream.seek(len(SIGNATURE))
+    _, npartitions, size = _header.unpack(stream.read(_header.size))
+    table = Struct(f"<{npartitions}Q")
+    data = stream.read(table.size)
+    if len(data) != table.size:
+        raise RuntimeError("Unexpected end of metafile.")
+    return list(table.unpack(data)) + [metafile_header_size(npartitions) + size]
+
+
+def iter_records(stream: BinaryIO, nrecords: int) -> Iterator[bytes]:
+    """
+    Iterate over raw metafile records starting at the stream position.
+    """
+    for _ in range(nrecords):
+        parts = [_read(stream, 8)]
+        for _ in range(3):
+            length = _read(stream, 2)
+            parts += [length, _read(stream, _u16.unpack(length)[0])]
+        fixed = _read(stream, 6)
+        parts.append(fixed)
+        for _ in range(_fixed.unpack(fixed)[1]):
+            length = _read(stream, 4)
+            parts += [length, _read(stream, _u32.unpack(length)[0])]
+        yield b"".join(parts)
+
+
+def _read(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise RuntimeError("Unexpected end of metafile.")
+    return data
+
+
+def record_offset(rec: bytes) -> int:
+    """
+    Genotype block offset of a raw metafile record.
+    """
+    return _u64.unpack_from(rec)[0]
+
+
+def shift_record(rec: bytes, shift: int) -> bytes:
+    """
+    Add ``shift`` to the genotype block offset of a raw metafile record.
+    """
+    return _u64.pack(record_offset(rec) + shift) + rec[8:]
+
+
+class metafile_writer:
+    """
+    Metafile writer.
+
+    Records are appended to a spool file next to the metafile, which is only
+    assembled (atomically) by :meth:`close`. This allows records to be
+    written before the number of variants is known and writing to be resumed
+    from a spool left by a previous run.
+
+    Parameters
+    ----------
+    filepath
+        Metafile file path.
+    resume
+        Number of records to keep from an existing spool file. Records after
+        it are discarded. If the spool file holds fewer records, all of them
+        are discarded, which :attr:`nvariants` tells. Defaults to ``0``.
+    """
+
+    def __init__(self, filepath: Union[str, Path], resume: int = 0):
+        self._filepath = Path(filepath)
+        self._positions = array("Q")
+        spool = spool_filepath(self._filepath)
+
+        if resume > 0 and spool.exists():
+            self._spool = open(spool, "r+b")
+            try:
+                for rec in iter_records(self._spool, resume):
+                    self._positions.append(self._spool.tell() - len(rec))
+            except RuntimeError:
+                self._positions = array("Q")
+                self._spool.seek(0)
+            self._spool.truncate()
+        else:
+            self._spool = open(spool, "w+b")
+
+    @property
+    def nvariants(self) -> int:
+        """
+        Number of records written so far.
+        """
+        return len(self._positions)
+
+    def write(self, rec: VariantRecord):
+        """
+        Append a variant record.
+        """
+        self.write_raw(encode_record(rec))
+
+    def write_raw(self, rec: bytes):
+        """
+        Append a raw metafile record.
+        """
+        self._positions.append(self._spool.tell())
+        self._spool.write(rec)
+
+    def flush(self):
+        """
+        Flush the spool file to disk.
+        """
+        self._spool.flush()
+
+    def close(self, npartitions: int):
+        """
+        Assemble the metafile and remove the spool file.
+
+        Parameters
+        ----------
+        npartitions
+            Number of partitions.
+        """
+        nvariants = self.nvariants
+        size = self._spool.tell()
+        part_size = -(-nvariants // npartitions)
+        start = len(SIGNATURE) + _header.size + 8 * npartitions
+
+        tmp = self._filepath.with_name(self._filepath.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(SIGNATURE)
+            f.write(_header.pack(nvariants, npartitions, size))
+            for i in range(npartitions):
+                j = i * part_size
+                pos = self._positions[j] if j < nvariants else size
+                f.write(_u64.pack(start + pos))
+            self._spool.seek(0)
+            while True:
+                chunk = self._spool.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+
+        os.replace(tmp, self._filepath)
+        self.abort()
+
+    def abort(self):
+        """
+        Discard the spool file.
+        """
+        if not self._spool.closed:
+            self._spool.close()
+        spool_filepath(self._filepath).unlink(missing_ok=True)
+
+
+def spool_filepath(filepath: Path) -> Path:
+    return filepath.with_name(filepath.name + ".records")
@@ -0,0 +1,366 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from struct import Struct
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+from cbgen.typing import RangeReader
+
+from . import _cache
+from ._cache import file_lock, local_path
+
+if TYPE_CHECKING:
+    from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["block_cache", "http_reader", "open_remote"]
+
+BLOCK_SIZE = 1 << 20
+MAX_RUN_BLOCKS = 16
+
+_u64 = Struct("<Q")
+
+
+class http_reader:
+    """
+    Byte-range reader of a file served over HTTP or HTTPS.
+
+    Byte ranges are requested with the ``Range`` header, which object stores
+    and most HTTP servers support. The file size, entity tag, and modification
+    time are requested once, by a ``HEAD`` request. The query string of the
+    URL, which carries the signature of presigned object store URLs, is left
+    out of the content key.
+
+    Parameters
+    ----------
+    url
+        File URL.
+    headers
+        Extra request headers, such as credentials.
+    timeout
+        Seconds to wait for a response. Defaults to ``60``.
+
+    Raises
+    ------
+    RuntimeError
+        If the file cannot be reached.
+    """
+
+    def __init__(
+        self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 60
+    ):
+        # Imported on use, so that importing the package does not load them.
+        from urllib.request import Request, urlopen
+
+        self._url = url
+        self._headers = dict(headers or {})
+        self._timeout = timeout
+
+        request = Request(url, headers=self._headers, method="HEAD")
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                size = response.headers.get("Content-Length")
+                etag = response.headers.get("ETag")
+                version = etag or response.headers.get("Last-Modified") or ""
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Could not reach {url}.") from e
+
+        if size is None:
+            raise RuntimeError(f"Could not find the size of {url}.")
+
+        self._size = int(size)
+        base = urlunsplit(urlsplit(url)._replace(query="", fragment=""))
+        self._key = f"{base}\0{self._size}\0{version}"
+
+    @property
+    def url(self) -> str:
+        """
+        File URL.
+        """
+        return self._url
+
+    @property
+    def key(self) -> str:
+        """
+        Key identifying the file content.
+        """
+        return self._key
+
+    @property
+    def size(self) -> int:
+        """
+        File size in bytes.
+        """
+        return self._size
+
+    def read(self, start: int, stop: int) -> bytes:
+        """
+        Read the bytes from ``start`` up to, but excluding, ``stop``.
+
+        Raises
+        ------
+        RuntimeError
+            If the range cannot be read.
+        """
+        from urllib.request import Request, urlopen
+
+        if stop <= start:
+            return b""
+
+        headers = {**self._headers, "Range": f"bytes={start}-{stop - 1}"}
+        request = Request(self._url, headers=headers)
+        try:
+            with urlopen(request, timeout=self._timeout) as response:
+                if response.status != 206:
+                    raise RuntimeError(f"{self._url} does not serve byte ranges.")
+                data = response.read()
+        except (OSError, ValueError) as e:
+            msg = f"Could not read bytes {start} to {stop} of {self._url}."
+            raise RuntimeError(msg) from e
+
+        if len(data) != stop - start:
+            raise RuntimeError(f"Unexpected end of {self._url}.")
+        return data
+
+
+class block_cache:
+    """
+    Local copy of a remote file, filled block by block on demand.
+
+    The copy is a sparse file of the size of the remote file, kept together
+    with a map of the blocks fetched so far. It is shared by every handle and
+    process opening the same remote file, and survives them. Missing blocks of
+    the requested ranges are coalesced into range requests of up to 16 blocks,
+    issued in parallel. Ranges are extended by a read-ahead margin, so that
+    buffered readers of the copy never buffer bytes not yet fetched.
+
+    >>> import cbgen
+    >>>
+    >>> class bytes_reader:
+    ...     def __init__(self, data):
+    ...         self.data = data
+    ...         self.key = "haplotypes"
+    ...         self.size = len(data)
+    ...
+    ...     def read(self, start, stop):
+    ...         return self.data[start:stop]
+    >>>
+    >>> with open(cbgen.example.get("haplotypes.bgen"), "rb") as f:
+    ...     reader = bytes_reader(f.read())
+    >>> with cbgen.block_cache(reader, block_size=64) as cache:
+    ...     with cbgen.bgen_file(cache) as bgen:
+    ...         print(bgen.read_samples())
+    [b'sample_0' b'sample_1' b'sample_2' b'sample_3']
+
+    Parameters
+    ----------
+    reader
+        Reader of the remote file.
+    filepath
+        File path of the local copy. Defaults to a file under
+        :data:`cbgen.BGEN_CACHE_HOME` named after the reader key.
+    block_size
+        Block size in bytes. Defaults to 1 MiB.
+    nthreads
+        Number of range requests issued in parallel. Defaults to ``8``.
+
+    Raises
+    ------
+    RuntimeError
+        If a range cannot be read.
+    """
+
+    def __init__(
+        self,
+        reader: RangeReader,
+        filepath: Optional[Union[str, Path]] = None,
+        block_size: int = BLOCK_SIZE,
+        nthreads: int = 8,
+    ):
+        if block_size < 1:
+            raise ValueError("Block size should be positive.")
+
+        if nthreads < 1:
+            raise ValueError("Number of threads should be positive.")
+
+        if filepath is None:
+            filepath = _cache.keyed_filepath("remote", reader.key, "remote")
+
+        self._reader = reader
+        self._size = reader.size
+        self._block_size = block_size
+        self._nthreads = nthreads
+        self._filepath = Path(filepath)
+        self._map_filepath = self._filepath.with_name(self._filepath.name + ".blocks")
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._fetched = bytearray(-(-self._size // block_size))
+
+        self._filepath.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self._filepath.with_name(self._filepath.name + ".lock")):
+            self._create()
+
+        self._data = open(self._filepath, "r+b")
+        self._map = open(self._map_filepath, "r+b")
+        self._margin = max(os.fstat(self._data.fileno()).st_blksize, 1 << 16)
+        self._refresh()
+
+    @property
+    def filepath(self) -> Path:
+        """
+        File path of the local copy.
+        """
+        return self._filepath
+
+    @property
+    def key(self) -> str:
+        """
+        Key identifying the file content.
+        """
+        return self._reader.key
+
+    @property
+    def size(self) -> int:
+        """
+        File size in bytes.
+        """
+        return self._size
+
+    def fetch(self, start: int, stop: int):
+        """
+        Make sure the bytes from ``start`` up to ``stop`` are in the copy.
+        """
+        self.fetch_ranges([(start, stop)])
+
+    def fetch_ranges(self, ranges: Iterable[Tuple[int, int]]):
+        """
+        Make sure the bytes of every ``(start, stop)`` range are in the copy.
+        """
+        missing = self._missing(ranges)
+        if not missing:
+            return
+
+        # Blocks might have been fetched by other handles in the meantime.
+        with self._lock:
+            self._refresh()
+        missing = [b for b in missing if not self._fetched[b]]
+
+        runs = _runs(missing)
+        if len(runs) <= 1 or self._nthreads == 1:
+            for first, last in runs:
+                self._fetch_run(first, last)
+        else:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._executor = ThreadPoolExecutor(self._nthreads)
+            futures = [self._executor.submit(self._fetch_run, *r) for r in runs]
+            for future in futures:
+                future.result()
+
+    def read(self, start: int, stop: int) -> bytes:
+        """
+        Read the bytes from ``start`` up to ``stop``, fetching them if needed.
+        """
+        self.fetch(start, stop)
+        with self._lock:
+            self._data.seek(start)
+            return self._data.read(stop - start)
+
+    def close(self):
+        """
+        Close the local copy.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if getattr(self, "_data", None) is not None:
+            self._data.close()
+            self._map.close()
+            self._data = None
+
+    def _create(self):
+        header = _u64.pack(self._block_size)
+        map_size = len(header) + len(self._fetched)
+
+        fresh = not self._filepath.exists()
+        if fresh or self._filepath.stat().st_size != self._size:
+            with open(self._filepath, "wb") as f:
+                f.truncate(self._size)
+            fresh = True
+
+        if not fresh and self._map_filepath.exists():
+            with open(self._map_filepath, "rb") as f:
+                if f.read(len(header)) == header and f.seek(0, 2) == map_size:
+                    return
+
+        with open(self._map_filepath, "wb") as f:
+            f.write(header)
+            f.truncate(map_size)
+
+    def _refresh(self):
+        self._map.seek(_u64.size)
+        self._map.readinto(self._fetched)
+
+    def _missing(self, ranges: Iterable[Tuple[int, int]]) -> List[int]:
+        bs = self._block_size
+        blocks = set()
+        for start, stop in ranges:
+            stop = min(stop + self._margin, self._size)
+            for b in range(start // bs, -(-stop // bs)):
+                if not self._fetched[b]:
+                    blocks.add(b)
+        return sorted(blocks)
+
+    def _fetch_run(self, first: int, last: int):
+        start = first * self._block_size
+        stop = min(last * self._block_size, self._size)
+        data = self._reader.read(start, stop)
+        if len(data) != stop - start:
+            raise RuntimeError("Unexpected end of remote file.")
+
+        with self._lock:
+            self._data.seek(start)
+            self._data.write(data)
+            self._data.flush()
+            # Blocks are marked only once their data is in the copy.
+            self._map.seek(_u64.size + first)
+            self._map.write(b"\1" * (last - first))
+            self._map.flush()
+            self._fetched[first:last] = b"\1" * (last - first)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self) -> block_cache:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def open_remote(
+    source: Union[str, Path, RangeReader, block_cache]
+) -> Optional[block_cache]:
+    """
+    Local copy of a remote file, or ``None`` for a local file path.
+    """
+    if isinstance(source, block_cache):
+        return source
+    if local_path(source) is not None:
+        return None
+    if isinstance(source, str):
+        source = http_reader(source)
+    return block_cache(source)
+
+
+def _runs(blocks: List[int]) -> List[Tuple[int, int]]:
+    runs: List[Tuple[int, int]] = []
+    for b in blocks:
+        if runs and runs[-1][1] == b and b - runs[-1][0] < MAX_RUN_BLOCKS:
+            runs[-1] = (runs[-1][0], b + 1)
+        else:
+            runs.append((b, b + 1))
+    return runs
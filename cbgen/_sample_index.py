@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Sequence, Union
+
+from numpy import argsort, asarray, empty, int64, load, minimum, savez, uint32, zeros
+
+from cbgen.typing import DtypeLike
+
+from ._cache import file_lock
+
+__all__ = ["sample_index"]
+
+
+class sample_index:
+    """
+    Sample name to sample index map.
+
+    Sample names are kept sorted alongside their original indices, so that a
+    batch of names is mapped with a single vectorised binary search.
+
+    Parameters
+    ----------
+    samples
+        Sample names in BGEN file order.
+    """
+
+    def __init__(self, samples: DtypeLike):
+        samples = asarray(samples)
+        order = argsort(samples, kind="stable").astype(uint32)
+        self._names = samples[order]
+        self._order = order
+
+    @classmethod
+    def load(cls, filepath: Union[str, Path]) -> sample_index:
+        """
+        Load a sample index saved by :meth:`save`.
+        """
+        index = cls.__new__(cls)
+        with load(filepath) as data:
+            index._names = data["names"]
+            index._order = data["order"]
+        return index
+
+    def save(self, filepath: Union[str, Path], overwrite: bool = False):
+        """
+        Save the sample index atomically.
+
+        The file is written while holding a file lock, so that concurrent
+        processes do not write it more than once. An existing file is kept
+        unless ``overwrite`` is ``True``, as it is to replace a corrupt one.
+        """
+        filepath = Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(filepath.with_name(filepath.name + ".lock")):
+            if filepath.exists() and not overwrite:
+                return
+            tmp = filepath.with_name(f"{filepath.name}.{os.getpid()}.tmp.npz")
+            try:
+                savez(tmp, names=self._names, order=self._order)
+                os.replace(tmp, filepath)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+    def indices(self, names: Sequence[Union[str, bytes]]) -> DtypeLike:
+        """
+        Map sample names to sample indices.
+
+        Parameters
+        ----------
+        names
+            Sample names, as ``str`` or ``bytes``.
+
+        Returns
+        -------
+        Sample indices.
+
+        Raises
+        ------
+        ValueError
+            If a sample name is not found.
+        """
+        names = _as_bytes(names)
+        if names.size == 0:
+            return empty(names.shape, dtype=int64)
+
+        n = self._names.shape[0]
+        pos = minimum(self._names.searchsorted(names), max(n - 1, 0))
+        found = self._names[pos] == names if n > 0 else zeros(names.shape, bool)
+        if not found.all():
+            missing = names[~found][0]
+            raise ValueError(f"Sample {bytes(missing)!r} not found.")
+        return self._order[pos].astype(int64)
+
+
+def _as_bytes(names) -> DtypeLike:
+    arr = asarray(names)
+    if arr.dtype.kind == "S" or arr.size == 0:
+        return arr
+    if arr.dtype.kind == "U" or arr.dtype == object:
+        return asarray(
+            [n.encode() if isinstance(n, str) else bytes(n) for n in arr.ravel()],
+            dtype=bytes,
+        ).reshape(arr.shape)
+    raise ValueError("Sample names must be strings or bytes.")
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import os
+from array import array
+from pathlib import Path
+from struct import Struct
+from typing import List, Optional, Union
+
+from ._cache import file_lock
+from ._format import VariantRecord, read_header, read_variant, skip_genotype
+from ._metafile_writer import metafile_writer
+
+__all__ = ["variant_index", "INDEX_STEP"]
+
+INDEX_STEP = 1024
+
+_MAGIC = b"cbgen checkpoint 01"
+_state = Struct("<QIIIQQ")
+
+
+class variant_index:
+    """
+    Sparse variant offset index built on the fly.
+
+    The file position of every ``step``-th variant is remembered as the BGEN
+    file is scanned, so that later reads only have to walk from the nearest
+    checkpoint. A metafile can be attached to have it built as a by-product of
+    the first pass through the file, in which case the scanning progress is
+    persisted at every checkpoint and picked up again by a later process.
+
+    Parameters
+    ----------
+    filepath
+        BGEN file path.
+    step
+        Number of variants between checkpoints.
+    """
+
+    def __init__(self, filepath: Union[str, Path], step: int = INDEX_STEP):
+        self._filepath = Path(filepath)
+        self._stream = open(self._filepath, "rb")
+        self._header = read_header(self._stream)
+        self._step = step
+        self._checkpoints = array("Q", [self._header.variants_start])
+        self._nscanned = 0
+        self._frontier = self._header.variants_start
+        self._writer: Optional[metafile_writer] = None
+        self._metafile: Optional[Path] = None
+        self._lock: Optional[file_lock] = None
+        self._npartitions = 0
+
+    @property
+    def nvariants(self) -> int:
+        """
+        Number of variants.
+        """
+        return self._header.nvariants
+
+    @property
+    def nscanned(self) -> int:
+        """
+        Number of variants scanned in sequence from the first one.
+        """
+        return self._nscanned
+
+    def attach_metafile(self, filepath: Union[str, Path], npartitions: int):
+        """
+        Build a metafile as a by-product of the first pass.
+
+        Progress left by a previous attachment to the same metafile is resumed,
+        unless its spool file has lost records, in which case the metafile is
+        built again from the first variant. The metafile is not attached if it
+        is being built by another handle.
+
+        Parameters
+        ----------
+        filepath
+            Metafile file path.
+        npartitions
+            Number of partitions.
+        """
+        filepath = Path(filepath)
+        lock = file_lock(filepath.with_name(filepath.name + ".lock"))
+        if not lock.acquire(blocking=False):
+            return
+
+        self._lock = lock
+        self._metafile = filepath
+        self._npartitions = npartitions
+
+        state = self._load_state()
+        if state is not None:
+            nscanned, frontier, checkpoints = state
+            self._writer = metafile_writer(self._metafile, resume=nscanned)
+            if self._writer.nvariants == nscanned:
+                self._nscanned, self._frontier = nscanned, frontier
+                self._checkpoints = checkpoints
+            else:
+                state = None
+
+        if state is None:
+            state_filepath(self._metafile).unlink(missing_ok=True)
+            self._nscanned = 0
+            self._frontier = self._header.variants_start
+            self._checkpoints = array("Q", [self._header.variants_start])
+            self._writer = metafile_writer(self._metafile)
+
+        if self._nscanned == self.nvariants:
+            self._finish()
+
+    def read(self, start: int, stop: int) -> List[VariantRecord]:
+        """
+        Read variant identifying data.
+
+        Parameters
+        ----------
+        start
+            Index of the first variant.
+        stop
+            One past the index of the last variant.
+
+        Returns
+        -------
+        Variant records.
+        """
+        if not (0 <= start <= stop <= self.nvariants):
+            raise ValueError(f"Invalid variant range [{start}, {stop}).")
+
+        records: List[VariantRecord] = []
+        header = self._header
+        stream = self._stream
+
+        if start < self._nscanned:
+            k = start // self._step
+            stream.seek(self._checkpoints[k])
+            for _ in range(start - k * self._step):
+                read_variant(stream, header)
+                skip_genotype(stream, header)
+            end = min(stop, self._nscanned)
+            for _ in range(start, end):
+                records.append(read_variant(stream, header))
+                skip_genotype(stream, header)
+            start = end
+
+        if start < stop:
+            stream.seek(self._frontier)
+            while self._nscanned < stop:
+                rec = read_variant(stream, header)
+                skip_genotype(stream, header)
+                if self._nscanned >= start:
+                    records.append(rec)
+                self._advance(rec, stream.tell())
+
+        return records
+
+    def close(self):
+        """
+        Close file streams, keeping the progress of an attached metafile.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+            self._writer = None
+        self._release()
+        self._stream.close()
+
+    def _advance(self, rec: VariantRecord, frontier: int):
+        if self._writer is not None:
+            self._writer.write(rec)
+
+        self._nscanned += 1
+        self._frontier = frontier
+
+        if self._nscanned % self._step == 0:
+            if self._nscanned // self._step == len(self._checkpoints):
+                self._checkpoints.append(frontier)
+            if self._writer is not None:
+                self._save_state()
+
+        if self._nscanned == self.nvariants and self._writer is not None:
+            self._finish()
+
+    def _finish(self):
+        assert self._writer is not None and self._metafile is not None
+        self._writer.close(self._npartitions)
+        self._writer = None
+        state_filepath(self._metafile).unlink(missing_ok=True)
+        self._release()
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+
+    def _save_state(self):
+        assert self._writer is not None and self._metafile is not None
+        self._writer.flush()
+        filepath = state_filepath(self._metafile)
+        tmp = filepath.with_name(filepath.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            f.write(
+                _state.pack(
+                    os.path.getsize(self._filepath),
+                    self.nvariants,
+                    self._step,
+                    self._nscanned,
+                    self._frontier,
+                    len(self._checkpoints),
+                )
+            )
+            f.write(self._checkpoints.tobytes())
+        os.replace(tmp, filepath)
+
+    def _load_state(self):
+        assert self._metafile is not None
+        filepath = state_filepath(self._metafile)
+        if not filepath.exists():
+            return None
+
+        with open(filepath, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return None
+            data = f.read(_state.size)
+            if len(data) != _state.size:
+                return None
+            size, nvariants, step, nscanned, frontier, ncheckpoints = _state.unpack(
+                data
+            )
+            if (size, nvariants, step) != (
+                os.path.getsize(self._filepath),
+                self.nvariants,
+                self._step,
+            ):
+                return None
+            checkpoints = array("Q")
+            checkpoints.frombytes(f.read(8 * ncheckpoints))
+
+        return nscanned, frontier, checkpoints
+
+
+def state_filepath(filepath: Path) -> Path:
+    return filepath.with_name(filepath.name + ".checkpoint")
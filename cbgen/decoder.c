@@ -0,0 +1,429 @@
+#include <math.h>
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <zlib.h>
+#include <zstd.h>
+
+#ifdef CBGEN_LIBDEFLATE
+#include <libdeflate.h>
+#endif
+
+#define INFLATER_ZLIB 0
+#define INFLATER_LIBDEFLATE 1
+
+/* Bytes past the end of a decompressed block that bit reads might touch. */
+#define DECODER_PADDING 8
+
+/* Reader of genotype blocks into buffers kept across blocks.
+ *
+ * Each block is read and decompressed in one shot, and the probabilities are decoded straight from
+ * the decompressed block. The fields after `data_capacity` describe the genotype of the last block
+ * read.
+ */
+struct block_decoder
+{
+    FILE*          stream;
+    uint32_t       nsamples;
+    uint32_t       layout;
+    uint32_t       compression;
+    int            inflater;
+    z_stream*      zlib;
+    ZSTD_DCtx*     zstd;
+    void*          libdeflate;
+    uint8_t*       raw;
+    size_t         raw_capacity;
+    uint8_t*       data;
+    size_t         data_capacity;
+    uint8_t*       layout1_ploidy;
+    uint16_t       nalleles;
+    uint8_t        min_ploidy;
+    uint8_t        max_ploidy;
+    bool           phased;
+    uint8_t        nbits;
+    unsigned       ncombs;
+    uint8_t const* ploidy;
+    uint8_t const* probs;
+};
+
+static unsigned unphased_ncombs(unsigned ploidy, unsigned nalleles)
+{
+    /* binomial(ploidy + nalleles - 1, nalleles - 1) */
+    uint64_t c = 1;
+    for (unsigned i = 1; i < nalleles; ++i)
+        c = c * (ploidy + i) / i;
+    return (unsigned)c;
+}
+
+static bool decoder_has_inflater(int inflater)
+{
+#ifdef CBGEN_LIBDEFLATE
+    return inflater == INFLATER_ZLIB || inflater == INFLATER_LIBDEFLATE;
+#else
+    return inflater == INFLATER_ZLIB;
+#endif
+}
+
+static bool decoder_set_inflater(struct block_decoder* d, int inflater)
+{
+    if (!decoder_has_inflater(inflater))
+        return false;
+
+#ifdef CBGEN_LIBDEFLATE
+    if (inflater == INFLATER_LIBDEFLATE && d->libdeflate == NULL) {
+        d->libdeflate = libdeflate_alloc_decompressor();
+        if (d->libdeflate == NULL)
+            return false;
+    }
+#endif
+    d->inflater = inflater;
+    return true;
+}
+
+static int decoder_inflater(struct block_decoder const* d) { return d->inflater; }
+
+static void decoder_close(struct block_decoder* d)
+{
+    if (d == NULL)
+        return;
+    if (d->stream)
+        fclose(d->stream);
+    if (d->zlib) {
+        inflateEnd(d->zlib);
+        free(d->zlib);
+    }
+    ZSTD_freeDCtx(d->zstd);
+#ifdef CBGEN_LIBDEFLATE
+    if (d->libdeflate)
+        libdeflate_free_decompressor(d->libdeflate);
+#endif
+    free(d->raw);
+    free(d->data);
+    free(d->layout1_ploidy);
+    free(d);
+}
+
+/* Open a decoder of the genotype blocks of a BGEN file, given the fields of its header.
+ *
+ * The fastest inflater available is used by default. Returns NULL on error.
+ */
+static struct block_decoder* decoder_open(char const* filepath, uint32_t nsamples,
+                                          uint32_t layout, uint32_t compression)
+{
+    if (layout != 1 && layout != 2)
+        return NULL;
+
+    struct block_decoder* d = calloc(1, sizeof(struct block_decoder));
+    if (d == NULL)
+        return NULL;
+
+    d->nsamples = nsamples;
+    d->layout = layout;
+    d->compression = compression;
+    d->stream = fopen(filepath, "rb");
+    if (d->stream == NULL) {
+        decoder_close(d);
+        return NULL;
+    }
+
+    if (layout == 1) {
+        d->layout1_ploidy = malloc(nsamples > 0 ? nsamples : 1);
+        if (d->layout1_ploidy == NULL) {
+            decoder_close(d);
+            return NULL;
+        }
+    }
+
+    if (!decoder_set_inflater(d, INFLATER_LIBDEFLATE))
+        decoder_set_inflater(d, INFLATER_ZLIB);
+    return d;
+}
+
+static bool reserve(uint8_t** buf, size_t* capacity, size_t size, struct read_stats* stats)
+{
+    if (size <= *capacity)
+        return true;
+
+    free(*buf);
+    *buf = malloc(size);
+    *capacity = *buf == NULL ? 0 : size;
+    stats_alloc(stats, *capacity);
+    return *buf != NULL;
+}
+
+static bool read_u32(FILE* stream, uint32_t* value)
+{
+    unsigned char b[4];
+    if (fread(b, 1, 4, stream) != 4)
+        return false;
+    *value = (uint32_t)b[0] | (uint32_t)b[1] << 8 | (uint32_t)b[2] << 16 | (uint32_t)b[3] << 24;
+    return true;
+}
+
+static bool zlib_inflate(struct block_decoder* d, uint8_t const* src, size_t srclen,
+                         uint8_t* dst, size_t dstlen)
+{
+    if (d->zlib == NULL) {
+        d->zlib = calloc(1, sizeof(z_stream));
+        if (d->zlib == NULL)
+            return false;
+        if (inflateInit(d->zlib) != Z_OK) {
+            free(d->zlib);
+            d->zlib = NULL;
+            return false;
+        }
+    } else if (inflateReset(d->zlib) != Z_OK) {
+        return false;
+    }
+
+    z_stream* z = d->zlib;
+    z->next_in = (Bytef*)src;
+    z->avail_in = (uInt)srclen;
+    z->next_out = dst;
+    z->avail_out = (uInt)dstlen;
+    return inflate(z, Z_FINISH) == Z_STREAM_END && z->total_out == dstlen;
+}
+
+/* Decompress `src` into exactly `dstlen` bytes of `dst`. */
+static bool decompress(struct block_decoder* d, uint8_t const* src, size_t srclen, uint8_t* dst,
+                       size_t dstlen)
+{
+    if (d->compression == 2) {
+        if (d->zstd == NULL && (d->zstd = ZSTD_createDCtx()) == NULL)
+            return false;
+        size_t size = ZSTD_decompressDCtx(d->zstd, dst, dstlen, src, srclen);
+        return !ZSTD_isError(size) && size == dstlen;
+    }
+
+#ifdef CBGEN_LIBDEFLATE
+    if (d->inflater == INFLATER_LIBDEFLATE)
+        return libdeflate_zlib_decompress(d->libdeflate, src, srclen, dst, dstlen, NULL) ==
+               LIBDEFLATE_SUCCESS;
+#endif
+    return zlib_inflate(d, src, srclen, dst, dstlen);
+}
+
+/* Read the block of `size` bytes at the stream position, decompressing it into `nbytes` bytes. */
+static bool read_payload(struct block_decoder* d, size_t size, size_t nbytes,
+                         struct read_stats* stats)
+{
+    if (!reserve(&d->data, &d->data_capacity, nbytes + DECODER_PADDING, stats))
+        return false;
+
+    if (d->compression == 0)
+        return size == nbytes && fread(d->data, 1, size, d->stream) == size;
+
+    if (!reserve(&d->raw, &d->raw_capacity, size > 0 ? size : 1, stats))
+        return false;
+    if (fread(d->raw, 1, size, d->stream) != size)
+        return false;
+
+    uint64_t start = stats_start(stats);
+    bool     ok = decompress(d, d->raw, size, d->data, nbytes);
+    if (stats)
+        stats->decompress_ns += stats_clock() - start;
+    return ok;
+}
+
+static bool read_layout1(struct block_decoder* d, uint64_t* nbytes, struct read_stats* stats)
+{
+    uint32_t n = d->nsamples;
+    uint32_t size = 6 * n;
+    *nbytes = size;
+    if (d->compression != 0) {
+        if (!read_u32(d->stream, &size))
+            return false;
+        *nbytes = 4 + (uint64_t)size;
+    }
+    if (!read_payload(d, size, 6 * (size_t)n, stats))
+        return false;
+
+    /* Genotypes whose three probabilities are zero are missing. */
+    for (uint32_t j = 0; j < n; ++j) {
+        uint8_t const* p = d->data + 6 * (size_t)j;
+        bool           missing = !(p[0] | p[1] | p[2] | p[3] | p[4] | p[5]);
+        d->layout1_ploidy[j] = (uint8_t)(2 | missing << 7);
+    }
+
+    d->nalleles = 2;
+    d->min_ploidy = 2;
+    d->max_ploidy = 2;
+    d->phased = false;
+    d->nbits = 16;
+    d->ncombs = 3;
+    d->ploidy = d->layout1_ploidy;
+    d->probs = d->data;
+    return true;
+}
+
+static bool read_layout2(struct block_decoder* d, uint64_t* nbytes, struct read_stats* stats)
+{
+    uint32_t size = 0;
+    uint32_t length = 0;
+    if (!read_u32(d->stream, &size))
+        return false;
+    *nbytes = 4 + (uint64_t)size;
+
+    length = size;
+    if (d->compression != 0) {
+        if (size < 4 || !read_u32(d->stream, &length))
+            return false;
+        size -= 4;
+    }
+
+    uint32_t n = d->nsamples;
+    if (length < 10 + (uint64_t)n || !read_payload(d, size, length, stats))
+        return false;
+
+    uint8_t const* p = d->data;
+    uint32_t       nsamples = (uint32_t)p[0] | (uint32_t)p[1] << 8 | (uint32_t)p[2] << 16 |
+                        (uint32_t)p[3] << 24;
+    d->nalleles = (uint16_t)(p[4] | p[5] << 8);
+    d->min_ploidy = p[6];
+    d->max_ploidy = p[7];
+    d->ploidy = p + 8;
+    d->phased = p[8 + n] != 0;
+    d->nbits = p[9 + n];
+    d->probs = p + 10 + n;
+
+    if (nsamples != n || d->nalleles < 2 || d->max_ploidy > 63 || d->nbits < 1 || d->nbits > 32)
+        return false;
+
+    d->ncombs = d->phased ? (unsigned)d->nalleles * d->max_ploidy
+                          : unphased_ncombs(d->max_ploidy, d->nalleles);
+
+    /* Every stored probability must be within the block. */
+    uint64_t nvalues = 0;
+    for (uint32_t j = 0; j < n; ++j) {
+        uint8_t ploidy = d->ploidy[j] & 63;
+        nvalues += d->phased ? (uint64_t)ploidy * (d->nalleles - 1)
+                             : unphased_ncombs(ploidy, d->nalleles) - 1;
+    }
+    return (nvalues * d->nbits + 7) / 8 <= length - 10 - (uint64_t)n;
+}
+
+/* Read the genotype block at `offset`, accounting for the block read and its decompression
+ * separately if `stats` is not NULL.
+ */
+static bool decoder_read_block(struct block_decoder* d, uint64_t offset, struct read_stats* stats)
+{
+    uint64_t start = stats_start(stats);
+    uint64_t decompress_ns = stats ? stats->decompress_ns : 0;
+    uint64_t nbytes = 0;
+    bool     ok = !STATS_FSEEK(d->stream, offset, SEEK_SET) &&
+              (d->layout == 1 ? read_layout1(d, &nbytes, stats) : read_layout2(d, &nbytes, stats));
+
+    if (stats) {
+        stats->read_ns += stats_clock() - start - (stats->decompress_ns - decompress_ns);
+        if (ok) {
+            stats->nblocks++;
+            stats->nbytes += nbytes;
+        }
+    }
+    return ok;
+}
+
+static uint8_t decoder_ploidy(struct block_decoder const* d, uint32_t sample)
+{
+    return d->ploidy[sample] & 63;
+}
+
+static bool decoder_missing(struct block_decoder const* d, uint32_t sample)
+{
+    return d->ploidy[sample] >> 7;
+}
+
+static uint16_t decoder_nalleles(struct block_decoder const* d) { return d->nalleles; }
+
+static uint8_t decoder_min_ploidy(struct block_decoder const* d) { return d->min_ploidy; }
+
+static uint8_t decoder_max_ploidy(struct block_decoder const* d) { return d->max_ploidy; }
+
+static unsigned decoder_ncombs(struct block_decoder const* d) { return d->ncombs; }
+
+static bool decoder_phased(struct block_decoder const* d) { return d->phased; }
+
+static void decoder_read_ploidy(struct block_decoder const* d, uint8_t* ploidy)
+{
+    for (uint32_t j = 0; j < d->nsamples; ++j)
+        ploidy[j] = decoder_ploidy(d, j);
+}
+
+static uint64_t load_bits(uint8_t const* p, uint64_t bit)
+{
+    uint64_t v;
+    memcpy(&v, p + (bit >> 3), 8);
+#if defined(__BYTE_ORDER__) && __BYTE_ORDER__ == __ORDER_BIG_ENDIAN__
+    v = __builtin_bswap64(v);
+#endif
+    return v >> (bit & 7);
+}
+
+/* Decode the probabilities of the last block read into `probs`, `ncombs` per sample.
+ *
+ * Each group of probabilities stores all but its last one, which is what the integer sum of the
+ * others leaves of the scale. Values are divided in `TYPE`, as the bgen library does, so that both
+ * agree bit for bit. Missing genotypes, and the combinations a sample lacks because of a lower
+ * ploidy, are NaN. Returns nonzero on error.
+ */
+#define DEFINE_DECODER_READ(NAME, TYPE)                                                            \
+    static int NAME(struct block_decoder const* d, TYPE* probs, struct read_stats* stats)          \
+    {                                                                                              \
+        uint64_t start = stats_start(stats);                                                       \
+        unsigned ncombs = d->ncombs;                                                               \
+                                                                                                   \
+        if (d->layout == 1) {                                                                      \
+            for (uint32_t j = 0; j < d->nsamples; ++j) {                                           \
+                uint8_t const* b = d->probs + 6 * (size_t)j;                                       \
+                TYPE*          p = probs + 3 * (size_t)j;                                          \
+                bool           missing = decoder_missing(d, j);                                    \
+                for (unsigned k = 0; k < 3; ++k)                                                   \
+                    p[k] = missing ? (TYPE)NAN : (TYPE)((b[2 * k] | b[2 * k + 1] << 8) / 32768.0); \
+            }                                                                                      \
+        } else {                                                                                   \
+            uint64_t const mask = (UINT64_C(1) << d->nbits) - 1;                                   \
+            TYPE const     denom = (TYPE)mask;                                                     \
+            uint64_t       bit = 0;                                                                \
+            uint8_t        last_ploidy = 0;                                                        \
+            unsigned       ngroups = 0;                                                            \
+            unsigned       group = 0;                                                              \
+                                                                                                   \
+            for (uint32_t j = 0; j < d->nsamples; ++j) {                                           \
+                TYPE*   p = probs + (size_t)j * ncombs;                                            \
+                uint8_t ploidy = decoder_ploidy(d, j);                                             \
+                if (j == 0 || ploidy != last_ploidy) {                                             \
+                    ngroups = d->phased ? ploidy : 1;                                              \
+                    group = d->phased ? d->nalleles : unphased_ncombs(ploidy, d->nalleles);        \
+                    last_ploidy = ploidy;                                                          \
+                }                                                                                  \
+                                                                                                   \
+                unsigned k = 0;                                                                    \
+                if (decoder_missing(d, j)) {                                                       \
+                    bit += (uint64_t)ngroups * (group - 1) * d->nbits;                             \
+                } else {                                                                           \
+                    for (unsigned g = 0; g < ngroups; ++g) {                                       \
+                        uint64_t sum = 0;                                                          \
+                        for (unsigned h = 0; h + 1 < group; ++h) {                                 \
+                            uint64_t v = load_bits(d->probs, bit) & mask;                          \
+                            bit += d->nbits;                                                       \
+                            p[k++] = (TYPE)v / denom;                                              \
+                            sum += v;                                                              \
+                        }                                                                          \
+                        p[k++] = (denom - (TYPE)sum) / denom;                                      \
+                    }                                                                              \
+                }                                                                                  \
+                for (; k < ncombs; ++k)                                                            \
+                    p[k] = (TYPE)NAN;                                                              \
+            }                                                                                      \
+        }                                                                                          \
+                                                                                                   \
+        if (stats)                                                                                 \
+            stats->decode_ns += stats_clock() - start;                                             \
+        return 0;                                                                                  \
+    }
+
+DEFINE_DECODER_READ(decoder_read64, double)
+DEFINE_DECODER_READ(decoder_read32, float)
@@ -0,0 +1,23 @@
+#define INFLATER_ZLIB 0
+#define INFLATER_LIBDEFLATE 1
+
+struct block_decoder;
+
+static struct block_decoder *decoder_open(char const *filepath, uint32_t nsamples,
+                                          uint32_t layout, uint32_t compression);
+static void                  decoder_close(struct block_decoder *decoder);
+static bool                  decoder_has_inflater(int inflater);
+static bool                  decoder_set_inflater(struct block_decoder *decoder, int inflater);
+static int                   decoder_inflater(struct block_decoder const *decoder);
+static bool     decoder_read_block(struct block_decoder *decoder, uint64_t offset,
+                                   struct read_stats *stats);
+static uint16_t decoder_nalleles(struct block_decoder const *decoder);
+static uint8_t  decoder_min_ploidy(struct block_decoder const *decoder);
+static uint8_t  decoder_max_ploidy(struct block_decoder const *decoder);
+static unsigned decoder_ncombs(struct block_decoder const *decoder);
+static bool     decoder_phased(struct block_decoder const *decoder);
+static void     decoder_read_ploidy(struct block_decoder const *decoder, uint8_t *ploidy);
+static int      decoder_read64(struct block_decoder const *decoder, double *probs,
+                               struct read_stats *stats);
+static int      decoder_read32(struct block_decoder const *decoder, float *probs,
+                               struct read_stats *stats);
@@ -1,18 +1,391 @@
+#include <math.h>
 #include <stdbool.h>
 #include <stddef.h>
 #include <stdint.h>
 #include <stdlib.h>
 
-static void read_ploidy(struct bgen_genotype const* genotype, uint8_t* ploidy,
-                        uint32_t nsamples)
+#ifndef MAX
+#define MAX(X, Y) ((X) > (Y) ? (X) : (Y))
+#endif
+
+static double dosage_of(struct block_decoder const* decoder, double const* probs, uint32_t sample)
+{
+    if (decoder_missing(decoder, sample))
+        return NAN;
+
+    uint8_t       ploidy = decoder_ploidy(decoder, sample);
+    double const* p = probs + (size_t)sample * decoder->ncombs;
+    double        dosage = 0.0;
+
+    if (decoder->phased) {
+        for (uint8_t h = 0; h < ploidy; ++h)
+            dosage += p[2 * h + 1];
+    } else {
+        for (uint8_t j = 1; j <= ploidy; ++j)
+            dosage += j * p[j];
+    }
+    return dosage;
+}
+
+struct probs_buffer
+{
+    double* probs;
+    size_t  capacity;
+};
+
+/* Read the genotype block of a biallelic variant and decode its probabilities into `buf`.
+ *
+ * Returns false on error, storing it in `err`: 1 (could not open), 2 (could not read), or 3 (not
+ * biallelic).
+ */
+static bool read_biallelic(struct block_decoder* decoder, uint64_t offset,
+                           struct probs_buffer* buf, struct read_stats* stats, int* err)
+{
+    if (!decoder_read_block(decoder, offset, stats)) {
+        *err = 1;
+        return false;
+    }
+
+    if (decoder->nalleles != 2) {
+        *err = 3;
+        return false;
+    }
+
+    size_t size = (size_t)decoder->nsamples * decoder->ncombs;
+    if (size > buf->capacity) {
+        free(buf->probs);
+        buf->probs = malloc(size * sizeof(double));
+        buf->capacity = buf->probs == NULL ? 0 : size;
+        stats_alloc(stats, buf->capacity * sizeof(double));
+    }
+
+    if (buf->probs == NULL || decoder_read64(decoder, buf->probs, stats)) {
+        *err = 2;
+        return false;
+    }
+
+    return true;
+}
+
+/* Dosage of every sample, with missing genotypes imputed by the mean dosage. */
+static void imputed_dosage(struct block_decoder const* decoder, double const* probs,
+                           double* dosage)
 {
-    for (uint32_t i = 0; i < nsamples; ++i)
-        ploidy[i] = bgen_genotype_ploidy(genotype, i);
+    uint32_t nsamples = decoder->nsamples;
+    double   sum = 0.0;
+    uint32_t n = 0;
+
+    for (uint32_t j = 0; j < nsamples; ++j) {
+        dosage[j] = dosage_of(decoder, probs, j);
+        if (!isnan(dosage[j])) {
+            sum += dosage[j];
+            n++;
+        }
+    }
+
+    double mean = n > 0 ? sum / n : 0.0;
+    for (uint32_t j = 0; j < nsamples; ++j) {
+        if (isnan(dosage[j]))
+            dosage[j] = mean;
+    }
 }
 
-static void read_missing(struct bgen_genotype const* genotype, bool* missing,
-                         uint32_t nsamples)
+/* Standardise dosages to zero mean and unit norm, after imputing missing ones by the mean.
+ *
+ * Dosages of a variant without variance are set to NaN.
+ */
+static void standardize_dosage(double* dosage, uint32_t n)
+{
+    double   sum = 0.0;
+    uint32_t count = 0;
+    for (uint32_t j = 0; j < n; ++j) {
+        if (!isnan(dosage[j])) {
+            sum += dosage[j];
+            count++;
+        }
+    }
+
+    double mean = count > 0 ? sum / count : 0.0;
+    double norm = 0.0;
+    for (uint32_t j = 0; j < n; ++j) {
+        dosage[j] = isnan(dosage[j]) ? 0.0 : dosage[j] - mean;
+        norm += dosage[j] * dosage[j];
+    }
+
+    norm = sqrt(norm);
+    for (uint32_t j = 0; j < n; ++j)
+        dosage[j] = norm > 0.0 ? dosage[j] / norm : NAN;
+}
+
+/* Read the dosage of the second allele of biallelic variants.
+ *
+ * The dosage of sample `samples[j]` (or `j` if `samples` is NULL) at variant `i` is written to
+ * `dosage[i * variant_stride + j * sample_stride]`, standardised over the selected samples if
+ * `standardize` is true. Returns the number of variants read before an error, storing the
+ * error in `err` as `read_biallelic` does.
+ */
+#define DEFINE_READ_DOSAGE(NAME, TYPE)                                                             \
+    static uint32_t NAME(struct block_decoder* decoder, uint64_t const* offsets,                   \
+                         uint32_t noffsets, uint32_t const* samples, uint32_t nselected,           \
+                         TYPE* dosage, ptrdiff_t variant_stride, ptrdiff_t sample_stride,          \
+                         bool standardize, struct read_stats* stats, int* err)                     \
+    {                                                                                              \
+        struct probs_buffer buf = {NULL, 0};                                                       \
+        double*             row = malloc(MAX(nselected, 1) * sizeof(double));                      \
+        uint32_t            i = 0;                                                                 \
+        *err = row == NULL ? 2 : 0;                                                                \
+        stats_alloc(stats, MAX(nselected, 1) * sizeof(double));                                    \
+                                                                                                   \
+        for (; i < noffsets && *err == 0; ++i) {                                                   \
+            if (!read_biallelic(decoder, offsets[i], &buf, stats, err))                            \
+                break;                                                                             \
+                                                                                                   \
+            uint64_t start = stats_start(stats);                                                   \
+            for (uint32_t j = 0; j < nselected; ++j) {                                             \
+                uint32_t sample = samples ? samples[j] : j;                                        \
+                row[j] = dosage_of(decoder, buf.probs, sample);                                    \
+            }                                                                                      \
+                                                                                                   \
+            if (standardize)                                                                       \
+                standardize_dosage(row, nselected);                                                \
+                                                                                                   \
+            TYPE* out = dosage + i * variant_stride;                                               \
+            for (uint32_t j = 0; j < nselected; ++j)                                               \
+                out[j * sample_stride] = (TYPE)row[j];                                             \
+            stats_convert(stats, start);                                                           \
+        }                                                                                          \
+                                                                                                   \
+        free(row);                                                                                 \
+        free(buf.probs);                                                                           \
+        return i;                                                                                  \
+    }
+
+DEFINE_READ_DOSAGE(read_dosage64, double)
+DEFINE_READ_DOSAGE(read_dosage32, float)
+
+/* Read the genotype probabilities of variants having `ncombs` combinations each.
+ *
+ * Probability `k` of sample `j` at variant `i` is written to
+ * `probs[i * variant_stride + j * sample_stride + k * comb_stride]`. Probabilities are decoded
+ * in place if each variant is stored sample by sample, and through a scratch buffer otherwise.
+ * Returns the number of variants read before an error, storing it in `err`: 1 (could not open),
+ * 2 (could not read), or 3 (different number of combinations).
+ */
+#define DEFINE_READ_PROBABILITY(NAME, READ, TYPE)                                                  \
+    static uint32_t NAME(struct block_decoder* decoder, uint64_t const* offsets,                   \
+                         uint32_t noffsets, uint32_t ncombs, TYPE* probs,                          \
+                         ptrdiff_t variant_stride, ptrdiff_t sample_stride,                        \
+                         ptrdiff_t comb_stride, struct read_stats* stats, int* err)                \
+    {                                                                                              \
+        uint32_t nsamples = decoder->nsamples;                                                     \
+        bool     inplace = sample_stride == (ptrdiff_t)ncombs && comb_stride == 1;                 \
+        size_t   size = MAX((size_t)nsamples * ncombs, 1);                                         \
+        TYPE*    scratch = inplace ? NULL : malloc(size * sizeof(TYPE));                           \
+        uint32_t i = 0;                                                                            \
+        *err = !inplace && scratch == NULL ? 2 : 0;                                                \
+        if (!inplace)                                                                              \
+            stats_alloc(stats, size * sizeof(TYPE));                                               \
+                                                                                                   \
+        for (; i < noffsets && *err == 0; ++i) {                                                   \
+            if (!decoder_read_block(decoder, offsets[i], stats)) {                                 \
+                *err = 1;                                                                          \
+                break;                                                                             \
+            }                                                                                      \
+                                                                                                   \
+            TYPE* out = probs + i * variant_stride;                                                \
+            if (decoder->ncombs != ncombs)                                                         \
+                *err = 3;                                                                          \
+            else if (READ(decoder, inplace ? out : scratch, stats))                                \
+                *err = 2;                                                                          \
+            if (*err)                                                                              \
+                break;                                                                             \
+                                                                                                   \
+            if (!inplace) {                                                                        \
+                uint64_t    start = stats_start(stats);                                            \
+                TYPE const* p = scratch;                                                           \
+                for (uint32_t j = 0; j < nsamples; ++j) {                                          \
+                    for (uint32_t k = 0; k < ncombs; ++k)                                          \
+                        out[j * sample_stride + k * comb_stride] = *p++;                           \
+                }                                                                                  \
+                stats_convert(stats, start);                                                       \
+            }                                                                                      \
+        }                                                                                          \
+                                                                                                   \
+        free(scratch);                                                                             \
+        return i;                                                                                  \
+    }
+
+DEFINE_READ_PROBABILITY(read_probability64, decoder_read64, double)
+DEFINE_READ_PROBABILITY(read_probability32, decoder_read32, float)
+
+/* Read the alleles of each haplotype of phased biallelic variants.
+ *
+ * The allele of haplotype `h` of sample `j` at variant `i` is written to
+ * `alleles[(i * nsamples + j) * ploidy + h]`: 0 or 1 if the probability of the first or second
+ * allele is at least `threshold`, and -1 if neither is, if the genotype is missing, or if the
+ * sample has less than `ploidy` haplotypes. Returns the number of variants read before an error,
+ * storing it in `err` as `read_biallelic` does, or as 5 (not phased) or 6 (ploidy above
+ * `ploidy`).
+ */
+static uint32_t read_haplotypes(struct block_decoder* decoder, uint64_t const* offsets,
+                                uint32_t noffsets, uint8_t ploidy, double threshold,
+                                int8_t* alleles, struct read_stats* stats, int* err)
 {
-    for (uint32_t i = 0; i < nsamples; ++i)
-        missing[i] = bgen_genotype_missing(genotype, i);
+    struct probs_buffer buf = {NULL, 0};
+    uint32_t            nsamples = decoder->nsamples;
+    uint32_t            i = 0;
+    *err = 0;
+
+    for (; i < noffsets; ++i) {
+        if (!read_biallelic(decoder, offsets[i], &buf, stats, err))
+            break;
+
+        if (!decoder->phased)
+            *err = 5;
+        else if (decoder->max_ploidy > ploidy)
+            *err = 6;
+        if (*err)
+            break;
+
+        uint64_t start = stats_start(stats);
+        unsigned ncombs = decoder->ncombs;
+        int8_t*  out = alleles + (size_t)i * nsamples * ploidy;
+        for (uint32_t j = 0; j < nsamples; ++j) {
+            double const* p = buf.probs + (size_t)j * ncombs;
+            uint8_t       n = decoder_missing(decoder, j) ? 0 : decoder_ploidy(decoder, j);
+            for (uint8_t h = 0; h < ploidy; ++h) {
+                int8_t allele = -1;
+                if (h < n && p[2 * h + 1] >= threshold)
+                    allele = 1;
+                else if (h < n && p[2 * h] >= threshold)
+                    allele = 0;
+                out[(size_t)j * ploidy + h] = allele;
+            }
+        }
+        stats_convert(stats, start);
+    }
+
+    free(buf.probs);
+    return i;
+}
+
+/* Read the nonzero dosages of biallelic variants in compressed sparse row format.
+ *
+ * Dosages above `threshold` and missing ones (as NaN) of variant `i` are written to
+ * `indices[indptr[i]:indptr[i + 1]]` (sample indices) and `data[indptr[i]:indptr[i + 1]]`, where
+ * `indptr[0]` is the number of entries already written and `capacity` is the size of `indices`
+ * and `data`. Stops before a variant when less than one entry per sample is left, with error 4.
+ * Returns the number of variants read, storing errors as `read_biallelic` does otherwise.
+ */
+static uint32_t read_sparse_dosage(struct block_decoder* decoder, uint64_t const* offsets,
+                                   uint32_t noffsets, double threshold, int64_t* indptr,
+                                   uint32_t* indices, double* data, int64_t capacity,
+                                   struct read_stats* stats, int* err)
+{
+    uint32_t            nsamples = decoder->nsamples;
+    struct probs_buffer buf = {NULL, 0};
+    int64_t             nnz = indptr[0];
+    uint32_t            i = 0;
+    *err = 0;
+
+    for (; i < noffsets; ++i) {
+        if (capacity - nnz < (int64_t)nsamples) {
+            *err = 4;
+            break;
+        }
+
+        if (!read_biallelic(decoder, offsets[i], &buf, stats, err))
+            break;
+
+        uint64_t start = stats_start(stats);
+        for (uint32_t j = 0; j < nsamples; ++j) {
+            double d = dosage_of(decoder, buf.probs, j);
+            if (isnan(d) || d > threshold) {
+                indices[nnz] = j;
+                data[nnz] = d;
+                nnz++;
+            }
+        }
+        indptr[i + 1] = nnz;
+        stats_convert(stats, start);
+    }
+
+    free(buf.probs);
+    return i;
+}
+
+/* Accumulate `out[j, k] += sum_i dosage[i, j] * weights[i, k]` over variants.
+ *
+ * `weights` has `ncols` columns per variant and `out` has `ncols` columns per sample. Missing
+ * genotypes are imputed by the variant mean dosage. Returns as `read_dosage64` does.
+ */
+static uint32_t dot_dosage(struct block_decoder* decoder, uint64_t const* offsets,
+                           uint32_t noffsets, double const* weights, uint32_t ncols, double* out,
+                           struct read_stats* stats, int* err)
+{
+    uint32_t            nsamples = decoder->nsamples;
+    struct probs_buffer buf = {NULL, 0};
+    double*             dosage = malloc(MAX(nsamples, 1) * sizeof(double));
+    uint32_t            i = 0;
+    *err = dosage == NULL ? 2 : 0;
+    stats_alloc(stats, MAX(nsamples, 1) * sizeof(double));
+
+    for (; i < noffsets && *err == 0; ++i) {
+        if (!read_biallelic(decoder, offsets[i], &buf, stats, err))
+            break;
+
+        uint64_t start = stats_start(stats);
+        imputed_dosage(decoder, buf.probs, dosage);
+
+        double const* w = weights + (size_t)i * ncols;
+        for (uint32_t j = 0; j < nsamples; ++j) {
+            double* o = out + (size_t)j * ncols;
+            for (uint32_t k = 0; k < ncols; ++k)
+                o[k] += dosage[j] * w[k];
+        }
+        stats_convert(stats, start);
+    }
+
+    free(dosage);
+    free(buf.probs);
+    return i;
+}
+
+/* Compute `out[i, k] = sum_j vector[j, k] * dosage[i, j]` for each variant.
+ *
+ * `vector` has `ncols` columns per sample and `out` has `ncols` columns per variant. Missing
+ * genotypes are imputed by the variant mean dosage. Returns as `read_dosage64` does.
+ */
+static uint32_t rdot_dosage(struct block_decoder* decoder, uint64_t const* offsets,
+                            uint32_t noffsets, double const* vector, uint32_t ncols, double* out,
+                            struct read_stats* stats, int* err)
+{
+    uint32_t            nsamples = decoder->nsamples;
+    struct probs_buffer buf = {NULL, 0};
+    double*             dosage = malloc(MAX(nsamples, 1) * sizeof(double));
+    uint32_t            i = 0;
+    *err = dosage == NULL ? 2 : 0;
+    stats_alloc(stats, MAX(nsamples, 1) * sizeof(double));
+
+    for (; i < noffsets && *err == 0; ++i) {
+        if (!read_biallelic(decoder, offsets[i], &buf, stats, err))
+            break;
+
+        uint64_t start = stats_start(stats);
+        imputed_dosage(decoder, buf.probs, dosage);
+
+        double* o = out + (size_t)i * ncols;
+        for (uint32_t k = 0; k < ncols; ++k)
+            o[k] = 0.0;
+        for (uint32_t j = 0; j < nsamples; ++j) {
+            double const* v = vector + (size_t)j * ncols;
+            for (uint32_t k = 0; k < ncols; ++k)
+                o[k] += dosage[j] * v[k];
+        }
+        stats_convert(stats, start);
+    }
+
+    free(dosage);
+    free(buf.probs);
+    return i;
 }
@@ -1,2 +1,29 @@
-static void read_ploidy(struct bgen_genotype const *genotype, uint8_t *ploidy, uint32_t nsamples);
-static void read_missing(struct bgen_genotype const *genotype, bool *missing, uint32_t nsamples);
+static uint32_t read_dosage64(struct block_decoder *decoder, uint64_t const *offsets,
+                              uint32_t noffsets, uint32_t const *samples, uint32_t nselected,
+                              double *dosage, ptrdiff_t variant_stride, ptrdiff_t sample_stride,
+                              bool standardize, struct read_stats *stats, int *err);
+static uint32_t read_dosage32(struct block_decoder *decoder, uint64_t const *offsets,
+                              uint32_t noffsets, uint32_t const *samples, uint32_t nselected,
+                              float *dosage, ptrdiff_t variant_stride, ptrdiff_t sample_stride,
+                              bool standardize, struct read_stats *stats, int *err);
+static uint32_t read_probability64(struct block_decoder *decoder, uint64_t const *offsets,
+                                   uint32_t noffsets, uint32_t ncombs, double *probs,
+                                   ptrdiff_t variant_stride, ptrdiff_t sample_stride,
+                                   ptrdiff_t comb_stride, struct read_stats *stats, int *err);
+static uint32_t read_probability32(struct block_decoder *decoder, uint64_t const *offsets,
+                                   uint32_t noffsets, uint32_t ncombs, float *probs,
+                                   ptrdiff_t variant_stride, ptrdiff_t sample_stride,
+                                   ptrdiff_t comb_stride, struct read_stats *stats, int *err);
+static uint32_t read_haplotypes(struct block_decoder *decoder, uint64_t const *offsets,
+                                uint32_t noffsets, uint8_t ploidy, double threshold,
+                                int8_t *alleles, struct read_stats *stats, int *err);
+static uint32_t read_sparse_dosage(struct block_decoder *decoder, uint64_t const *offsets,
+                                   uint32_t noffsets, double threshold, int64_t *indptr,
+                                   uint32_t *indices, double *data, int64_t capacity,
+                                   struct read_stats *stats, int *err);
+static uint32_t dot_dosage(struct block_decoder *decoder, uint64_t const *offsets,
+                           uint32_t noffsets, double const *weights, uint32_t ncols, double *out,
+                           struct read_stats *stats, int *err);
+static uint32_t rdot_dosage(struct block_decoder *decoder, uint64_t const *offsets,
+                            uint32_t noffsets, double const *vector, uint32_t ncols, double *out,
+                            struct read_stats *stats, int *err);
@@ -1,3 +1,4 @@
+#include <stdbool.h>
 #include <stddef.h>
 #include <stdint.h>
 #include <stdlib.h>
@@ -68,3 +69,111 @@ static void read_partition_part2(struct bgen_partition const* partition, char* c
         }
     }
 }
+
+static uint64_t allele_ids_length(struct bgen_variant const* v)
+{
+    if (v->nalleles == 0)
+        return 0;
+
+    uint64_t length = v->nalleles - 1;
+    for (uint16_t j = 0; j < v->nalleles; ++j)
+        length += bgen_string_length(v->allele_ids[j]);
+    return length;
+}
+
+static void read_partition_offsets(struct bgen_partition const* partition, uint64_t* id_offsets,
+                                   uint64_t* rsid_offsets, uint64_t* chrom_offsets,
+                                   uint64_t* allele_ids_offsets)
+{
+    uint32_t nvariants = bgen_partition_nvariants(partition);
+
+    id_offsets[0] = 0;
+    rsid_offsets[0] = 0;
+    chrom_offsets[0] = 0;
+    allele_ids_offsets[0] = 0;
+
+    for (uint32_t i = 0; i < nvariants; ++i) {
+        struct bgen_variant const* v = bgen_partition_get_variant(partition, i);
+        id_offsets[i + 1] = id_offsets[i] + bgen_string_length(v->id);
+        rsid_offsets[i + 1] = rsid_offsets[i] + bgen_string_length(v->rsid);
+        chrom_offsets[i + 1] = chrom_offsets[i] + bgen_string_length(v->chrom);
+        allele_ids_offsets[i + 1] = allele_ids_offsets[i] + allele_ids_length(v);
+    }
+}
+
+static void read_partition_strings(struct bgen_partition const* partition, char* id, char* rsid,
+                                   char* chrom, char* allele_ids)
+{
+    uint32_t nvariants = bgen_partition_nvariants(partition);
+    for (uint32_t i = 0; i < nvariants; ++i) {
+        struct bgen_variant const* v = bgen_partition_get_variant(partition, i);
+
+        memcpy(id, bgen_string_data(v->id), bgen_string_length(v->id));
+        id += bgen_string_length(v->id);
+
+        memcpy(rsid, bgen_string_data(v->rsid), bgen_string_length(v->rsid));
+        rsid += bgen_string_length(v->rsid);
+
+        memcpy(chrom, bgen_string_data(v->chrom), bgen_string_length(v->chrom));
+        chrom += bgen_string_length(v->chrom);
+
+        for (uint16_t r = 0; r < v->nalleles; ++r) {
+            memcpy(allele_ids, bgen_string_data(v->allele_ids[r]),
+                   bgen_string_length(v->allele_ids[r]));
+            allele_ids += bgen_string_length(v->allele_ids[r]);
+
+            if (r + 1 < v->nalleles)
+                *allele_ids++ = ',';
+        }
+    }
+}
+
+static bool same_chrom(struct bgen_partition const* partition, uint32_t index,
+                       struct bgen_string const* chrom)
+{
+    struct bgen_string const* other = bgen_partition_get_variant(partition, index)->chrom;
+    size_t                    length = bgen_string_length(chrom);
+    return bgen_string_length(other) == length &&
+           memcmp(bgen_string_data(other), bgen_string_data(chrom), length) == 0;
+}
+
+static uint32_t read_partition_chrom_codes(struct bgen_partition const* partition, uint16_t* codes,
+                                           uint32_t* first)
+{
+    uint32_t nvariants = bgen_partition_nvariants(partition);
+    uint32_t ncategories = 0;
+    uint16_t last = 0;
+
+    for (uint32_t i = 0; i < nvariants; ++i) {
+        struct bgen_string const* chrom = bgen_partition_get_variant(partition, i)->chrom;
+
+        uint32_t j = last;
+        if (ncategories == 0 || !same_chrom(partition, first[j], chrom)) {
+            for (j = 0; j < ncategories; ++j) {
+                if (same_chrom(partition, first[j], chrom))
+                    break;
+            }
+            if (j == ncategories) {
+                if (ncategories > UINT16_MAX)
+                    return UINT32_MAX;
+                first[ncategories++] = i;
+            }
+        }
+
+        last = (uint16_t)j;
+        codes[i] = last;
+    }
+
+    return ncategories;
+}
+
+static void read_partition_chrom_categories(struct bgen_partition const* partition,
+                                            uint32_t const* first, uint32_t ncategories,
+                                            char* const categories, uint32_t categories_stride)
+{
+    for (uint32_t j = 0; j < ncategories; ++j) {
+        struct bgen_string const* chrom = bgen_partition_get_variant(partition, first[j])->chrom;
+        memcpy(categories + j * categories_stride, bgen_string_data(chrom),
+               bgen_string_length(chrom));
+    }
+}
@@ -7,3 +7,17 @@ static void read_partition_part2(struct bgen_partition const *partition, char *c
                                  uint32_t id_stride, char *const rsid, uint32_t rsid_stride,
                                  char *const chrom, uint32_t chrom_stride, char *const allele_ids,
                                  uint32_t allele_ids_stride);
+
+static void read_partition_offsets(struct bgen_partition const *partition, uint64_t *id_offsets,
+                                   uint64_t *rsid_offsets, uint64_t *chrom_offsets,
+                                   uint64_t *allele_ids_offsets);
+
+static void read_partition_strings(struct bgen_partition const *partition, char *id, char *rsid,
+                                   char *chrom, char *allele_ids);
+
+static uint32_t read_partition_chrom_codes(struct bgen_partition const *partition, uint16_t *codes,
+                                           uint32_t *first);
+
+static void read_partition_chrom_categories(struct bgen_partition const *partition,
+                                            uint32_t const *first, uint32_t ncategories,
+                                            char *const categories, uint32_t categories_stride);
@@ -26,3 +26,23 @@ static void read_samples_part2(struct bgen_samples const* samples, uint32_t nsam
                bgen_string_length(sample));
     }
 }
+
+static void read_samples_offsets(struct bgen_samples const* samples, uint32_t nsamples,
+                                 uint64_t* offsets)
+{
+    offsets[0] = 0;
+    for (uint32_t i = 0; i < nsamples; ++i) {
+        struct bgen_string const* sample = bgen_samples_get(samples, i);
+        offsets[i + 1] = offsets[i] + bgen_string_length(sample);
+    }
+}
+
+static void read_samples_strings(struct bgen_samples const* samples, uint32_t nsamples,
+                                 char* data)
+{
+    for (uint32_t i = 0; i < nsamples; ++i) {
+        struct bgen_string const* sample = bgen_samples_get(samples, i);
+        memcpy(data, bgen_string_data(sample), bgen_string_length(sample));
+        data += bgen_string_length(sample);
+    }
+}
@@ -2,3 +2,7 @@ static void read_samples_part1(struct bgen_samples *samples, uint32_t nsamples,
                                uint32_t *samples_max_len);
 static void read_samples_part2(struct bgen_samples const *samples, uint32_t nsamples,
                                char *const sample_array, uint32_t samples_stride);
+static void read_samples_offsets(struct bgen_samples const *samples, uint32_t nsamples,
+                                 uint64_t *offsets);
+static void read_samples_strings(struct bgen_samples const *samples, uint32_t nsamples,
+                                 char *data);
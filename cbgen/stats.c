@@ -0,0 +1,50 @@
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <time.h>
+
+#ifdef _WIN32
+#define STATS_FSEEK _fseeki64
+#else
+#define STATS_FSEEK fseeko
+#endif
+
+/* Counters of genotype reading, split by phase. */
+struct read_stats
+{
+    uint64_t nblocks;
+    uint64_t nbytes;
+    uint64_t read_ns;
+    uint64_t decompress_ns;
+    uint64_t decode_ns;
+    uint64_t convert_ns;
+    uint64_t alloc_bytes;
+    uint64_t cache_hits;
+    uint64_t cache_misses;
+};
+
+static uint64_t stats_clock(void)
+{
+    struct timespec ts;
+#ifdef CLOCK_MONOTONIC
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+#else
+    timespec_get(&ts, TIME_UTC);
+#endif
+    return (uint64_t)ts.tv_sec * 1000000000u + (uint64_t)ts.tv_nsec;
+}
+
+static uint64_t stats_start(struct read_stats const* stats) { return stats ? stats_clock() : 0; }
+
+static void stats_convert(struct read_stats* stats, uint64_t start)
+{
+    if (stats)
+        stats->convert_ns += stats_clock() - start;
+}
+
+static void stats_alloc(struct read_stats* stats, size_t nbytes)
+{
+    if (stats)
+        stats->alloc_bytes += nbytes;
+}
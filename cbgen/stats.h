@@ -0,0 +1,12 @@
+struct read_stats
+{
+    uint64_t nblocks;
+    uint64_t nbytes;
+    uint64_t read_ns;
+    uint64_t decompress_ns;
+    uint64_t decode_ns;
+    uint64_t convert_ns;
+    uint64_t alloc_bytes;
+    uint64_t cache_hits;
+    uint64_t cache_misses;
+};
@@ -0,0 +1,147 @@
+from pathlib import Path
+from typing import Optional, Union
+
+from numpy import empty, float64
+from numpy.random import default_rng
+
+from ._bgen_writer import bgen_writer
+
+__all__ = ["make_bgen"]
+
+_BATCH_SIZE = 1 << 22
+
+
+def make_bgen(
+    filepath: Union[str, Path],
+    nsamples: int,
+    nvariants: int,
+    layout: int = 2,
+    bits: int = 8,
+    compression: Optional[str] = "zstd",
+    ploidy: int = 2,
+    phased: bool = False,
+    missing: float = 0.0,
+    seed: int = 0,
+    nthreads: int = 1,
+) -> Path:
+    """
+    Write a BGEN file of random biallelic variants.
+
+    Each variant has a random allele frequency. Each haplotype of a sample
+    carries the second allele with that frequency, and its probability of
+    carrying it deviates from the hard call by up to ``0.1``. Unphased
+    probabilities are those of the number of copies of the second allele.
+    The file has no sample identifiers, and its metafile is written alongside
+    it with the suffix ``.metafile`` appended to its path. The same seed
+    always gives the same file.
+
+    >>> import cbgen
+    >>> from pathlib import Path
+    >>> from tempfile import TemporaryDirectory
+    >>>
+    >>> tmp = TemporaryDirectory()
+    >>> filepath = cbgen.synthetic.make_bgen(Path(tmp.name) / "random.bgen", 10, 3)
+    >>> with cbgen.bgen_file(filepath) as bgen:
+    ...     print(bgen.nsamples, bgen.nvariants)
+    10 3
+    >>> tmp.cleanup()
+
+    Parameters
+    ----------
+    filepath
+        BGEN file path.
+    nsamples
+        Number of samples.
+    nvariants
+        Number of variants.
+    layout
+        Genotype block layout: ``2`` (default) or ``1``. Layout 1 only stores
+        unphased diploid genotypes, at 16 bits per probability.
+    bits
+        Number of bits per stored probability of layout 2, from 1 to 32.
+        Defaults to ``8``.
+    compression
+        Genotype block compression: ``"zstd"`` (default), ``"zlib"``, or
+        ``None``. Layout 1 blocks cannot be compressed with zstd.
+    ploidy
+        Ploidy of every sample. Defaults to ``2``.
+    phased
+        ``True`` for phased probabilities; ``False`` otherwise (default).
+    missing
+        Fraction of missing genotypes. Defaults to ``0``.
+    seed
+        Seed of the random number generator. Defaults to ``0``.
+    nthreads
+        Number of threads encoding and compressing genotype blocks. Defaults
+        to ``1``.
+
+    Returns
+    -------
+    BGEN file path.
+
+    Raises
+    ------
+    ValueError
+        If an option is invalid.
+    """
+    if not (1 <= ploidy <= 63):
+        raise ValueError("Ploidy should be between 1 and 63.")
+
+    if not (0.0 <= missing <= 1.0):
+        raise ValueError("Missing fraction should be between 0 and 1.")
+
+    filepath = Path(filepath)
+    random = default_rng(seed)
+    ncombs = 2 * ploidy if phased else ploidy + 1
+    batch = max(1, _BATCH_SIZE // max(nsamples * ncombs, 1))
+
+    with bgen_writer(
+        filepath,
+        nsamples,
+        layout=layout,
+        compression=compression,
+        bits=bits,
+        nthreads=nthreads,
+    ) as writer:
+        for start in range(0, nvariants, batch):
+            n = min(batch, nvariants - start)
+            freq = random.uniform(0.01, 0.5, (n, 1, 1))
+            calls = random.random((n, nsamples, ploidy)) < freq
+            noise = random.uniform(0.0, 0.1, (n, nsamples, ploidy))
+            alt = abs(calls - noise)
+
+            if phased:
+                probs = empty((n, nsamples, ncombs), dtype=float64)
+                probs[..., 0::2] = 1 - alt
+                probs[..., 1::2] = alt
+            else:
+                probs = _copy_number_probs(alt)
+
+            ids = [f"rs{i + 1}" for i in range(start, start + n)]
+            writer.write(
+                probs,
+                ids,
+                ["1"] * n,
+                range(start + 1, start + n + 1),
+                [["A", "G"]] * n,
+                id=ids,
+                ploidy=ploidy,
+                phased=phased,
+                missing=random.random((n, nsamples)) < missing,
+            )
+
+    return filepath
+
+
+def _copy_number_probs(alt):
+    # Probabilities of the number of copies of the second allele, from the
+    # probability of each haplotype carrying it.
+    ploidy = alt.shape[-1]
+    probs = empty(alt.shape[:-1] + (ploidy + 1,), dtype=float64)
+    probs[..., 0] = 1.0
+    for h in range(ploidy):
+        a = alt[..., h, None]
+        probs[..., h + 1] = probs[..., h] * a[..., 0]
+        probs[..., 1 : h + 1] = probs[..., 1 : h + 1] * (1 - a) + probs[..., :h] * a
+        probs[..., 0] *= 1 - a[..., 0]
+    return probs
@@ -1,10 +1,49 @@
+import gc
+import os
+import pickle
+import re
+import struct
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from itertools import product
 from pathlib import Path
 
 import pytest
-from numpy import isnan, nan, nansum
+from numpy import (
+    asarray,
+    concatenate,
+    corrcoef,
+    empty,
+    float32,
+    float64,
+    full,
+    isnan,
+    nan,
+    nanmean,
+    nansum,
+    where,
+    zeros,
+)
 from numpy.testing import assert_allclose, assert_array_equal
 
-from cbgen import bgen_file, bgen_metafile, example
+from cbgen import (
+    bgen_dataset,
+    bgen_file,
+    bgen_metafile,
+    bgen_writer,
+    block_cache,
+    example,
+    extract,
+    grm,
+    http_reader,
+    ld_matrix,
+    merge_metafiles,
+    synthetic,
+)
 
 
 @pytest.mark.slow
@@ -255,3 +294,1013 @@ def test_cbgen_complex_unphased(tmp_path: Path):
 
         with pytest.raises(RuntimeError):
             part = mf.read_partition(1)
+
+
+def test_cbgen_read_variants(tmp_path: Path):
+    filepath = example.get("haplotypes.bgen")
+    mfilepath = tmp_path / f"{filepath.name}.metafile"
+
+    with bgen_file(filepath) as bgen:
+        variants = bgen.read_variants()
+        assert variants.size == 4
+        assert_array_equal(variants.id, [b"SNP1", b"SNP2", b"SNP3", b"SNP4"])
+        assert_array_equal(variants.position, [1, 2, 3, 4])
+        assert variants.allele_ids[3] == b"A,G"
+
+        variants = bgen.read_variants(2, 3)
+        assert_array_equal(variants.rsid, [b"RS3"])
+
+        with pytest.raises(ValueError):
+            bgen.read_variants(3, 5)
+
+        bgen.create_metafile(mfilepath, lazy=True)
+        assert not mfilepath.exists()
+        bgen.read_variants(3)
+        assert mfilepath.exists()
+
+        with bgen_metafile(mfilepath) as mf:
+            part = mf.read_partition(0)
+            assert_array_equal(part.variants.offset, bgen.read_variants().offset)
+            gt = bgen.read_genotype(part.variants.offset[0])
+            assert gt.phased
+
+
+def test_cbgen_lazy_metafile_resume(tmp_path: Path):
+    filepath = synthetic.make_bgen(tmp_path / "a.bgen", 2, 3000, seed=2)
+    with bgen_metafile(f"{filepath}.metafile") as mf:
+        expected = mf.read_offsets()
+        rsid = asarray(mf.read_partition(1).variants.rsid)
+
+    def check(mfilepath: Path):
+        assert mfilepath.exists()
+        with bgen_metafile(mfilepath) as mf:
+            assert mf.nvariants == 3000
+            assert_array_equal(mf.read_offsets(), expected)
+            assert_array_equal(mf.read_partition(1).variants.rsid, rsid)
+
+    mfilepath = tmp_path / "lazy.metafile"
+    spool = tmp_path / "lazy.metafile.records"
+    for damage in [None, "delete", "truncate"]:
+        with bgen_file(filepath) as bgen:
+            bgen.create_metafile(mfilepath, lazy=True)
+            bgen.read_variants(0, 2100)
+        assert (tmp_path / "lazy.metafile.checkpoint").exists()
+        assert not mfilepath.exists()
+
+        if damage == "delete":
+            spool.unlink()
+        elif damage == "truncate":
+            spool.write_bytes(spool.read_bytes()[:1000])
+
+        with bgen_file(filepath) as bgen:
+            bgen.create_metafile(mfilepath, lazy=True)
+            assert_array_equal(bgen.read_variants().offset, expected)
+        check(mfilepath)
+        assert not spool.exists()
+        mfilepath.unlink()
+
+    with bgen_file(filepath) as first:
+        first.create_metafile(mfilepath, lazy=True)
+        first.read_variants(0, 1500)
+        with bgen_file(filepath) as second:
+            second.create_metafile(mfilepath, lazy=True)
+            second.read_variants()
+        assert not mfilepath.exists()
+        first.read_variants(1500)
+    check(mfilepath)
+
+
+def _concat_bgen(dst: Path, filepath: Path, ncopies: int):
+    data = filepath.read_bytes()
+    start = struct.unpack_from("<I", data)[0] + 4
+    nvariants = struct.unpack_from("<I", data, 8)[0]
+    out = bytearray(data + data[start:] * (ncopies - 1))
+    struct.pack_into("<I", out, 8, nvariants * ncopies)
+    dst.write_bytes(out)
+
+
+def test_cbgen_extend_merge_metafile(tmp_path: Path):
+    filepath = example.get("haplotypes.bgen")
+    mfilepath = tmp_path / "haplotypes.metafile"
+    cfilepath = tmp_path / "concat.bgen"
+    _concat_bgen(cfilepath, filepath, 2)
+
+    with bgen_file(filepath) as bgen:
+        bgen.create_metafile(mfilepath)
+
+    with bgen_file(cfilepath) as bgen:
+        bgen.create_metafile(tmp_path / "concat.metafile")
+        expected = (tmp_path / "concat.metafile").read_bytes()
+
+        bgen.extend_metafile(mfilepath)
+        assert mfilepath.read_bytes() == expected
+
+    with bgen_file(filepath) as bgen:
+        with pytest.raises(ValueError):
+            bgen.extend_metafile(tmp_path / "concat.metafile")
+
+    with bgen_file(filepath) as bgen:
+        bgen.create_metafile(tmp_path / "a.metafile")
+
+    merge_metafiles(
+        tmp_path / "merged.metafile",
+        [tmp_path / "a.metafile", tmp_path / "a.metafile"],
+        [filepath, filepath],
+    )
+    assert (tmp_path / "merged.metafile").read_bytes() == expected
+
+    with bgen_file(cfilepath) as bgen:
+        with bgen_metafile(tmp_path / "merged.metafile") as mf:
+            assert mf.nvariants == 8
+            part = mf.read_partition(mf.npartitions - 1)
+            gt = bgen.read_genotype(part.variants.offset[-1])
+            assert_allclose(
+                gt.probability,
+                [
+                    [0.0, 1.0, 0.0, 1.0],
+                    [1.0, 0.0, 1.0, 0.0],
+                    [0.0, 1.0, 1.0, 0.0],
+                    [1.0, 0.0, 0.0, 1.0],
+                ],
+            )
+
+
+def test_cbgen_open_metafile(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path)
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        with pytest.raises(RuntimeError):
+            bgen.open_metafile(auto=False)
+
+        with ThreadPoolExecutor(4) as executor:
+            nvariants = list(executor.map(_open_metafile_nvariants, [bgen] * 4))
+        assert nvariants == [4] * 4
+
+        cached = list((tmp_path / "metafile").glob("*.metafile"))
+        assert len(cached) == 1
+
+        with bgen.open_metafile(auto=False) as mf:
+            assert mf.filepath == cached[0]
+            assert mf.npartitions == 1
+
+        with bgen.open_metafile(tmp_path / "haplotypes.metafile") as mf:
+            assert mf.nvariants == 4
+
+
+def _open_metafile_nvariants(bgen: bgen_file) -> int:
+    with bgen_file(bgen.filepath) as other:
+        with other.open_metafile() as mf:
+            return mf.nvariants
+
+
+def test_cbgen_compact_strings():
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        samples = bgen.read_samples(compact=True)
+        assert len(samples) == 4
+        assert samples[1] == b"sample_1"
+        assert_array_equal(asarray(samples), bgen.read_samples())
+
+    with bgen_metafile(example.get("haplotypes.bgen.metafile")) as mf:
+        fixed = mf.read_partition(0).variants
+        compact = mf.read_partition(0, compact=True).variants
+
+    assert compact.size == 4
+    assert compact.id[0] == b"SNP1"
+    assert list(compact.rsid[1:3]) == [b"RS2", b"RS3"]
+    for name in ["id", "rsid", "chromosome", "allele_ids"]:
+        assert_array_equal(asarray(getattr(compact, name)), getattr(fixed, name))
+    assert_array_equal(compact.offset, fixed.offset)
+    assert_array_equal(compact.position, fixed.position)
+
+    chrom = compact.chromosome
+    assert_array_equal(chrom.categories, [b"1"])
+    assert_array_equal(chrom.codes, [0, 0, 0, 0])
+    assert chrom[2] == b"1"
+    assert_array_equal(chrom == b"1", [True] * 4)
+    assert_array_equal(chrom != b"1", [False] * 4)
+    assert_array_equal(chrom == b"2", [False] * 4)
+    assert chrom.code(b"2") == -1
+
+
+def test_cbgen_sample_indices(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path)
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        assert_array_equal(bgen.sample_indices(["sample_2", b"sample_0"]), [2, 0])
+        assert_array_equal(bgen.sample_indices([]), [])
+        with pytest.raises(ValueError):
+            bgen.sample_indices(["sample_9"])
+
+    assert len(list((tmp_path / "samples").glob("*.samples"))) == 1
+
+    with bgen_file(filepath) as bgen:
+        samples = bgen.read_samples()
+        assert_array_equal(bgen.sample_indices(samples[::-1]), [3, 2, 1, 0])
+
+    (cache,) = (tmp_path / "samples").glob("*.samples")
+    for corrupt in [b"PK\x03\x04" + b"\0" * 64, b""]:
+        cache.write_bytes(corrupt)
+        with bgen_file(filepath) as bgen:
+            assert_array_equal(bgen.sample_indices(["sample_3"]), [3])
+        assert cache.read_bytes() != corrupt
+
+
+def test_cbgen_as_array(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path)
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_partition(0).variants.offset
+            expected = asarray(
+                [bgen.read_genotype(i).probability[:, 1::2].sum(1) for i in offsets]
+            )
+            x = bgen.as_array(mf, chunks=(3, 2))
+
+        assert_allclose(bgen.read_dosage(offsets), expected)
+        assert_allclose(bgen.read_dosage(offsets, [3, 1]), expected[:, [3, 1]])
+        with pytest.raises(ValueError):
+            bgen.read_dosage(offsets, [4])
+
+    assert x.shape == (4, 4)
+    assert x.ndim == 2
+    assert x.chunks == ((3, 1), (2, 2))
+    assert_allclose(asarray(x), expected)
+    assert_allclose(x[1:3], expected[1:3])
+    assert_allclose(x[..., 2], expected[:, 2])
+    assert_allclose(x[[3, 0], 1:], expected[[3, 0], 1:])
+    assert_allclose(x[2, [True, False, True, False]], expected[2, [0, 2]])
+    assert x[2, 1].shape == ()
+
+    y = pickle.loads(pickle.dumps(x))
+    with ThreadPoolExecutor(4) as executor:
+        rows = list(executor.map(lambda i: y[i], range(4)))
+    assert_allclose(rows, expected)
+
+
+def test_cbgen_bgen_writer(tmp_path: Path):
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        samples = bgen.read_samples()
+        with bgen.open_metafile(tmp_path / "haplotypes.metafile") as mf:
+            variants = mf.read_partition(0).variants
+        genotypes = [bgen.read_genotype(i) for i in variants.offset]
+
+    probs = asarray([g.probability for g in genotypes])
+    probs[1, 2] = nan
+    alleles = [a.split(b",") for a in variants.allele_ids]
+    out = tmp_path / "out.bgen"
+
+    for compression, bits in [("zstd", 8), ("zlib", 3)]:
+        with bgen_writer(out, samples, compression=compression, bits=bits) as w:
+            for i in range(0, 4, 3):
+                w.write(
+                    probs[i : i + 3],
+                    variants.rsid[i : i + 3],
+                    variants.chromosome[i : i + 3],
+                    variants.position[i : i + 3],
+                    alleles[i : i + 3],
+                    id=variants.id[i : i + 3],
+                    phased=True,
+                )
+            assert w.nvariants == 4
+
+        with bgen_file(out) as bgen:
+            assert_array_equal(bgen.read_samples(), samples)
+            bgen.create_metafile(tmp_path / "out.metafile")
+            with bgen_metafile(f"{out}.metafile") as mf:
+                written = mf.read_partition(0).variants
+            for i, offset in enumerate(written.offset):
+                gt = bgen.read_genotype(offset)
+                assert gt.phased
+                assert_allclose(gt.probability, probs[i], atol=1 / (2**bits - 1))
+            assert bgen.read_genotype(written.offset[1]).missing[2]
+
+        assert_array_equal(written.rsid, variants.rsid)
+        assert_array_equal(written.allele_ids, variants.allele_ids)
+        expected = (tmp_path / "out.metafile").read_bytes()
+        assert Path(f"{out}.metafile").read_bytes() == expected
+
+    with pytest.raises(ValueError):
+        bgen_writer(out, samples, layout=1)
+
+    with pytest.raises(ValueError):
+        bgen_writer(out, samples, compression="lz4")
+
+    with bgen_writer(out, 3) as w:
+        with pytest.raises(ValueError):
+            w.write(
+                probs, variants.rsid, variants.chromosome, variants.position, alleles
+            )
+
+
+def test_cbgen_extract(tmp_path: Path):
+    filepath = example.get("haplotypes.bgen")
+    metafile = tmp_path / "haplotypes.metafile"
+
+    with bgen_file(filepath) as bgen:
+        bgen.create_metafile(metafile)
+        with bgen_metafile(metafile) as mf:
+            offsets = mf.read_offsets()
+            assert_array_equal(offsets, mf.read_partition(0).variants.offset)
+        rsid = bgen.read_variants().rsid
+        probs = [bgen.read_probability(i) for i in offsets]
+
+    dst = tmp_path / "subset.bgen"
+    index = [1, 2, 0, 3, 3]
+    extract(filepath, dst, offsets[index], metafile)
+
+    with bgen_file(dst) as bgen:
+        assert bgen.nvariants == 5
+        assert_array_equal(bgen.read_samples(), [b"sample_%d" % i for i in range(4)])
+        assert_array_equal(bgen.read_variants().rsid, rsid[index])
+        bgen.create_metafile(tmp_path / "subset.metafile")
+        with bgen_metafile(f"{dst}.metafile") as mf:
+            for offset, i in zip(mf.read_offsets(), index):
+                assert_allclose(bgen.read_probability(offset), probs[i])
+
+    expected = (tmp_path / "subset.metafile").read_bytes()
+    assert Path(f"{dst}.metafile").read_bytes() == expected
+
+    with pytest.raises(ValueError):
+        extract(filepath, dst, [offsets[0] + 1], metafile)
+
+
+def test_cbgen_dosage_cache(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path)
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            dosage = bgen.read_dosage(mf.read_offsets())
+
+        assert_allclose(bgen.read_samples_genotypes([2, 0, 2]), dosage[:, [2, 0, 2]])
+        assert len(list((tmp_path / "dosage").glob("*.dosage"))) == 1
+
+        cache = tmp_path / "tiles.cache"
+        bgen.create_dosage_cache(cache, tile=(3, 3))
+        assert_allclose(bgen.read_samples_genotypes([3, 1], cache), dosage[:, [3, 1]])
+        assert bgen.read_samples_genotypes([], cache).shape == (4, 0)
+        with pytest.raises(ValueError):
+            bgen.read_samples_genotypes([4], cache)
+
+
+def test_cbgen_dot(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path)
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+        dosage = bgen.read_dosage(offsets)
+
+        weights = asarray([[0.5, 1.0], [-1.0, 2.0], [0.0, 3.0], [2.0, -1.0]])
+        assert_allclose(bgen.dot(offsets, weights), dosage.T @ weights)
+        assert_allclose(
+            bgen.dot(offsets[1:], weights[1:, 0]), dosage[1:].T @ weights[1:, 0]
+        )
+        assert_allclose(bgen.rdot(weights), dosage @ weights)
+        assert_allclose(
+            bgen.rdot(weights[:, 1], offsets[[3, 0]]), dosage[[3, 0]] @ weights[:, 1]
+        )
+
+        with pytest.raises(ValueError):
+            bgen.dot(offsets[:2], weights)
+        with pytest.raises(ValueError):
+            bgen.rdot(weights[:3])
+
+
+def test_cbgen_ld_matrix(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path)
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+        dosage = bgen.read_dosage(offsets)
+
+        r2 = ld_matrix(bgen, offsets)
+        assert r2.dtype == "float32"
+        assert_allclose(r2, corrcoef(dosage) ** 2, atol=1e-6)
+
+        r2 = ld_matrix(bgen, offsets, [0, 1, 2], dtype=float64, tile=3)
+        assert_allclose(r2, corrcoef(dosage[:, :3]) ** 2, atol=1e-12)
+
+        z = bgen.read_dosage(offsets, standardize=True)
+        assert_allclose(z.sum(1), 0, atol=1e-12)
+        assert_allclose((z**2).sum(1), 1)
+
+        with pytest.raises(ValueError):
+            ld_matrix(bgen, offsets, dtype=int)
+        with pytest.raises(ValueError):
+            ld_matrix(bgen, offsets, tile=0)
+
+    assert_allclose(
+        ld_matrix(filepath, offsets, tile=1), corrcoef(dosage) ** 2, atol=1e-6
+    )
+
+
+def test_cbgen_synthetic(tmp_path: Path):
+    filepath = synthetic.make_bgen(
+        tmp_path / "unphased.bgen", 20, 7, bits=16, ploidy=3, missing=0.2, seed=1
+    )
+    with bgen_file(filepath) as bgen:
+        assert bgen.nsamples == 20
+        assert bgen.nvariants == 7
+        assert not bgen.contain_samples
+        with bgen_metafile(tmp_path / "unphased.bgen.metafile") as mf:
+            assert mf.nvariants == 7
+            offsets = mf.read_offsets()
+            assert mf.read_partition(0).variants.rsid[0] == b"rs1"
+        gt = bgen.read_genotype(offsets[6])
+        assert gt.probability.shape == (20, 4)
+        assert not gt.phased
+        assert_array_equal(gt.ploidy, 3)
+        assert gt.missing.any()
+        assert_allclose(gt.probability[~gt.missing].sum(1), 1, atol=1e-4)
+
+    filepath = synthetic.make_bgen(
+        tmp_path / "phased.bgen", 5, 3, compression="zlib", phased=True, seed=1
+    )
+    with bgen_file(filepath) as bgen:
+        with bgen_metafile(tmp_path / "phased.bgen.metafile") as mf:
+            gt = bgen.read_genotype(mf.read_offsets()[2])
+        assert gt.phased
+        assert gt.probability.shape == (5, 4)
+        assert not gt.missing.any()
+
+    other = synthetic.make_bgen(
+        tmp_path / "other.bgen", 5, 3, compression="zlib", phased=True
+    )
+    assert other.read_bytes() != filepath.read_bytes()
+    synthetic.make_bgen(other, 5, 3, compression="zlib", phased=True, seed=1)
+    assert other.read_bytes() == filepath.read_bytes()
+
+    probs = {}
+    for layout, compression in [(2, "zstd"), (2, None), (1, "zlib"), (1, None)]:
+        filepath = synthetic.make_bgen(
+            tmp_path / f"layout{layout}_{compression}.bgen",
+            20,
+            7,
+            layout=layout,
+            bits=16,
+            compression=compression,
+            missing=0.2,
+            seed=1,
+        )
+        with bgen_file(filepath) as bgen:
+            with bgen_metafile(f"{filepath}.metafile") as mf:
+                probs[layout, compression] = bgen.read_probabilities(mf.read_offsets())
+    assert_array_equal(probs[2, None], probs[2, "zstd"])
+    assert_array_equal(probs[1, None], probs[1, "zlib"])
+    assert_allclose(probs[1, None], probs[2, None], atol=1e-4)
+
+    with pytest.raises(ValueError):
+        synthetic.make_bgen(tmp_path / "invalid.bgen", 5, 3, layout=1, phased=True)
+    with pytest.raises(ValueError):
+        synthetic.make_bgen(tmp_path / "invalid.bgen", 5, 3, layout=1, ploidy=3)
+    with pytest.raises(ValueError):
+        synthetic.make_bgen(tmp_path / "invalid.bgen", 5, 3, layout=3)
+
+
+def test_cbgen_stats(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path)
+    filepath = example.get("haplotypes.bgen")
+
+    with bgen_file(filepath) as bgen:
+        assert bgen.stats is None
+        bgen.enable_stats()
+        assert bgen.stats.nblocks == 0
+
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+        with bgen.open_metafile():
+            pass
+        stats = bgen.stats
+        assert stats.cache_misses == 1
+        assert stats.cache_hits == 1
+
+        bgen.read_genotype(offsets[0])
+        bgen.read_probability(offsets[1], 32)
+        bgen.read_dosage(offsets[2:])
+        stats = bgen.stats
+        assert stats.nblocks == 4
+        assert stats.nbytes == 131
+        assert stats.read_time > 0
+        assert stats.decompress_time > 0
+        assert stats.decode_time > 0
+        assert stats.convert_time > 0
+        assert stats.alloc_bytes > 0
+
+        bgen.enable_stats()
+        bgen.dot(offsets, [1.0, 1.0, 1.0, 1.0])
+        assert bgen.stats.nblocks == 4
+
+        bgen.enable_stats(False)
+        assert bgen.stats is None
+
+
+def test_cbgen_lazy_import(tmp_path: Path):
+    code = (
+        "import sys, cbgen; "
+        "assert 'pooch' not in sys.modules; "
+        "assert 'cbgen.example' not in sys.modules; "
+        "assert 'cbgen._bgen_writer' not in sys.modules; "
+        "assert 'urllib.request' not in sys.modules; "
+        "assert callable(cbgen.extract); "
+        "assert cbgen.example.get is not None; "
+        "assert str(cbgen.BGEN_CACHE_HOME) == sys.argv[1]"
+    )
+    cache_home = tmp_path / "cache"
+    env = dict(os.environ, BGEN_CACHE_HOME=str(cache_home))
+    subprocess.run([sys.executable, "-c", code, str(cache_home)], env=env, check=True)
+    assert not cache_home.exists()
+
+    filepath = synthetic.make_bgen(tmp_path / "a.bgen", 5, 3)
+    code = (
+        "import sys, cbgen; "
+        "bgen = cbgen.bgen_file(sys.argv[1]); "
+        "offsets = bgen.open_metafile().read_offsets(); "
+        "bgen.read_dosage(offsets); "
+        "assert 'cbgen._remote' not in sys.modules; "
+        "assert 'cbgen._columnar' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code, str(filepath)], env=env, check=True)
+
+
+def test_cbgen_genotype_fields(tmp_path: Path):
+    filepath = tmp_path / "fields.bgen"
+    diploid = asarray([[[1.0, 0.0, 0.0]] * 4])
+    triploid = asarray([[[1.0, 0.0, 0.0, 0.0]] * 4])
+    ploidy = asarray([1, 2, 3, 2])
+    missing = asarray([[False] * 4, [False, True, False, False]])
+    with bgen_writer(filepath, 4) as writer:
+        writer.write(
+            diploid, ["rs1"], ["1"], [1], [["A", "G"]], ploidy=2, missing=missing[:1]
+        )
+        writer.write(
+            triploid,
+            ["rs2"],
+            ["1"],
+            [2],
+            [["A", "G"]],
+            ploidy=ploidy,
+            missing=missing[1:],
+        )
+
+    with bgen_file(filepath) as bgen:
+        with bgen_metafile(tmp_path / "fields.bgen.metafile") as mf:
+            offsets = mf.read_offsets()
+
+        gt = bgen.read_genotype(offsets[0])
+        assert not gt.has_missing
+        assert_array_equal(gt.ploidy, [2, 2, 2, 2])
+        assert_array_equal(gt.missing, [False] * 4)
+        assert not gt.ploidy.flags.writeable
+
+        gt = bgen.read_genotype(offsets[1], 32)
+        assert gt.has_missing
+        assert_array_equal(gt.ploidy, ploidy)
+        assert_array_equal(gt.missing, missing[1])
+
+
+def test_cbgen_sparse_dosage(tmp_path: Path):
+    filepath = synthetic.make_bgen(tmp_path / "rare.bgen", 300, 40, missing=0.05)
+    with bgen_file(filepath) as bgen:
+        with bgen_metafile(tmp_path / "rare.bgen.metafile") as mf:
+            offsets = mf.read_offsets()
+        dense = bgen.read_dosage(offsets)
+
+        for threshold in [0.0, 0.5, 1.5]:
+            sparse = bgen.read_sparse_dosage(offsets, threshold)
+            assert sparse.shape == dense.shape
+            assert sparse.indptr[-1] == sparse.nnz
+            expected = where(isnan(dense) | (dense > threshold), dense, 0.0)
+            assert_array_equal(sparse.toarray(), expected)
+
+        sparse = bgen.read_sparse_dosage(offsets[[5, 1]], 1.0)
+        expected = dense[[5, 1]]
+        expected = where(isnan(expected) | (expected > 1.0), expected, 0.0)
+        assert_array_equal(sparse.toarray(), expected)
+
+        sparse = bgen.read_sparse_dosage([])
+        assert sparse.shape == (0, 300)
+        assert sparse.nnz == 0
+
+
+def test_cbgen_bgen_dataset(tmp_path: Path):
+    filepaths = [
+        synthetic.make_bgen(tmp_path / f"chr{i}.bgen", 30, n, seed=i)
+        for i, n in enumerate([5, 8, 3])
+    ]
+    dense = []
+    for filepath in filepaths:
+        with bgen_file(filepath) as bgen:
+            with bgen_metafile(f"{filepath}.metafile") as mf:
+                dense.append(bgen.read_dosage(mf.read_offsets()))
+
+    metafiles = [f"{filepath}.metafile" for filepath in filepaths]
+    with bgen_dataset(filepaths, metafiles, nthreads=2) as ds:
+        assert ds.nfiles == 3
+        assert ds.nsamples == 30
+        assert ds.nvariants == 16
+
+        files, _ = ds.locate([0, 5, 12, 13, 15])
+        assert_array_equal(files, [0, 1, 1, 2, 2])
+
+        indices = [14, 0, 6, 4, 15, 7]
+        expected = concatenate(dense)[indices]
+        assert_array_equal(ds.read_dosage(indices), expected)
+        assert_allclose(
+            ds.read_dosage(indices, [3, 1], 32), expected[:, [3, 1]], rtol=1e-6
+        )
+
+        gt = ds.read_genotype(13)
+        assert_allclose(gt.probability[:, 1] + 2 * gt.probability[:, 2], dense[2][0])
+
+        assert_array_equal(ds.region("1", 2, 4), [1, 6, 14, 2, 7, 15])
+        assert_array_equal(ds.region(b"1", 8), [12])
+        assert ds.region("2").size == 0
+
+        with pytest.raises(ValueError):
+            ds.read_dosage([16])
+
+    other = synthetic.make_bgen(tmp_path / "other.bgen", 31, 2)
+    with pytest.raises(ValueError):
+        bgen_dataset([filepaths[0], other])
+
+
+def test_cbgen_bgen_dataset_invalid(tmp_path: Path, monkeypatch):
+    unraisable = []
+    monkeypatch.setattr(sys, "unraisablehook", unraisable.append)
+
+    filepath = synthetic.make_bgen(tmp_path / "a.bgen", 30, 5)
+    with pytest.raises(ValueError):
+        bgen_dataset([])
+    with pytest.raises(ValueError):
+        bgen_dataset([filepath], [f"{filepath}.metafile"] * 2)
+
+    gc.collect()
+    assert unraisable == []
+
+
+def test_cbgen_grm(tmp_path: Path):
+    filepath = synthetic.make_bgen(tmp_path / "a.bgen", 30, 50, missing=0.1, seed=3)
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+        dosage = bgen.read_dosage(offsets)
+
+    mean = nanmean(dosage, axis=1, keepdims=True)
+    x = where(isnan(dosage), mean, dosage) - mean
+    x = x / x.std(axis=1, keepdims=True)
+    expected = x.T @ x / x.shape[0]
+
+    assert_allclose(grm(filepath), expected, atol=1e-12)
+    assert_allclose(grm(filepath, block_variants=7, nthreads=3), expected, atol=1e-12)
+
+    metafile = tmp_path / "a.bgen.metafile"
+    with bgen_file(filepath) as bgen:
+        K = grm(bgen, metafile, [3, 0, 29], block_variants=8, dtype=float32)
+    assert K.dtype == "float32"
+
+    x = dosage[:, [3, 0, 29]]
+    mean = nanmean(x, axis=1, keepdims=True)
+    x = where(isnan(x), mean, x) - mean
+    std = x.std(axis=1, keepdims=True)
+    x = x[std[:, 0] > 0] / std[std[:, 0] > 0]
+    assert_allclose(K, x.T @ x / x.shape[0], atol=1e-5)
+
+    with bgen_file(filepath) as bgen:
+        with bgen_metafile(metafile) as mf:
+            assert_allclose(grm(bgen, mf), expected, atol=1e-12)
+            assert_array_equal(mf.read_offsets(), offsets)
+
+    with pytest.raises(ValueError):
+        grm(filepath, block_variants=0)
+    with pytest.raises(ValueError):
+        grm(filepath, dtype=int)
+
+
+def test_cbgen_layout(tmp_path: Path):
+    filepath = synthetic.make_bgen(tmp_path / "a.bgen", 9, 6, missing=0.2, seed=4)
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+
+        probs = asarray([bgen.read_probability(o) for o in offsets])
+        p = bgen.read_probabilities(offsets)
+        assert p.flags.c_contiguous
+        assert_array_equal(p, probs)
+
+        p = bgen.read_probabilities(offsets, layout="sample")
+        assert p.transpose(1, 0, 2).flags.c_contiguous
+        assert_array_equal(p, probs)
+
+        p = bgen.read_probabilities(offsets, 32, "planes")
+        assert p.dtype == "float32"
+        assert all(p[..., k].flags.c_contiguous for k in range(3))
+        assert_array_equal(p, probs.astype(float32))
+
+        assert bgen.read_probabilities([]).shape == (0, 9, 0)
+
+        dosage = bgen.read_dosage(offsets, [8, 1, 3])
+        x = bgen.read_dosage(offsets, [8, 1, 3], layout="sample")
+        assert x.flags.f_contiguous
+        assert_array_equal(x, dosage)
+
+        x = bgen.read_dosage(offsets, precision=32, standardize=True, layout="sample")
+        assert x.flags.f_contiguous
+        assert_allclose(x, bgen.read_dosage(offsets, standardize=True), rtol=1e-6)
+
+        with pytest.raises(ValueError):
+            bgen.read_dosage(offsets, layout="planes")
+        with pytest.raises(ValueError):
+            bgen.read_probabilities(offsets, layout="F")
+
+    out = tmp_path / "mixed.bgen"
+    with bgen_writer(out, 2) as w:
+        w.write([[[1.0, 0.0, 0.0]] * 2], ["rs1"], ["1"], [1], [["A", "G"]])
+        w.write([[[0.0, 1.0]] * 2], ["rs2"], ["1"], [2], [["A", "G"]], ploidy=1)
+    with bgen_file(out) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+        assert_array_equal(bgen.read_probabilities(offsets[1:])[0], [[0, 1], [0, 1]])
+        with pytest.raises(ValueError):
+            bgen.read_probabilities(offsets)
+
+
+class _range_handler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match is None:
+            self.send_error(400)
+            return
+        with open(self.translate_path(self.path), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start = int(match[1])
+            f.seek(start)
+            data = f.read(int(match[2]) + 1 - start)
+        self.server.nbytes += len(data)
+        self.send_response(206)
+        self.send_header(
+            "Content-Range", f"bytes {start}-{start + len(data) - 1}/{size}"
+        )
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def http_server(tmp_path: Path):
+    handler = partial(_range_handler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.nbytes = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_cbgen_remote(tmp_path: Path, http_server, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path / "cache")
+    filepath = synthetic.make_bgen(tmp_path / "a.bgen", 2000, 400, bits=16, seed=5)
+    with bgen_file(filepath) as bgen:
+        bgen.create_metafile(tmp_path / "a.bgen.metafile")
+        with bgen_metafile(tmp_path / "a.bgen.metafile") as mf:
+            offsets = mf.read_offsets()
+            assert mf.npartitions == 3
+            rsid = mf.read_partition(2).variants.rsid
+        probs = bgen.read_probability(offsets[100])
+        dosage = bgen.read_dosage(offsets)
+    size = filepath.stat().st_size
+    url = f"http://127.0.0.1:{http_server.server_port}/a.bgen"
+
+    with bgen_metafile(url + ".metafile") as mf:
+        assert_array_equal(mf.read_partition(2).variants.rsid, rsid)
+        assert_array_equal(mf.read_offsets(), offsets)
+
+    with bgen_file(url) as bgen:
+        assert bgen.source == url
+        assert bgen.nvariants == 400
+        assert bgen.nsamples == 2000
+        nbytes = http_server.nbytes
+        assert_array_equal(bgen.read_probability(offsets[100]), probs)
+        assert http_server.nbytes - nbytes < size // 4
+        assert_array_equal(bgen.read_dosage(offsets[::7]), dosage[::7])
+
+    nbytes = http_server.nbytes
+    with bgen_file(url) as bgen:
+        assert_array_equal(bgen.read_dosage(offsets[::7]), dosage[::7])
+    assert http_server.nbytes == nbytes
+
+    reader = http_reader(url)
+    assert reader.size == size
+    copy = tmp_path / "copy.bgen"
+    with block_cache(reader, copy, block_size=1 << 14, nthreads=4) as cache:
+        with bgen_file(cache) as bgen:
+            assert bgen.source is cache
+            assert_array_equal(bgen.read_dosage(offsets[::-3]), dosage[::-3])
+            assert_array_equal(bgen.read_dosage(offsets), dosage)
+        assert cache.filepath == copy
+    assert filepath.read_bytes() == copy.read_bytes()
+
+    with pytest.raises(RuntimeError):
+        bgen_file(url + ".missing")
+
+
+def test_cbgen_haplotypes(tmp_path: Path):
+    filepath = synthetic.make_bgen(
+        tmp_path / "a.bgen", 30, 8, bits=16, ploidy=3, phased=True, missing=0.1
+    )
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+        probs = asarray([bgen.read_probability(o) for o in offsets])
+
+        alleles = where(probs[..., 1::2] >= 0.7, 1, -1)
+        alleles = where(probs[..., 0::2] >= 0.7, 0, alleles).reshape(8, -1)
+        haplotypes = bgen.read_haplotypes(offsets, 3, 0.7)
+        assert haplotypes.dtype == "int8"
+        assert_array_equal(haplotypes, alleles)
+
+        haplotypes = bgen.read_haplotypes(offsets, 4, 0.7).reshape(8, 30, 4)
+        assert_array_equal(haplotypes[..., :3].reshape(8, -1), alleles)
+        assert (haplotypes[..., 3] == -1).all()
+
+        with pytest.raises(ValueError):
+            bgen.read_haplotypes(offsets)
+        with pytest.raises(ValueError):
+            bgen.read_haplotypes(offsets, 3, 0.5)
+
+    filepath = synthetic.make_bgen(tmp_path / "b.bgen", 3, 2)
+    with bgen_file(filepath) as bgen:
+        with bgen.open_metafile() as mf:
+            offsets = mf.read_offsets()
+        with pytest.raises(ValueError):
+            bgen.read_haplotypes(offsets)
+
+
+def test_cbgen_columnar_metafile(tmp_path: Path, http_server, monkeypatch):
+    monkeypatch.setattr("cbgen._cache.BGEN_CACHE_HOME", tmp_path / "cache")
+    filepath = synthetic.make_bgen(tmp_path / "a.bgen", 10, 400, bits=8, seed=3)
+    columnar = tmp_path / "a.bgen.columnar"
+    with bgen_file(filepath) as bgen:
+        bgen.create_metafile(tmp_path / "a.bgen.metafile")
+        bgen.create_metafile(columnar, columnar=True)
+        with pytest.raises(ValueError):
+            bgen.create_metafile(tmp_path / "lazy.metafile", lazy=True, columnar=True)
+    assert list(tmp_path.glob("*.rows")) == []
+    assert columnar.stat().st_size < (tmp_path / "a.bgen.metafile").stat().st_size
+
+    with bgen_metafile(tmp_path / "a.bgen.metafile") as mf:
+        with bgen_metafile(columnar) as cmf:
+            assert cmf.nvariants == mf.nvariants
+            assert cmf.npartitions == mf.npartitions == 3
+            assert_array_equal(cmf.read_offsets(), mf.read_offsets())
+            for i in range(mf.npartitions):
+                for compact in [False, True]:
+                    expected = mf.read_partition(i, compact)
+                    part = cmf.read_partition(i, compact)
+                    assert part.offset == expected.offset
+                    for name in ["id", "rsid", "chromosome", "allele_ids"]:
+                        x = asarray(getattr(part.variants, name))
+                        assert_array_equal(x, asarray(getattr(expected.variants, name)))
+                    for name in ["position", "nalleles", "offset"]:
+                        x = getattr(part.variants, name)
+                        assert_array_equal(x, getattr(expected.variants, name))
+                        assert x.dtype == getattr(expected.variants, name).dtype
+            with pytest.raises(RuntimeError):
+                cmf.read_partition(3)
+            rsid = mf.read_partition(1).variants.rsid
+
+    url = f"http://127.0.0.1:{http_server.server_port}/a.bgen.columnar"
+    with bgen_metafile(url) as mf:
+        assert mf.nvariants == 400
+        assert_array_equal(mf.read_partition(1).variants.rsid, rsid)
+
+    with pytest.raises(RuntimeError):
+        merge_metafiles(tmp_path / "merged.metafile", [columnar], [filepath])
+
+
+def test_cbgen_inflater(tmp_path: Path):
+    probs = {}
+    for compression in ["zlib", "zstd"]:
+        filepath = synthetic.make_bgen(
+            tmp_path / f"{compression}.bgen",
+            25,
+            6,
+            compression=compression,
+            bits=12,
+            ploidy=2,
+            missing=0.2,
+            seed=5,
+        )
+        with bgen_file(filepath) as bgen:
+            with bgen.open_metafile() as mf:
+                offsets = mf.read_offsets()
+            probs[compression] = bgen.read_probabilities(offsets)
+
+            if compression == "zlib":
+                assert bgen.inflater in ["zlib", "libdeflate"]
+                with pytest.raises(ValueError):
+                    bgen.set_inflater("gzip")
+                bgen.set_inflater("zlib")
+                assert bgen.inflater == "zlib"
+                assert_array_equal(bgen.read_probabilities(offsets), probs["zlib"])
+                gt = bgen.read_genotype(offsets[3])
+                assert_array_equal(gt.probability, probs["zlib"][3])
+
+    assert_array_equal(probs["zlib"], probs["zstd"])
+    assert isnan(probs["zlib"]).any()
+
+
+def _libbgen_probability(bgen: bgen_file, offset: int, precision: int):
+    from cbgen._ffi import ffi, lib
+
+    gt = lib.bgen_file_open_genotype(bgen._bgen_file, int(offset))
+    assert gt != ffi.NULL
+    ncombs = lib.bgen_genotype_ncombs(gt)
+    if precision == 64:
+        p = empty((bgen.nsamples, ncombs), dtype=float64)
+        err = lib.bgen_genotype_read64(gt, ffi.cast("double *", p.ctypes.data))
+    else:
+        p = empty((bgen.nsamples, ncombs), dtype=float32)
+        err = lib.bgen_genotype_read32(gt, ffi.cast("float *", p.ctypes.data))
+    lib.bgen_genotype_close(gt)
+    assert err == 0
+    return p
+
+
+def _assert_libbgen_probabilities(filepath: Path):
+    with bgen_metafile(f"{filepath}.metafile") as mf:
+        offsets = mf.read_offsets()
+    with bgen_file(filepath) as bgen:
+        for precision in [64, 32]:
+            for offset in offsets:
+                expected = _libbgen_probability(bgen, offset, precision)
+                assert_array_equal(bgen.read_probability(offset, precision), expected)
+
+
+def test_cbgen_libbgen_parity(tmp_path: Path):
+    for compression, phased, ploidy, bits in product(
+        ["zlib", "zstd"], [False, True], [1, 2, 3], [1, 8, 16, 23, 32]
+    ):
+        filepath = synthetic.make_bgen(
+            tmp_path / f"{compression}{phased:d}{ploidy}_{bits}.bgen",
+            7,
+            3,
+            compression=compression,
+            bits=bits,
+            ploidy=ploidy,
+            phased=phased,
+            missing=0.3,
+            seed=bits,
+        )
+        _assert_libbgen_probabilities(filepath)
+
+    nsamples = 6
+    ploidy = [1, 2, 3, 2, 1, 3]
+    probs = full((2, nsamples, 10), nan)
+    for j, n in enumerate(ploidy):
+        k = [3, 6, 10][n - 1]
+        probs[:, j, :k] = 1 / k
+    missing = zeros((2, nsamples), dtype=bool)
+    missing[1, 2] = True
+    for compression, bits in [("zlib", 5), ("zstd", 13)]:
+        filepath = tmp_path / f"mixed_{compression}.bgen"
+        with bgen_writer(filepath, nsamples, compression=compression, bits=bits) as w:
+            w.write(
+                probs,
+                ["rs1", "rs2"],
+                ["1", "1"],
+                [1, 2],
+                [["A", "C", "G"]] * 2,
+                ploidy=ploidy,
+                missing=missing,
+            )
+        _assert_libbgen_probabilities(filepath)
+
+    for compression in [None, "zlib"]:
+        filepath = synthetic.make_bgen(
+            tmp_path / f"layout1_{compression}.bgen",
+            9,
+            4,
+            layout=1,
+            compression=compression,
+            missing=0.2,
+            seed=2,
+        )
+        _assert_libbgen_probabilities(filepath)
+        with bgen_file(filepath) as bgen:
+            with bgen_metafile(f"{filepath}.metafile") as mf:
+                gt = bgen.read_genotype(mf.read_offsets()[1])
+            assert gt.missing.any()
@@ -1,7 +1,22 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Iterator, Optional, Protocol, Tuple, Union
+
+from numpy import arange, asarray, diff, flatnonzero, repeat, uint8, zeros
 
-__all__ = ["CData", "DtypeLike", "Variants", "Genotype", "Partition"]
+__all__ = [
+    "CData",
+    "CategoricalArray",
+    "DtypeLike",
+    "Variants",
+    "Genotype",
+    "Partition",
+    "RangeReader",
+    "ReadStats",
+    "SparseDosage",
+    "StringArray",
+]
 
 # Waiting for official type hint: https://foss.heptapod.net/pypy/cffi/issues/456
 CData = Any
@@ -34,6 +49,8 @@ class Genotype:
     [2 2 2 2]
     >>> print(gt.missing)
     [False False False False]
+    >>> print(gt.has_missing)
+    False
     >>> mf.close()
     >>> bgen.close()
 
@@ -47,12 +64,204 @@ class Genotype:
         Ploidy.
     missing
         Missingness.
+    has_missing
+        Whether any genotype is missing. Defaults to whether ``missing`` has a
+        ``True`` value.
     """
 
     probability: DtypeLike
     phased: DtypeLike
     ploidy: DtypeLike
     missing: DtypeLike
+    has_missing: Optional[bool] = None
+
+    def __post_init__(self):
+        if self.has_missing is None:
+            self.has_missing = bool(asarray(self.missing).any())
+
+
+@dataclass(repr=False)
+class StringArray:
+    """
+    Array of variable-length byte strings.
+
+    Strings are stored back to back in a single data buffer, the ``i``-th
+    string spanning ``data[offsets[i]:offsets[i + 1]]``. Unlike a fixed-width
+    array, a single long string does not inflate every other element. Strings
+    are only decoded when accessed; :func:`numpy.asarray` converts it to a
+    fixed-width byte-string array.
+
+    >>> import cbgen
+    >>> import numpy
+    >>>
+    >>> mf = cbgen.bgen_metafile(cbgen.example.get("haplotypes.bgen.metafile"))
+    >>> ids = mf.read_partition(0, compact=True).variants.id
+    >>> print(type(ids))
+    <class 'cbgen.typing.StringArray'>
+    >>> print(len(ids))
+    4
+    >>> print(ids[3])
+    b'SNP4'
+    >>> print(numpy.asarray(ids))
+    [b'SNP1' b'SNP2' b'SNP3' b'SNP4']
+    >>> mf.close()
+
+    Attributes
+    ----------
+    offsets
+        String offsets into the data buffer, one more than the number of
+        strings.
+    data
+        Data buffer.
+    """
+
+    offsets: DtypeLike
+    data: DtypeLike
+
+    @property
+    def shape(self):
+        """
+        Array shape.
+
+        Returns
+        -------
+        Array shape.
+        """
+        return (len(self),)
+
+    def __len__(self) -> int:
+        return self.offsets.shape[0] - 1
+
+    def __repr__(self) -> str:
+        return f"StringArray({asarray(self)!r})"
+
+    def __getitem__(self, index) -> Union[bytes, StringArray, DtypeLike]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return StringArray(
+                    self.offsets[start : max(start, stop) + 1], self.data
+                )
+            return asarray(self)[index]
+
+        if hasattr(index, "__index__"):
+            i = index.__index__()
+            if i < 0:
+                i += len(self)
+            if not 0 <= i < len(self):
+                raise IndexError("StringArray index out of range.")
+            return self.data[self.offsets[i] : self.offsets[i + 1]].tobytes()
+
+        return asarray(self)[index]
+
+    def __iter__(self) -> Iterator[bytes]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        lengths = diff(self.offsets)
+        width = max(int(lengths.max(initial=0)), 1)
+        arr = zeros((len(self), width), dtype=uint8)
+        arr[arange(width) < lengths[:, None]] = self.data[
+            self.offsets[0] : self.offsets[-1]
+        ]
+        arr = arr.view(f"S{width}").reshape(len(self))
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
+
+
+@dataclass(repr=False, eq=False)
+class CategoricalArray:
+    """
+    Dictionary-encoded array of byte strings.
+
+    Each element is stored as an integer code into a small array of distinct
+    values, the categories. Comparing it against a value compares codes, as
+    in ``chromosome == b"1"``.
+
+    >>> import cbgen
+    >>> import numpy
+    >>>
+    >>> mf = cbgen.bgen_metafile(cbgen.example.get("haplotypes.bgen.metafile"))
+    >>> chrom = mf.read_partition(0, compact=True).variants.chromosome
+    >>> print(type(chrom))
+    <class 'cbgen.typing.CategoricalArray'>
+    >>> print(chrom.categories)
+    [b'1']
+    >>> print(chrom.codes)
+    [0 0 0 0]
+    >>> print(chrom[3])
+    b'1'
+    >>> print(chrom == b"1")
+    [ True  True  True  True]
+    >>> mf.close()
+
+    Attributes
+    ----------
+    codes
+        Category index of each element.
+    categories
+        Distinct values.
+    """
+
+    codes: DtypeLike
+    categories: DtypeLike
+
+    @property
+    def shape(self):
+        """
+        Array shape.
+
+        Returns
+        -------
+        Array shape.
+        """
+        return self.codes.shape
+
+    def code(self, value: bytes) -> int:
+        """
+        Code of a value.
+
+        Parameters
+        ----------
+        value
+            Value.
+
+        Returns
+        -------
+        Code of the value; ``-1`` if it is not a category.
+        """
+        found = flatnonzero(self.categories == value)
+        return int(found[0]) if found.size > 0 else -1
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def __repr__(self) -> str:
+        return f"CategoricalArray({asarray(self)!r})"
+
+    def __getitem__(self, index) -> Union[bytes, CategoricalArray]:
+        codes = self.codes[index]
+        if codes.ndim == 0:
+            return self.categories[codes]
+        return CategoricalArray(codes, self.categories)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for c in self.codes:
+            yield self.categories[c]
+
+    def __eq__(self, value):
+        return self.codes == self.code(value)
+
+    def __ne__(self, value):
+        return self.codes != self.code(value)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.categories[self.codes]
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
 
 
 @dataclass
@@ -103,6 +312,9 @@ class Variants:
         Allele identifications.
     offset
         Variant offset.
+
+    For compact partitions, ``chromosome`` is a :class:`CategoricalArray` and
+    the other string attributes are :class:`StringArray`.
     """
 
     id: DtypeLike
@@ -122,7 +334,7 @@ class Variants:
         -------
         Number of variants.
         """
-        return self.id.shape[0]
+        return len(self.position)
 
 
 @dataclass
@@ -154,3 +366,147 @@ class Partition:
 
     offset: int
     variants: Variants
+
+
+@dataclass
+class SparseDosage:
+    """
+    Variant-by-sample dosage matrix in compressed sparse row format.
+
+    The dosages of variant ``i`` are ``data[indptr[i]:indptr[i + 1]]``, for
+    the samples ``indices[indptr[i]:indptr[i + 1]]`` in increasing order.
+    Dosages that are not stored are zero. The arrays can be passed to
+    ``scipy.sparse.csr_matrix((data, indices, indptr), shape)``.
+
+    >>> import cbgen
+    >>>
+    >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+    ...     with bgen.open_metafile() as mf:
+    ...         offsets = mf.read_offsets()
+    ...     dosage = bgen.read_sparse_dosage(offsets[:2])
+    >>> print(type(dosage))
+    <class 'cbgen.typing.SparseDosage'>
+    >>> print(dosage.indptr)
+    [0 3 6]
+    >>> print(dosage.indices)
+    [1 2 3 0 1 2]
+    >>> print(dosage.toarray())
+    [[0. 1. 1. 2.]
+     [1. 1. 2. 0.]]
+
+    Attributes
+    ----------
+    indptr
+        Offsets of the stored dosages of each variant.
+    indices
+        Sample indices of the stored dosages.
+    data
+        Stored dosages.
+    shape
+        Number of variants and number of samples.
+    """
+
+    indptr: DtypeLike
+    indices: DtypeLike
+    data: DtypeLike
+    shape: Tuple[int, int]
+
+    @property
+    def nnz(self) -> int:
+        """
+        Number of stored dosages.
+        """
+        return len(self.data)
+
+    def toarray(self) -> DtypeLike:
+        """
+        Dense dosage matrix.
+
+        Returns
+        -------
+        Variant-by-sample dosage matrix.
+        """
+        dense = zeros(self.shape, dtype=self.data.dtype)
+        rows = repeat(arange(self.shape[0]), diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
+
+
+@dataclass
+class ReadStats:
+    """
+    Counters of genotype reading, split by phase.
+
+    >>> import cbgen
+    >>>
+    >>> with cbgen.bgen_file(cbgen.example.get("haplotypes.bgen")) as bgen:
+    ...     with bgen.open_metafile() as mf:
+    ...         offsets = mf.read_offsets()
+    ...     bgen.enable_stats()
+    ...     gt = bgen.read_genotype(offsets[0])
+    ...     stats = bgen.stats
+    >>> print(type(stats))
+    <class 'cbgen.typing.ReadStats'>
+    >>> print(stats.nblocks)
+    1
+
+    Attributes
+    ----------
+    nblocks
+        Number of genotype blocks decoded.
+    nbytes
+        Number of bytes of genotype blocks read.
+    read_time
+        Seconds spent reading genotype blocks from the file.
+    decompress_time
+        Seconds spent decompressing genotype blocks.
+    decode_time
+        Seconds spent unpacking probabilities from decompressed blocks.
+    convert_time
+        Seconds spent converting and copying probabilities into their
+        returned form, such as dosages.
+    alloc_bytes
+        Number of bytes allocated for decoded data.
+    cache_hits
+        Number of lookups of cached files that found them.
+    cache_misses
+        Number of lookups of cached files that had to create them.
+    """
+
+    nblocks: int
+    nbytes: int
+    read_time: float
+    decompress_time: float
+    decode_time: float
+    convert_time: float
+    alloc_bytes: int
+    cache_hits: int
+    cache_misses: int
+
+
+class RangeReader(Protocol):
+    """
+    Reader of byte ranges of a remote file.
+
+    Any object with these members can back a :class:`cbgen.block_cache`, and
+    can therefore be opened by :class:`cbgen.bgen_file` and
+    :class:`cbgen.bgen_metafile`. :class:`cbgen.http_reader` implements it for
+    files served over HTTP.
+
+    Attributes
+    ----------
+    key
+        Key identifying the file content, which should change whenever the
+        file does. It names the local copy of the file.
+    size
+        File size in bytes.
+    """
+
+    key: str
+    size: int
+
+    def read(self, start: int, stop: int) -> bytes:
+        """
+        Read the bytes from ``start`` up to, but excluding, ``stop``.
+        """
+        ...
@@ -0,0 +1,126 @@
+#include <math.h>
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+struct bit_writer
+{
+    uint8_t* out;
+    uint64_t acc;
+    unsigned nacc;
+};
+
+static void put_bits(struct bit_writer* w, uint64_t value, unsigned bits)
+{
+    w->acc |= value << w->nacc;
+    w->nacc += bits;
+    while (w->nacc >= 8) {
+        *w->out++ = (uint8_t)w->acc;
+        w->acc >>= 8;
+        w->nacc -= 8;
+    }
+}
+
+static void flush_bits(struct bit_writer* w)
+{
+    if (w->nacc > 0)
+        *w->out++ = (uint8_t)w->acc;
+    w->acc = 0;
+    w->nacc = 0;
+}
+
+/* Store `n - 1` of the `n` probabilities of a group, scaled to integers summing to 2^bits-1.
+ *
+ * Probabilities are floored and the remainder is given to those with the largest fractional
+ * parts, as described in the BGEN specification. Missing samples are stored as zeros.
+ */
+static void put_group(struct bit_writer* w, double const* probs, unsigned n, uint8_t bits,
+                      bool missing, uint64_t* values, double* frac)
+{
+    double const scale = (double)((UINT64_C(1) << bits) - 1);
+    uint64_t     total = 0;
+
+    for (unsigned j = 0; j < n; ++j) {
+        double p = probs[j];
+        p = isnan(p) || missing ? 0.0 : (p < 0.0 ? 0.0 : (p > 1.0 ? 1.0 : p));
+        double v = p * scale;
+        values[j] = (uint64_t)floor(v);
+        frac[j] = v - floor(v);
+        total += values[j];
+    }
+
+    if (!missing) {
+        uint64_t remainder = total < (uint64_t)scale ? (uint64_t)scale - total : 0;
+        if (remainder > n)
+            remainder = n;
+        for (; remainder > 0; --remainder) {
+            unsigned k = 0;
+            for (unsigned j = 1; j < n; ++j) {
+                if (frac[j] > frac[k])
+                    k = j;
+            }
+            if (frac[k] <= 0.0)
+                break;
+            values[k] += 1;
+            frac[k] = -1.0;
+        }
+    }
+
+    for (unsigned j = 0; j + 1 < n; ++j)
+        put_bits(w, values[j], bits);
+}
+
+/* Encode an uncompressed layout 2 genotype block.
+ *
+ * `probs` holds `ncombs` probabilities per sample, as returned by `bgen_genotype_read64`.
+ * Returns the number of bytes written to `out`, or zero on a memory allocation failure.
+ */
+static size_t encode_genotype(double const* probs, uint32_t nsamples, uint32_t ncombs,
+                              uint16_t nalleles, uint8_t const* ploidy, bool const* missing,
+                              bool phased, uint8_t bits, uint8_t* out)
+{
+    uint8_t min_ploidy = nsamples > 0 ? 63 : 0;
+    uint8_t max_ploidy = 0;
+    for (uint32_t i = 0; i < nsamples; ++i) {
+        min_ploidy = ploidy[i] < min_ploidy ? ploidy[i] : min_ploidy;
+        max_ploidy = ploidy[i] > max_ploidy ? ploidy[i] : max_ploidy;
+    }
+
+    uint64_t* values = malloc(ncombs * sizeof(uint64_t));
+    double*   frac = malloc(ncombs * sizeof(double));
+    if (values == NULL || frac == NULL) {
+        free(values);
+        free(frac);
+        return 0;
+    }
+
+    uint8_t* start = out;
+    memcpy(out, &nsamples, 4);
+    memcpy(out + 4, &nalleles, 2);
+    out[6] = min_ploidy;
+    out[7] = max_ploidy;
+    out += 8;
+    for (uint32_t i = 0; i < nsamples; ++i)
+        *out++ = (uint8_t)(ploidy[i] | (missing[i] << 7));
+    *out++ = (uint8_t)phased;
+    *out++ = bits;
+
+    struct bit_writer w = {out, 0, 0};
+    for (uint32_t i = 0; i < nsamples; ++i) {
+        double const* p = probs + (size_t)i * ncombs;
+        if (phased) {
+            for (uint8_t h = 0; h < ploidy[i]; ++h)
+                put_group(&w, p + h * nalleles, nalleles, bits, missing[i], values, frac);
+        } else {
+            unsigned n = unphased_ncombs(ploidy[i], nalleles);
+            put_group(&w, p, n, bits, missing[i], values, frac);
+        }
+    }
+    flush_bits(&w);
+
+    free(values);
+    free(frac);
+    return (size_t)(w.out - start);
+}
@@ -0,0 +1,10 @@
+static size_t encode_genotype(double const *probs, uint32_t nsamples, uint32_t ncombs,
+                              uint16_t nalleles, uint8_t const *ploidy, bool const *missing,
+                              bool phased, uint8_t bits, uint8_t *out);
+
+size_t ZSTD_compressBound(size_t srcSize);
+size_t ZSTD_compress(void *dst, size_t dstCapacity, const void *src, size_t srcSize,
+                     int compressionLevel);
+size_t ZSTD_decompress(void *dst, size_t dstCapacity, const void *src, size_t compressedSize);
+unsigned ZSTD_isError(size_t code);
+const char *ZSTD_getErrorName(size_t code);